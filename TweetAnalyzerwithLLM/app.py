@@ -1,18 +1,32 @@
 import os
-from flask import Flask, request, render_template, redirect, url_for, flash, jsonify
+import threading
+import time
+from flask import Flask, Response, request, render_template, redirect, url_for, flash, jsonify, stream_with_context, g, abort
 import json
-import re
 from werkzeug.utils import secure_filename
-from google import genai
 from google.genai import types
+from clients import gemini_client, client_stats
+from upload_cache import get_upload_cache
+from prompt_prefix import get_prefix_cache
+from result_cache import get_result_cache
+from prefilter import get_prefilter, NOT_RELEVANT
+from output_parser import StreamingJSONParser, MalformedOutput, parse_output, validate_triage
 from sentiment_type import get_sentiment_class
-# Add this to the beginning of your generate function
-import nest_asyncio
-nest_asyncio.apply()
+import triage
+from triage import run_branches, BranchResult, CLASSIFY_TIMEOUT, SENTIMENT_TIMEOUT
+from batch import triage_stream, normalize_record, parse_location
+from knowledge_base import get_knowledge_base, format_analogues
+from media import get_media_catalog
+import metrics
+from metrics import span, observe_usage, RETRIES, REQUEST_SECONDS
 
 # Configuration
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'avi'}
+# Extra classifier calls when the model returns malformed JSON
+CLASSIFY_PARSE_RETRIES = int(os.environ.get('CLASSIFY_PARSE_RETRIES', 1))
+# Append every model result here (JSONL) to train the pre-filter from
+TRIAGE_LOG_PATH = os.environ.get('TRIAGE_LOG_PATH')
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -22,181 +36,312 @@ app.secret_key = 'your_secret_key_here'  # Required for flash messages
 # Create uploads directory if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+def _optional_stats(component):
+    # The pre-filter and knowledge base are None when disabled or not built
+    return component.stats() if component is not None else None
+
+# Cache and pool counters are read from their stats() only when /metrics is scraped
+metrics.register_stats('upload_cache', lambda: get_upload_cache().stats())
+metrics.register_stats('result_cache', lambda: get_result_cache().stats())
+metrics.register_stats('prompt_prefix', lambda: get_prefix_cache().stats())
+metrics.register_stats('prefilter', lambda: _optional_stats(get_prefilter()))
+metrics.register_stats('knowledge_base', lambda: _optional_stats(get_knowledge_base()))
+metrics.register_stats('media', lambda: get_media_catalog(UPLOAD_FOLDER).stats())
+metrics.register_stats('triage_pool', triage.stats)
+metrics.register_stats('clients', client_stats)
+
+if metrics.METRICS_ENABLED:
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        if 'request_start' in g:
+            # The route pattern, not the path, keeps the label set small
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint, str(response.status_code))
+        return response
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def generate(tweet_text, files=None):
-    if files is None:
-        files = []
-    
-    print(f"Processing tweet: {tweet_text}")
-    
-    
-    model_type = "gemini-2.0-flash"
-    import asyncio
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        # If there is no event loop in the current thread, create a new one
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    client = genai.Client(
-        api_key=os.environ.get("GEMINI_API_KEY"),
-    )
-    temp = [f'static/uploads/{f}' for f in files]
-    files = [
-        # Make the file available in local system working directory
-        client.files.upload(file=f) for f in temp
-    ]
-    # files = [
-    #     # Make the file available in local system working directory
-    #     client.files.upload(file="static/uploads/2.jpeg"),
-    # ]
-    print(f"Files: {files}")
-
-    # Note: We're not appending the cloud storage URL here since we're using local files
-    # If you need to include it: files.append("https://storage.cloud.google.com/genesis-ai-hack-datastore/1.mp4")
-    
-    model = "gemini-2.0-flash"
-    contents = [
-        types.Content(
-            role="user",
-            parts=[
-                types.Part.from_uri(
-                    file_uri=files[0].uri,
-                    mime_type=files[0].mime_type,
-                ),
-                types.Part.from_text(text="""Save us"""),
-            ],
-        ),
-        types.Content(
-            role="model",
-            parts=[
-                types.Part.from_text(text="""{\"Disaster_Category\": \"Fire\", \"Relevancy\": True, \"Priority\": 1, \"media_description\": \"The image shows a large wildfire burning intensely on a hillside. There are multiple points of active flames and heavy smoke, posing a significant threat.\", \"summary\": \"People need rescuing from a large and rapidly spreading fire on a hillside.\", \"responders_required\": [\"firefighters\", \"ambulance\", \"police\"]}"""),
-            ],
-        ),
-        types.Content(
-            role="user",
-            parts=[
-                types.Part.from_text(text="""INSERT_INPUT_HERE"""),
-            ],
-        ),
+_triage_log_lock = threading.Lock()
+
+def log_triage(tweet_text, files, result):
+    if not TRIAGE_LOG_PATH or 'error' in result:
+        return
+    line = json.dumps({'tweet': tweet_text, 'media': files, 'result': result})
+    with _triage_log_lock:
+        with open(TRIAGE_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+def prefiltered(tweet_text, files):
+    """Cheap Relevancy: False result if the local pre-filter rejects the tweet."""
+    prefilter = get_prefilter()
+    if prefilter is not None and prefilter.should_skip(tweet_text, files):
+        return dict(NOT_RELEVANT, responders_required=[])
+    return None
+
+def find_analogues(tweet_text, location=None):
+    """Past disasters resembling the tweet, and near ``location`` (lat, lon) if it is geotagged."""
+    kb = get_knowledge_base()
+    if kb is None:
+        return []
+    lat, lon = location or (None, None)
+    return kb.analogues(tweet_text, lat=lat, lon=lon)
+
+def classify_tweet(tweet_text, files, on_priority=None, analogues=None):
+    """Run the Gemini disaster classifier and return the validated result dict.
+
+    ``on_priority(tweet_text, priority)`` is called as soon as the Priority
+    field has been streamed, before the rest of the answer is generated.
+    ``analogues`` from the knowledge base are given to the model as context.
+    """
+    client = gemini_client()
+    # Downscaled stills and video keyframes instead of the raw uploads
+    with span('media_prepare'):
+        catalog = get_media_catalog(UPLOAD_FOLDER)
+        media = [catalog.model_media(f) for f in files]
+    upload_cache = get_upload_cache()
+    user_parts = []
+    with span('upload'):
+        for paths, note in media:
+            if note:
+                user_parts.append(types.Part.from_text(text=note))
+            for path in paths:
+                # Reuse the Files API upload when the same bytes were sent before
+                uploaded = upload_cache.get_or_upload(client, path)
+                print(f"File: {uploaded}")
+                user_parts.append(types.Part.from_uri(file_uri=uploaded.uri, mime_type=uploaded.mime_type))
+    user_parts.append(types.Part.from_text(text=tweet_text))
+
+    # The rubric and few-shot example come from the shared (cached) prompt prefix
+    prefix_cache = get_prefix_cache()
+    if analogues:
+        user_parts.append(types.Part.from_text(
+            text="Similar past disasters from the EM-DAT record, for context only:\n" + format_analogues(analogues)
+        ))
+    with span('prompt_build'):
+        model_type, contents, generate_content_config = prefix_cache.build_request(
+            user_parts,
+            temperature=1,
+            top_p=0.95,
+            top_k=40,
+            max_output_tokens=8192,
+            response_mime_type="application/json",
+        )
+
+    # Report Priority once, as soon as it is streamed, even across retries
+    priority_seen = []
+    def on_field(key, value):
+        if key == 'Priority' and not priority_seen and on_priority is not None:
+            priority_seen.append(value)
+            on_priority(tweet_text, value)
+
+    for attempt in range(CLASSIFY_PARSE_RETRIES + 1):
+        parser = StreamingJSONParser(on_field)
+        response = None
+        with span('classify'):
+            for response in client.models.generate_content_stream(
+              model=model_type,
+              contents=contents,
+              config=generate_content_config,
+            ):
+                if response.text:
+                    parser.feed(response.text)
+        prefix_cache.record_usage(response, generate_content_config)
+        observe_usage('gemini', response)
+
+        try:
+            # Only malformed output is retried; API errors propagate
+            with span('parse'):
+                return validate_triage(parser.result())
+        except MalformedOutput as e:
+            print(f"Malformed classifier output (attempt {attempt + 1}): {e}")
+            if attempt == CLASSIFY_PARSE_RETRIES:
+                raise
+            RETRIES.inc('classify_parse')
+
+def classify_tweets_grouped(tweet_texts):
+    """Classify several text-only tweets with one Gemini call.
+
+    Returns one result dict per tweet, in order. Raises if the model does not
+    return exactly one object per tweet so the caller can fall back.
+    """
+    client = gemini_client()
+    numbered = "\n".join(f"{i + 1}. {json.dumps(text)}" for i, text in enumerate(tweet_texts))
+    prefix_cache = get_prefix_cache()
+    user_parts = [
+        types.Part.from_text(text=f"""Classify each of the following {len(tweet_texts)} tweets independently. None of them include media. Return a JSON list with exactly one dictionary per tweet, in the same order, each in the exact output format.
+
+{numbered}"""),
     ]
-    generate_content_config = types.GenerateContentConfig(
+    model_type, contents, generate_content_config = prefix_cache.build_request(
+        user_parts,
         temperature=1,
         top_p=0.95,
         top_k=40,
         max_output_tokens=8192,
         response_mime_type="application/json",
-        system_instruction=[
-            types.Part.from_text(text="""You are a Twitter feed monitoring agent tasked with tracking tweets related to natural disasters such as wildfires, floods, or hurricanes. Each tweet you receive will include text and may also contain videos or images. If the tweet has a video or a photo, then you must populate the \"media_description\" field of the output with a brief description as to what is happening in the video in a way that is concerning to a first responder/authority. If the video/photo includes a firefighter/ ambulance/ police officer, mention it in your description. If the video has any audio that is relevant, make sure to include it in your description
-\"media_description\" can be \"NA\" if no media(photo or video is provided)
-You must also create a field called \"summary\" that briefly summarizes the tweet text and the \"media_description\". This summary is to be a one-line sentence that is relavant to the the first responders (fire fighters, police, ambulance etc)
-You must also create a field called \"responders_required\" which is a is list that has one or more of [\"firefighters\", \"police\", \"ambulance\"] in the order of importance of their role to the tweet. Only populate the field with responders that are required in the field
-Your job is to classify each tweet using three labels:
-
-1. **Disaster_Category**:  
-   This label indicates the type of disaster mentioned in the tweet. It can only be one of the following options: `['Fire', 'Flood', 'Hurricane']`.
-
-2. **Relevancy**:  
-   This label specifies whether the tweet describes an actual threat relevant for first responders or if it is just general information.  
-   - Use `True` if the tweet is relevant for first responders.  
-   - Use `False` if the tweet is not relevant.
-
-3. **Priority**:  
-   This label is a score that helps rank the urgency of the tweet.  
-   - If **Relevancy** is `False`, set **Priority** to `-1`.  
-   - If **Relevancy** is `True`, assign a score from `1` to `5` as follows:
-     For tweets deemed relevant (i.e., **Relevancy** is `True`), assign a **Priority** score from 1 to 5 based on the urgency of the situation described. Use the following criteria for scoring:
-
-- **Priority 1**:  
-  Use this score **only** if the tweet is a direct distress call explicitly asking for immediate help. This indicates a critical situation where someone is in immediate danger and requires first responders to perform rescue operations without delay. 
-IMPORTANT:  If the tweet includes the mention of the presence of a firefighter/ ambulance/ police officer already then this DO NOT award a score of 1
-  **Example:**  
-  - Tweet: \"URGENT: I'm trapped in my burning house! Please send immediate rescue!\"  
-  - Classification: `{\"Disaster_Category\": \"Fire\", \"Relevancy\": True, \"Priority\": 1}`
-
-- **Priority 2**:  
-  Use this score when the tweet describes a severe situation that is escalating quickly, but it is not a direct distress call. First responders should be alerted promptly even though it doesn't explicitly request immediate rescue.
-IMPORTANT:  If the tweet includes the mention of the presence of a firefighter/ ambulance/ police officer already then this DO NOT award a score of 2
-  **Example:**  
-  - Tweet: \"There's a massive wildfire near our neighborhood and it's spreading fast. We need help soon!\"  
-  - Classification: `{\"Disaster_Category\": \"Fire\", \"Relevancy\": True, \"Priority\": 2}`
-
-- **Priority 3**:  
-  Use this score when the tweet indicates a concerning situation that could require timely intervention. The circumstances warrant attention, but there is no explicit call for immediate rescue and the threat is less severe than Priority 1 or 2 scenarios.  
-  **Example:**  
-  - Tweet: \"Flood waters are rising in my area. It looks dangerous, please monitor the situation.\"  
-  - Classification: `{\"Disaster_Category\": \"Flood\", \"Relevancy\": True, \"Priority\": 3}`
-
-- **Priority 4**:  
-  Use this score when the tweet provides important situational information that is not time-critical. The content is relevant for awareness or follow-up, but it does not signal an urgent need for immediate action.  
-  **Example:**  
-  - Tweet: \"Reports indicate that a hurricane is approaching the coast. Stay safe and keep updated.\"  
-  - Classification: `{\"Disaster_Category\": \"Hurricane\", \"Relevancy\": True, \"Priority\": 4}`
-
-- **Priority 5**:  
-  Use this score for tweets that are relevant for monitoring purposes and provide general updates or information about the situation. Although the tweet is relevant, it reflects a low-risk scenario where immediate action is not required.  
-  **Example:**  
-  - Tweet: \"The wildfire seems to be under control now; just sharing an update from the local news.\"  
-  - Classification: `{\"Disaster_Category\": \"Fire\", \"Relevancy\": True, \"Priority\": 5}
-
-If **Relevancy** is `False`, then the **Priority** must be set to `-1`.
-Note: If the tweet text mentions the post image/video is from another time and is not happening right now, then the tweet is not relevant.
-If the tweet is not relevant, then the \"media_description\" field can be set to \"NA\".
-
-Your final output must be a dictionary in the exact following format (with only the dictionary as the output):
-
-```
-{\"Disaster_Category\": <Category from ['Fire','Flood','Hurricane']>, \"Relevancy\": <True or False>, \"Priority\": <-1 if not relevant else a value from 1-5>, \"media_description\":<A piece of text meant for authorities that summarizes the video or image. if there is no media then  leave thjs as NA>, \"summary\": < a one-line sentence that is relavant to the the first responders (fire fighters, police, ambulance etc)>,  \"responders_required\" : <list that has one or more of [\"firefighters\", \"police\", \"ambulance\"] in the order of importance of their role to the tweet>}
-```
-"""),
-        ],
     )
 
-    response = client.models.generate_content(
-      model=model_type,
-      contents=contents,
-      config=generate_content_config,
-    )
-    sentiment_type = get_sentiment_class(tweet_text)
+    with span('classify_grouped'):
+        response = client.models.generate_content(
+          model=model_type,
+          contents=contents,
+          config=generate_content_config,
+        )
+    prefix_cache.record_usage(response, generate_content_config)
+    observe_usage('gemini', response)
+
+    results = parse_output(response.text)
+    if not isinstance(results, list) or len(results) != len(tweet_texts):
+        raise MalformedOutput(f"Expected a list of {len(tweet_texts)} results")
+    return [validate_triage(r) for r in results]
+
+def _merge_result(classification, sentiment):
+    """Combine the classifier and sentiment branches into the result dict."""
+    sentiment_type = sentiment.value.strip() if sentiment.ok else "NA"
     print(f"Sentiment Type: {sentiment_type}")
-    
-    try:
-        output = response.text.strip()
-        output = output.replace('True', 'true')
-        output = output.replace('False', 'false')
-        print(output)
-        response_dict = json.loads(re.search(r'\{.*\}', output, re.DOTALL).group())
+
+    if classification.ok:
+        response_dict = classification.value
         response_dict['Sentiment_Type'] = sentiment_type
+        if not sentiment.ok:
+            # Partial result: keep the classification, report the failed branch
+            response_dict['error'] = sentiment.error
         return response_dict
-    except Exception as e:
-        print(f"Error processing response: {e}")
+    else:
+        print(f"Error processing response: {classification.error}")
         return {
-            "error": str(e),
+            "error": classification.error,
             "Disaster_Category": "NA", 
             "Relevancy": False, 
             "Priority": -1,
             "media_description": "NA",
             "summary": "Error processing tweet",
-            "Sentiment_Type" : "NA",
+            "Sentiment_Type" : sentiment_type,
             "responders_required": []
         }
 
+def dispatch_priority(tweet_text, priority):
+    """Default early-Priority hook: flag urgent tweets before the summary arrives."""
+    if priority in (1, 2):
+        print(f"URGENT (Priority {priority}): {tweet_text}")
+
+def report_priority(tweet_text, result, on_priority):
+    """Give results that were not streamed (cached, grouped) the same early-Priority hook."""
+    if on_priority is not None and result.get('Priority', -1) != -1:
+        on_priority(tweet_text, result['Priority'])
+
+def generate(tweet_text, files=None, on_priority=dispatch_priority, location=None):
+    if files is None:
+        files = []
+
+    print(f"Processing tweet: {tweet_text}")
+
+    with span('prefilter'):
+        skipped = prefiltered(tweet_text, files)
+    if skipped is not None:
+        return skipped
+
+    # Retweets and copy-pasted tweets reuse an earlier result
+    result_cache = get_result_cache()
+    media_paths = [f'static/uploads/{f}' for f in files]
+    with span('result_cache'):
+        cached = result_cache.lookup(tweet_text, media_paths)
+    if cached is not None:
+        print(f"Result cache hit: {cached['cache']}")
+        # Only the model output is cached: the analogues depend on where this tweet is from
+        with span('analogues'):
+            cached['historical_analogues'] = find_analogues(tweet_text, location)
+        # A repeated Priority 1 is a new incident, it must reach dispatch like the first one
+        report_priority(tweet_text, cached, on_priority)
+        return cached
+
+    with span('analogues'):
+        analogues = find_analogues(tweet_text, location)
+
+    # The classifier and the sentiment model are independent, run them together
+    with span('triage'):
+        branches = run_branches({
+            'classification': (classify_tweet, (tweet_text, files, on_priority, analogues), CLASSIFY_TIMEOUT),
+            'sentiment': (get_sentiment_class, (tweet_text,), SENTIMENT_TIMEOUT),
+        })
+    result = _merge_result(branches['classification'], branches['sentiment'])
+    result_cache.store(tweet_text, media_paths, result)
+    result['historical_analogues'] = analogues
+    log_triage(tweet_text, files, result)
+    return result
+
+def generate_group(tweet_texts, on_priority=dispatch_priority, on_fallback=None):
+    """``generate`` for a list of text-only tweets, sharing one classifier call.
+
+    If the grouped call fails each tweet is classified alone;
+    ``on_fallback(n)`` is called first with the number of extra calls.
+    """
+    print(f"Processing {len(tweet_texts)} tweets")
+
+    result_cache = get_result_cache()
+    results = []
+    for text in tweet_texts:
+        result = prefiltered(text, [])
+        if result is None:
+            result = result_cache.lookup(text)
+            if result is not None:
+                result['historical_analogues'] = find_analogues(text)
+                report_priority(text, result, on_priority)
+        results.append(result)
+    misses = [i for i, result in enumerate(results) if result is None]
+    if not misses:
+        return results
+    if len(misses) == 1:
+        i = misses[0]
+        results[i] = generate(tweet_texts[i], on_priority=on_priority)
+        return results
+    texts = [tweet_texts[i] for i in misses]
+
+    jobs = {'classification': (classify_tweets_grouped, (texts,), CLASSIFY_TIMEOUT)}
+    for i, text in enumerate(texts):
+        jobs[f'sentiment_{i}'] = (get_sentiment_class, (text,), SENTIMENT_TIMEOUT)
+    branches = run_branches(jobs)
+
+    grouped = branches['classification']
+    if grouped.ok:
+        classifications = [BranchResult(value=r) for r in grouped.value]
+    else:
+        # The grouped answer was unusable, classify the tweets one by one
+        print(f"Grouped classification failed, falling back: {grouped.error}")
+        RETRIES.inc('classify_grouped', amount=len(texts))
+        if on_fallback is not None:
+            on_fallback(len(texts))
+        retries = run_branches({
+            i: (classify_tweet, (text, [], on_priority), CLASSIFY_TIMEOUT) for i, text in enumerate(texts)
+        })
+        classifications = [retries[i] for i in range(len(texts))]
+
+    for i, text in enumerate(texts):
+        result = _merge_result(classifications[i], branches[f'sentiment_{i}'])
+        if grouped.ok:
+            # The fallback streamed its Priority already
+            report_priority(text, result, on_priority)
+        result_cache.store(text, [], result)
+        result['historical_analogues'] = find_analogues(text)
+        log_triage(text, [], result)
+        results[misses[i]] = result
+    return results
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if not metrics.METRICS_ENABLED:
+        abort(404)
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/')
 def index():
-    # Get list of uploaded files
-    uploaded_files = []
-    for filename in os.listdir(app.config['UPLOAD_FOLDER']):
-        if allowed_file(filename):
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file_type = 'video' if filename.rsplit('.', 1)[1].lower() in ['mp4', 'mov', 'avi'] else 'image'
-            uploaded_files.append({
-                'name': filename,
-                'path': file_path.replace('\\', '/'),
-                'type': file_type
-            })
-    
+    # Uploaded files come from the catalog, not a directory listing per request
+    uploaded_files = get_media_catalog(UPLOAD_FOLDER).listing()
     return render_template('index.html', uploaded_files=uploaded_files)
 
 @app.route('/upload', methods=['POST'])
@@ -214,6 +359,8 @@ def upload_file():
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
         file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        # Derivatives are built in the background; generate() waits for them if needed
+        get_media_catalog(UPLOAD_FOLDER).add(filename)
         flash(f'File {filename} uploaded successfully')
     else:
         flash('Invalid file type')
@@ -227,11 +374,48 @@ def process_tweet():
     
     files = []
     if selected_file:
+        selected_file = secure_filename(selected_file)
+        if not os.path.isfile(os.path.join(UPLOAD_FOLDER, selected_file)):
+            abort(404, description=f"No uploaded file named {selected_file}")
         files.append(selected_file)
+    # Optional coordinates of a geotagged tweet, for nearby historical analogues
+    location = parse_location(request.form.get('lat'), request.form.get('lon'))
     
-    result = generate(tweet_text, files)
+    result = generate(tweet_text, files, location=location)
     
     return render_template('result.html', result=result, tweet_text=tweet_text, selected_file=selected_file)
 
+@app.route('/triage/batch', methods=['POST'])
+def triage_batch():
+    """Triage a JSON list of tweets and stream the results back as NDJSON.
+
+    Body: {"tweets": [{"text": "...", "media": ["flood.webp"], "lat": 29.8, "lon": -95.4}, ...], "offset": 0}
+    """
+    payload = request.get_json(silent=True) or {}
+    tweets = payload.get('tweets')
+    if not isinstance(tweets, list):
+        return jsonify({"error": "Expected a JSON body with a 'tweets' list"}), 400
+
+    offset = payload.get('offset', 0)
+    if isinstance(offset, str) and offset.isdigit():
+        offset = int(offset)
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        return jsonify({"error": "'offset' must be a non-negative integer"}), 400
+
+    records = []
+    for tweet in tweets:
+        record = normalize_record(tweet if isinstance(tweet, dict) else {'text': str(tweet)})
+        record['media'] = [secure_filename(m) for m in record['media'] if allowed_file(m)]
+        records.append(record)
+    missing = sorted({m for r in records for m in r['media'] if not os.path.isfile(os.path.join(UPLOAD_FOLDER, m))})
+    if missing:
+        return jsonify({"error": "Unknown media files", "missing": missing}), 404
+
+    lines = triage_stream(records, generate, generate_group, offset=offset)
+    return Response(
+        stream_with_context(json.dumps(line) + '\n' for line in lines),
+        mimetype='application/x-ndjson',
+    )
+
 if __name__ == '__main__':
     app.run(debug=True)
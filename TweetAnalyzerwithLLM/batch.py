@@ -0,0 +1,232 @@
+"""Bulk triage for tweet firehoses and backfills.
+
+Tweets are read lazily, grouped into as few model calls as the prompt allows
+(consecutive text-only tweets share one classifier call, tweets with media go
+alone), run on a bounded worker pool and streamed back as NDJSON in input
+order. A token bucket caps model calls per second, and because at most
+``2 * workers`` jobs are in flight the reader stalls instead of queueing the
+whole input when the rate limit is the bottleneck.
+
+Usage:
+    python batch.py tweets.jsonl > results.ndjson
+    python batch.py tweets.csv --workers 16 --rate 20 --resume results.ndjson
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuration
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 8))
+BATCH_GROUP_SIZE = int(os.environ.get('BATCH_GROUP_SIZE', 10))
+# Model calls per second across the whole batch (classifier + sentiment)
+BATCH_RATE_LIMIT = float(os.environ.get('BATCH_RATE_LIMIT', 10))
+
+
+class TokenBucket:
+    """Blocking token bucket shared by all batch workers."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        # A cost above the burst size waits for a full bucket and leaves it in debt,
+        # so large jobs are still charged in full and the average rate holds
+        needed = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= needed:
+                    self.tokens -= tokens
+                    return
+                wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def parse_location(lat, lon):
+    """``(lat, lon)`` as floats, or ``None`` when missing or out of range."""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def normalize_record(record):
+    """Accept ``text``/``tweet_text``, ``media`` as a list or ``;``-separated string, and optional ``lat``/``lon``."""
+    text = record.get('text') or record.get('tweet_text') or ''
+    media = record.get('media') or record.get('selected_file') or []
+    if isinstance(media, str):
+        media = [m.strip() for m in media.split(';') if m.strip()]
+    return {'text': text, 'media': list(media), 'location': parse_location(record.get('lat'), record.get('lon'))}
+
+
+def read_tweets(path):
+    """Yield normalized tweet records from a JSONL or CSV file."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            for row in csv.DictReader(f):
+                yield normalize_record(row)
+        else:
+            for line in f:
+                if line.strip():
+                    yield normalize_record(json.loads(line))
+
+
+def iter_jobs(indexed_records, group_size=BATCH_GROUP_SIZE):
+    """Group consecutive text-only tweets; a tweet with media or a location is its own job."""
+    group = []
+    for index, record in indexed_records:
+        if record['media'] or record.get('location'):
+            if group:
+                yield group
+                group = []
+            yield [(index, record)]
+        else:
+            group.append((index, record))
+            if len(group) >= group_size:
+                yield group
+                group = []
+    if group:
+        yield group
+
+
+# Every row of the output has these fields; a failed job fills them with nulls
+RESULT_FIELDS = ('Disaster_Category', 'Relevancy', 'Priority', 'media_description', 'summary',
+                 'Sentiment_Type', 'responders_required')
+
+
+def error_result(error):
+    """A result row for a tweet whose job raised: the full schema, all null, plus ``error``."""
+    return dict(dict.fromkeys(RESULT_FIELDS), error=error)
+
+
+def _model_calls(job):
+    # One classifier call for the job plus one sentiment call per tweet
+    return 1 + len(job)
+
+
+def triage_stream(records, triage_one, triage_group, workers=BATCH_WORKERS, offset=0,
+                  group_size=BATCH_GROUP_SIZE, rate_limit=BATCH_RATE_LIMIT, stats=None):
+    """Triage ``records`` and yield ``{"index", "tweet", "result"}`` dicts in input order.
+
+    ``triage_one(text, media)`` handles a single tweet (given ``location=``
+    when the record has one) and
+    ``triage_group(texts, on_fallback)`` a list of text-only tweets; it calls
+    ``on_fallback(n)`` before making ``n`` extra classifier calls because the
+    grouped one failed, so they are rate limited and counted too. Records
+    before ``offset`` are skipped so an interrupted run can be resumed.
+    ``stats``, if given, is a dict that receives the model calls charged to
+    the rate limit (``model_calls``, an upper bound: cache hits and pre-filter
+    skips make fewer) and ``fallback_calls``.
+    """
+    bucket = TokenBucket(rate_limit) if rate_limit else None
+    if stats is None:
+        stats = {}
+    stats.update(model_calls=0, fallback_calls=0)
+    stats_lock = threading.Lock()
+
+    def charge(calls, fallback=False):
+        with stats_lock:
+            stats['model_calls'] += calls
+            if fallback:
+                stats['fallback_calls'] += calls
+        if bucket is not None:
+            bucket.acquire(calls)
+
+    def run(job):
+        charge(_model_calls(job))
+        if len(job) == 1:
+            _, record = job[0]
+            if record.get('location'):
+                return [triage_one(record['text'], record['media'], location=record['location'])]
+            return [triage_one(record['text'], record['media'])]
+        return triage_group([record['text'] for _, record in job],
+                            on_fallback=lambda calls: charge(calls, fallback=True))
+
+    def drain(pending):
+        job, future = pending.popleft()
+        try:
+            results = future.result()
+        except Exception as e:
+            results = [error_result(str(e)) for _ in job]
+        for (index, record), result in zip(job, results):
+            yield {'index': index, 'tweet': record['text'], 'result': result}
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch')
+    pending = deque()
+    try:
+        indexed = itertools.islice(enumerate(records), offset, None)
+        for job in iter_jobs(indexed, group_size):
+            pending.append((job, executor.submit(run, job)))
+            # Bounded window: stop reading input until the oldest job is done
+            while len(pending) >= 2 * workers:
+                yield from drain(pending)
+        while pending:
+            yield from drain(pending)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def count_lines(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding='utf-8') as f:
+        return sum(1 for _ in f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Triage a JSONL/CSV file of tweets and stream NDJSON results.")
+    parser.add_argument('input', help="JSONL or CSV with a text column and optional media (file names in static/uploads)")
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS)
+    parser.add_argument('--group-size', type=int, default=BATCH_GROUP_SIZE)
+    parser.add_argument('--rate', type=float, default=BATCH_RATE_LIMIT, help="max model calls per second")
+    parser.add_argument('--offset', type=int, default=0, help="skip the first N tweets")
+    parser.add_argument('--resume', metavar='OUTPUT', help="append to OUTPUT, skipping tweets already in it")
+    args = parser.parse_args(argv)
+    if args.resume and args.offset:
+        parser.error("--offset cannot be combined with --resume, which takes the offset from OUTPUT")
+    if args.offset < 0:
+        parser.error("--offset must not be negative")
+
+    # Imported here so app.py can import this module for the /triage/batch route
+    from app import generate, generate_group
+
+    offset = args.offset
+    out = sys.stdout
+    # generate() prints progress, keep it off the NDJSON stream
+    sys.stdout = sys.stderr
+    if args.resume:
+        offset = count_lines(args.resume)
+        out = open(args.resume, 'a', encoding='utf-8')
+
+    stats = {}
+    try:
+        for line in triage_stream(read_tweets(args.input), generate, generate_group,
+                                  workers=args.workers, offset=offset,
+                                  group_size=args.group_size, rate_limit=args.rate, stats=stats):
+            out.write(json.dumps(line) + '\n')
+            out.flush()
+    finally:
+        if args.resume:
+            out.close()
+        print(f"Model calls charged: {stats.get('model_calls', 0)} "
+              f"({stats.get('fallback_calls', 0)} per-tweet fallbacks after a failed grouped call)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Process-wide Gemini / Vertex clients.
+
+Building a ``genai.Client`` sets up a fresh httpx connection pool (TLS handshake
+included) and, for Vertex, loads service account credentials. Doing that per
+tweet was a large share of request latency, so every module asks this registry
+for a client instead. Clients are created lazily, once per endpoint, and are
+safe to share between Flask worker threads.
+"""
+import os
+import threading
+
+import httpx
+from google import genai
+from google.genai import types
+
+from metrics import span
+
+# Configuration
+GENAI_POOL_SIZE = int(os.environ.get('GENAI_POOL_SIZE', 20))
+GENAI_KEEPALIVE_EXPIRY = float(os.environ.get('GENAI_KEEPALIVE_EXPIRY', 60))
+GEMINI_TIMEOUT_MS = int(os.environ.get('GEMINI_TIMEOUT_MS', 60000))
+SENTIMENT_TIMEOUT_MS = int(os.environ.get('SENTIMENT_TIMEOUT_MS', 30000))
+# Set GENAI_FAKE_BACKEND=1 to run every client against fake_backend offline
+GENAI_FAKE_BACKEND = os.environ.get('GENAI_FAKE_BACKEND') == '1'
+# Send every client to this endpoint instead, e.g. `python fake_backend.py` on its own port
+GENAI_BASE_URL = os.environ.get('GENAI_BASE_URL')
+
+SENTIMENT_PROJECT = "659678787868"
+SENTIMENT_LOCATION = "us-central1"
+SENTIMENT_CREDENTIALS = os.environ.get('SENTIMENT_CREDENTIALS', "gemini-genai-454500-216b12cc8cc0.json")
+
+_clients = {}
+_lock = threading.Lock()
+_stats = {'clients_created': 0}
+_fake_transport = None
+
+
+def _pool_args():
+    limits = httpx.Limits(
+        max_connections=GENAI_POOL_SIZE,
+        max_keepalive_connections=GENAI_POOL_SIZE,
+        keepalive_expiry=GENAI_KEEPALIVE_EXPIRY,
+    )
+    args = {'limits': limits}
+    if GENAI_FAKE_BACKEND and not GENAI_BASE_URL:
+        args['transport'] = fake_transport()
+    return args
+
+
+def _http_options(timeout_ms, **kwargs):
+    if GENAI_BASE_URL:
+        kwargs['base_url'] = GENAI_BASE_URL
+    return types.HttpOptions(
+        timeout=timeout_ms,
+        client_args=_pool_args(),
+        async_client_args={'limits': _pool_args()['limits']},
+        **kwargs,
+    )
+
+
+def _sentiment_credentials():
+    if GENAI_FAKE_BACKEND:
+        from google.oauth2.credentials import Credentials
+        return Credentials(token='fake-token')
+    if os.path.exists(SENTIMENT_CREDENTIALS):
+        from google.oauth2 import service_account
+        return service_account.Credentials.from_service_account_file(
+            SENTIMENT_CREDENTIALS,
+            scopes=["https://www.googleapis.com/auth/cloud-platform"],
+        )
+    # Fall back to application default credentials
+    return None
+
+
+def _build_gemini():
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if GENAI_FAKE_BACKEND:
+        api_key = api_key or 'fake-key'
+    return genai.Client(
+        api_key=api_key,
+        http_options=_http_options(GEMINI_TIMEOUT_MS),
+    )
+
+
+def _build_sentiment():
+    return genai.Client(
+        vertexai=True,
+        project=SENTIMENT_PROJECT,
+        location=SENTIMENT_LOCATION,
+        credentials=_sentiment_credentials(),
+        http_options=_http_options(SENTIMENT_TIMEOUT_MS),
+    )
+
+
+_ENDPOINTS = {
+    'gemini': _build_gemini,
+    'sentiment': _build_sentiment,
+}
+
+
+def get_client(name):
+    """Return the shared client for ``name``, creating it on first use."""
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                with span('client_build'):
+                    client = _ENDPOINTS[name]()
+                _clients[name] = client
+                _stats['clients_created'] += 1
+    return client
+
+
+def gemini_client():
+    return get_client('gemini')
+
+
+def sentiment_client():
+    return get_client('sentiment')
+
+
+def fake_transport():
+    """The transport shared by all clients in fake mode."""
+    global _fake_transport
+    if _fake_transport is None:
+        from fake_backend import FakeGenAITransport
+        _fake_transport = FakeGenAITransport()
+    return _fake_transport
+
+
+def client_stats():
+    """Client reuse counters, e.g. for comparing against requests served."""
+    stats = dict(_stats)
+    stats['clients'] = sorted(_clients)
+    if _fake_transport is not None:
+        stats['requests_served'] = _fake_transport.requests
+    return stats
+
+
+def reset_clients():
+    """Drop all shared clients; they are rebuilt on next use."""
+    with _lock:
+        _clients.clear()
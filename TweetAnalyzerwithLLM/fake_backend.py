@@ -0,0 +1,256 @@
+"""Offline stand-in for the Gemini / Vertex REST endpoints.
+
+The real ``genai.Client`` is still used in fake mode; only its httpx transport
+is swapped for ``FakeGenAITransport`` so the client registry, connection pool
+and request path are exercised exactly as in production, without network.
+
+Latency, streaming and failures are configurable, so load tests see something
+closer to the real service than instant answers:
+
+- ``FAKE_LATENCY`` / ``FAKE_SENTIMENT_LATENCY`` / ``FAKE_UPLOAD_LATENCY`` –
+  delay before the classifier, sentiment and upload responses, as a spec in
+  milliseconds: ``fixed:200``, ``uniform:100:400``, ``lognormal:300:0.5``
+  (median, sigma) or ``exp:200`` (mean); default no delay;
+- ``FAKE_CHUNK_SIZE`` and ``FAKE_CHUNK_DELAY`` – characters per streamed
+  chunk and the delay between chunks (same spec);
+- ``FAKE_ERROR_RATE`` and ``FAKE_ERROR_STATUS`` – fraction of model calls
+  answered with an error status (default 503);
+- ``FAKE_SEED`` – seed for the latency and error draws.
+
+The same transport can also be served over HTTP, for a server process pointed
+at it with ``GENAI_BASE_URL``:
+
+    python fake_backend.py --port 8090
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+# common/ at the repository root is shared with the call bot
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+from common.latency import LatencyModel
+
+# Configuration
+FAKE_LATENCY = os.environ.get('FAKE_LATENCY', 'fixed:0')
+FAKE_SENTIMENT_LATENCY = os.environ.get('FAKE_SENTIMENT_LATENCY', 'fixed:0')
+FAKE_UPLOAD_LATENCY = os.environ.get('FAKE_UPLOAD_LATENCY', 'fixed:0')
+FAKE_CHUNK_SIZE = int(os.environ.get('FAKE_CHUNK_SIZE', 16))
+FAKE_CHUNK_DELAY = os.environ.get('FAKE_CHUNK_DELAY', 'fixed:0')
+FAKE_ERROR_RATE = float(os.environ.get('FAKE_ERROR_RATE', 0))
+FAKE_ERROR_STATUS = int(os.environ.get('FAKE_ERROR_STATUS', 503))
+FAKE_SEED = os.environ.get('FAKE_SEED')
+
+ERROR_STATUS_NAMES = {429: 'RESOURCE_EXHAUSTED', 500: 'INTERNAL', 503: 'UNAVAILABLE', 504: 'DEADLINE_EXCEEDED'}
+
+FAKE_CLASSIFICATION = {
+    "Disaster_Category": "Fire",
+    "Relevancy": True,
+    "Priority": 2,
+    "media_description": "NA",
+    "summary": "Fake classification for offline testing.",
+    "responders_required": ["firefighters"],
+}
+FAKE_SENTIMENT = "Incident Report"
+# Matches the prompt app.classify_tweets_grouped sends for text-only batches
+GROUPED_PROMPT = re.compile(r'Classify each of the following (\d+) tweets')
+
+
+class FakeGenAITransport(httpx.BaseTransport):
+    """Answers generateContent, streamGenerateContent, cachedContents and Files API uploads."""
+
+    def __init__(self, latency=FAKE_LATENCY, sentiment_latency=FAKE_SENTIMENT_LATENCY,
+                 upload_latency=FAKE_UPLOAD_LATENCY, chunk_size=FAKE_CHUNK_SIZE, chunk_delay=FAKE_CHUNK_DELAY,
+                 error_rate=FAKE_ERROR_RATE, error_status=FAKE_ERROR_STATUS, seed=FAKE_SEED):
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self.latency = LatencyModel(latency, self._rng)
+        self.sentiment_latency = LatencyModel(sentiment_latency, self._rng)
+        self.upload_latency = LatencyModel(upload_latency, self._rng)
+        self.chunk_delay = LatencyModel(chunk_delay, self._rng)
+        self.chunk_size = chunk_size
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._ids = itertools.count(1)
+        self._uploads = {}
+        # cached content name -> token count of the cached prefix
+        self._cached = {}
+
+    def handle_request(self, request):
+        with self._lock:
+            self.requests += 1
+        body = request.read()
+        path = request.url.path
+
+        if path.startswith('/upload/'):
+            self.upload_latency.sleep()
+            return self._handle_upload(request, body)
+        if '/cachedContents' in path:
+            return self._handle_cache(request, body)
+        if path.endswith((':generateContent', ':streamGenerateContent')):
+            (self.sentiment_latency if '/endpoints/' in path else self.latency).sleep()
+            if self.error_rate and self._rng.random() < self.error_rate:
+                with self._lock:
+                    self.errors += 1
+                return httpx.Response(self.error_status, json={"error": {
+                    "code": self.error_status, "message": "Injected fake backend error",
+                    "status": ERROR_STATUS_NAMES.get(self.error_status, 'UNKNOWN')}})
+        if path.endswith(':streamGenerateContent'):
+            return self._stream_response(self._reply_text(path, body), self._usage(body))
+        if path.endswith(':generateContent'):
+            response = self._response_json(self._reply_text(path, body))
+            response.update(self._usage(body))
+            return httpx.Response(200, json=response)
+        return httpx.Response(404, json={"error": {"code": 404, "message": f"Unknown fake route {path}", "status": "NOT_FOUND"}})
+
+    def _reply_text(self, path, body):
+        # Tuned Vertex endpoints are the sentiment classifier, everything else
+        # is the multimodal disaster classifier.
+        if '/endpoints/' in path:
+            return FAKE_SENTIMENT
+        grouped = GROUPED_PROMPT.search(body.decode('utf-8', 'replace'))
+        if grouped:
+            return json.dumps([FAKE_CLASSIFICATION] * int(grouped.group(1)))
+        return json.dumps(FAKE_CLASSIFICATION)
+
+    def _usage(self, body):
+        cached = json.loads(body or b'{}').get('cachedContent')
+        if cached in self._cached:
+            return {"usageMetadata": {"cachedContentTokenCount": self._cached[cached]}}
+        return {}
+
+    def _response_json(self, text):
+        return {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": text}]},
+                "finishReason": "STOP",
+            }],
+        }
+
+    def _stream_response(self, text, usage=None):
+        size = self.chunk_size
+        chunks = [self._response_json(text[i:i + size]) for i in range(0, len(text), size)] or [self._response_json("")]
+        # Usage metadata arrives with the final chunk, as from the real API
+        chunks[-1].update(usage or {})
+
+        def events():
+            for i, c in enumerate(chunks):
+                if i:
+                    self.chunk_delay.sleep()
+                yield f"data: {json.dumps(c)}\r\n\r\n".encode()
+
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=events())
+
+    def _handle_cache(self, request, body):
+        if request.method == 'POST':
+            name = f"cachedContents/fake-{next(self._ids)}"
+            with self._lock:
+                # Roughly four bytes of request JSON per token
+                self._cached[name] = len(body) // 4
+        else:
+            name = request.url.path.split('/v1beta/', 1)[-1]
+            if name not in self._cached:
+                return httpx.Response(404, json={"error": {"code": 404, "message": f"{name} not found", "status": "NOT_FOUND"}})
+        return httpx.Response(200, json={
+            "name": name,
+            "model": "models/gemini-2.0-flash",
+            "usageMetadata": {"totalTokenCount": self._cached[name]},
+        })
+
+    def _handle_upload(self, request, body):
+        command = request.headers.get('x-goog-upload-command', '')
+        if 'start' in command:
+            upload_id = next(self._ids)
+            meta = json.loads(body or b'{}').get('file', {})
+            with self._lock:
+                self._uploads[upload_id] = meta.get('mimeType', 'application/octet-stream')
+            host = request.url.netloc.decode('ascii')
+            url = f"{request.url.scheme}://{host}/upload/v1beta/files?upload_id={upload_id}"
+            return httpx.Response(200, headers={"x-goog-upload-url": url}, json={})
+
+        upload_id = int(request.url.params.get('upload_id', 0))
+        if 'finalize' not in command:
+            return httpx.Response(200, headers={"x-goog-upload-status": "active"}, json={})
+        with self._lock:
+            mime_type = self._uploads.pop(upload_id, 'application/octet-stream')
+        name = f"files/fake-{upload_id}"
+        return httpx.Response(200, headers={"x-goog-upload-status": "final"}, json={
+            "file": {
+                "name": name,
+                "uri": f"https://generativelanguage.googleapis.com/v1beta/{name}",
+                "mimeType": mime_type,
+                "state": "ACTIVE",
+            },
+        })
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    """Forwards HTTP requests to the server's transport, streaming chunked responses."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _forward(self):
+        length = int(self.headers.get('content-length') or 0)
+        request = httpx.Request(self.command, f"http://{self.headers.get('host')}{self.path}",
+                                headers=dict(self.headers), content=self.rfile.read(length))
+        response = self.server.transport.handle_request(request)
+        self.send_response(response.status_code)
+        for key, value in response.headers.items():
+            if key.lower() not in ('content-length', 'transfer-encoding'):
+                self.send_header(key, value)
+        if response.headers.get('content-type') == 'text/event-stream':
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in response.stream:
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        content = response.read()
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PATCH = do_DELETE = _forward
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=8090, host='127.0.0.1', transport=None):
+    """Serve ``transport`` (a new one by default) over HTTP until interrupted."""
+    server = ThreadingHTTPServer((host, port), _FakeHandler)
+    server.daemon_threads = True
+    server.transport = transport or FakeGenAITransport()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the fake Gemini / Vertex backend over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    args = parser.parse_args(argv)
+    server = serve(args.port, args.host)
+    print(f"Fake backend on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
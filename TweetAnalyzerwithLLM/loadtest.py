@@ -0,0 +1,255 @@
+"""Load test for ``/process_tweet`` against the fake model backend.
+
+``run`` starts the app in its own process with ``GENAI_FAKE_BACKEND=1`` and
+the chosen fake latency, streaming and error settings (or targets ``--url``),
+then sends ``--requests`` tweets at each concurrency level from a closed loop
+of worker threads. It prints one JSON line per level with throughput and
+p50/p95/p99 latency; ``--out`` also saves the whole run with the commit and
+settings, and ``compare`` diffs two saved runs, exiting 1 on a regression:
+
+    python loadtest.py run --concurrency 1,4,16,64 --fake-latency lognormal:400:0.5 --out base.json
+    python loadtest.py run --concurrency 1,4,16,64 --fake-latency lognormal:400:0.5 --out new.json
+    python loadtest.py compare base.json new.json --tolerance 0.1
+
+The spawned app has the result cache expired immediately and the pre-filter
+off, so every request reaches the (fake) models; pass ``--result-cache`` to
+measure with the cache instead. ``backend/call_bot/loadtest.py`` writes the
+same format, so ``compare`` works on its runs too.
+"""
+import argparse
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+# Failed classifications still render the result page
+ERROR_MARKER = b'Error processing tweet'
+PLACES = ['Houston', 'Dhaka', 'Lisbon', 'Manila', 'Nairobi', 'Osaka', 'Quito', 'Perth', 'Accra', 'Lima']
+EVENTS = [
+    'Flooding on {street}, water up to the windows in {place}',
+    'House fire on {street} in {place}, smoke everywhere and people on the roof',
+    'Strong earthquake just now in {place}, walls cracked on {street}',
+    'Landslide blocked {street} outside {place}, two cars buried',
+    'Wildfire spreading toward {street} near {place}, we need evacuation',
+]
+# A rise in the first group or a drop in the second beyond the tolerance is a regression
+HIGHER_IS_WORSE = ('p50_ms', 'p95_ms', 'p99_ms', 'error_rate')
+LOWER_IS_WORSE = ('throughput_rps',)
+
+
+def tweets(n, media):
+    """``n`` distinct (text, file) pairs, cycling through ``media``."""
+    for i in range(n):
+        place = PLACES[i % len(PLACES)]
+        text = EVENTS[(i // len(PLACES)) % len(EVENTS)].format(place=place, street=f"{i % 97 + 1}th Street")
+        yield f"{text} #{i}", media[i % len(media)]
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'mean_ms': None, 'max_ms': None}
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'p50_ms': round(p50, 2), 'p95_ms': round(p95, 2), 'p99_ms': round(p99, 2),
+            'mean_ms': round(float(ms.mean()), 2), 'max_ms': round(float(ms.max()), 2)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_app(args, workdir):
+    """Run the app under ``flask run`` in a child process; returns (process, base URL)."""
+    port = free_port()
+    env = dict(os.environ,
+               GENAI_FAKE_BACKEND='1',
+               PREFILTER_ENABLED='0',
+               FAKE_LATENCY=args.fake_latency,
+               FAKE_SENTIMENT_LATENCY=args.fake_sentiment_latency,
+               FAKE_UPLOAD_LATENCY=args.fake_upload_latency,
+               FAKE_CHUNK_SIZE=str(args.fake_chunk_size),
+               FAKE_CHUNK_DELAY=args.fake_chunk_delay,
+               FAKE_ERROR_RATE=str(args.fake_error_rate),
+               UPLOAD_CACHE_PATH=os.path.join(workdir, 'upload_cache.sqlite3'),
+               MEDIA_DERIVATIVE_DIR=os.path.join(workdir, 'media'))
+    env.pop('TRIAGE_LOG_PATH', None)
+    if not args.result_cache:
+        env['RESULT_CACHE_TTL'] = '0'
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port), '--with-threads'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited with status {process.returncode}")
+        try:
+            if httpx.get(url + '/', timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("App did not start within 30 s")
+
+
+def run_level(client, url, concurrency, work):
+    """Send every item of ``work`` from ``concurrency`` threads; returns the level's result dict."""
+    work = iter(work)
+    lock = threading.Lock()
+    latencies, errors = [], []
+
+    def worker():
+        while True:
+            with lock:
+                item = next(work, None)
+            if item is None:
+                return
+            text, media = item
+            start = time.perf_counter()
+            try:
+                response = client.post(url + '/process_tweet', data={'tweet_text': text, 'selected_file': media})
+                ok = response.status_code == 200 and ERROR_MARKER not in response.content
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - start
+    total = len(latencies) + len(errors)
+    return {
+        'endpoint': '/process_tweet',
+        'concurrency': concurrency,
+        'requests': total,
+        'errors': len(errors),
+        'error_rate': round(len(errors) / total, 4) if total else 0.0,
+        'seconds': round(wall, 3),
+        'throughput_rps': round(len(latencies) / wall, 2),
+        **percentiles(latencies),
+    }
+
+
+def run(args):
+    levels = [int(c) for c in args.concurrency.split(',')]
+    media = args.media.split(',')
+    settings = {k: v for k, v in vars(args).items() if k not in ('command', 'out')}
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        process, url = (None, args.url) if args.url else start_app(args, workdir)
+        try:
+            limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+            with httpx.Client(limits=limits, timeout=args.timeout) as client:
+                # Offsets keep tweets distinct across levels and warm-up requests
+                counter = itertools.count()
+                for concurrency in levels:
+                    offset = next(counter) * (args.requests + args.warmup)
+                    batch = list(tweets(offset + args.warmup + args.requests, media))[offset:]
+                    if args.warmup:
+                        run_level(client, url, concurrency, batch[:args.warmup])
+                    result = run_level(client, url, concurrency, batch[args.warmup:])
+                    print(json.dumps(result), flush=True)
+                    results.append(result)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({
+                'commit': git_commit(),
+                'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'settings': settings,
+                'results': results,
+            }, f, indent=2)
+
+
+def compare(args):
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+    base_results = {(r['endpoint'], r['concurrency']): r for r in base['results']}
+    regressions = 0
+    for result in new['results']:
+        key = (result['endpoint'], result['concurrency'])
+        before = base_results.get(key)
+        if before is None:
+            continue
+        changes = {}
+        for metric in HIGHER_IS_WORSE + LOWER_IS_WORSE:
+            old, value = before.get(metric), result.get(metric)
+            if old is None or value is None:
+                continue
+            if old:
+                change = round((value - old) / old, 4)
+                worse = change > args.tolerance if metric in HIGHER_IS_WORSE else change < -args.tolerance
+            else:
+                # No relative change from zero; an error rate may rise by the tolerance itself
+                change = None
+                worse = metric in HIGHER_IS_WORSE and value > args.tolerance
+            changes[metric] = {'base': old, 'new': value, 'change': change, 'regression': worse}
+            regressions += worse
+        print(json.dumps({'endpoint': key[0], 'concurrency': key[1], **changes}))
+    print(json.dumps({'base_commit': base.get('commit'), 'new_commit': new.get('commit'),
+                      'regressions': regressions}))
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test /process_tweet against the fake model backend.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    r = sub.add_parser('run')
+    r.add_argument('--url', help="test a running app instead of starting one")
+    r.add_argument('--concurrency', default='1,4,16,64', help="comma-separated levels")
+    r.add_argument('--requests', type=int, default=200, help="requests per level")
+    r.add_argument('--warmup', type=int, default=5, help="uncounted requests before each level")
+    r.add_argument('--media', default=',4.jpg', help="comma-separated upload names to cycle; empty for text only")
+    r.add_argument('--timeout', type=float, default=120)
+    r.add_argument('--fake-latency', default='lognormal:400:0.5')
+    r.add_argument('--fake-sentiment-latency', default='lognormal:150:0.4')
+    r.add_argument('--fake-upload-latency', default='fixed:50')
+    r.add_argument('--fake-chunk-size', type=int, default=16)
+    r.add_argument('--fake-chunk-delay', default='fixed:5')
+    r.add_argument('--fake-error-rate', type=float, default=0.0)
+    r.add_argument('--result-cache', action='store_true', help="keep the result cache on")
+    r.add_argument('--out', help="save the run as JSON")
+    c = sub.add_parser('compare')
+    c.add_argument('base')
+    c.add_argument('new')
+    c.add_argument('--tolerance', type=float, default=0.1, help="allowed relative change")
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        sys.exit(compare(args))
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
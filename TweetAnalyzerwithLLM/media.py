@@ -0,0 +1,271 @@
+"""Model-ready derivatives of uploaded media, and the media catalog.
+
+The classifier gains nothing from a 2560px photo or a whole 16 MB video, but
+every extra pixel costs upload bandwidth and media tokens. When a file is
+uploaded, a background worker builds a derivative, cached by the SHA-256 of
+the original so the same bytes are never processed twice:
+
+- images: EXIF-rotated, capped at ``MEDIA_MAX_SIDE`` and re-encoded as JPEG;
+- videos: up to ``MEDIA_KEYFRAMES`` scene-change keyframes (evenly spaced
+  frames when the video has fewer scene cuts), same size cap, and the audio
+  track as low-bitrate mono, since the classifier is asked to report relevant
+  audio (``MEDIA_EXTRACT_AUDIO=0`` drops it). This needs ``ffmpeg``; without
+  it the original video is sent.
+
+``MediaCatalog`` keeps the list of uploads in memory (one directory scan at
+startup, then updated by ``/upload``) so the index page does not list the
+folder on every request. ``model_media`` is what ``generate`` uploads, with a
+note telling the model that keyframes are stills from one video.
+"""
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from PIL import Image, ImageOps
+
+from upload_cache import file_sha256
+
+# Configuration
+MEDIA_DERIVATIVE_DIR = os.environ.get('MEDIA_DERIVATIVE_DIR', 'instance/media')
+MEDIA_MAX_SIDE = int(os.environ.get('MEDIA_MAX_SIDE', 1024))
+MEDIA_JPEG_QUALITY = int(os.environ.get('MEDIA_JPEG_QUALITY', 85))
+MEDIA_KEYFRAMES = int(os.environ.get('MEDIA_KEYFRAMES', 4))
+MEDIA_EXTRACT_AUDIO = os.environ.get('MEDIA_EXTRACT_AUDIO', '1') == '1'
+MEDIA_WORKERS = int(os.environ.get('MEDIA_WORKERS', 2))
+# How long generate() waits for a derivative still being built before sending the original
+MEDIA_WAIT_TIMEOUT = float(os.environ.get('MEDIA_WAIT_TIMEOUT', 10))
+FFMPEG = os.environ.get('FFMPEG', 'ffmpeg')
+FFPROBE = os.environ.get('FFPROBE', 'ffprobe')
+SCENE_THRESHOLD = 0.3
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi'}
+
+
+def media_type(filename):
+    ext = filename.rsplit('.', 1)[-1].lower()
+    if ext in VIDEO_EXTENSIONS:
+        return 'video'
+    if ext in IMAGE_EXTENSIONS:
+        return 'image'
+    return None
+
+
+def shrink_image(src, dest, max_side=MEDIA_MAX_SIDE, quality=MEDIA_JPEG_QUALITY):
+    with Image.open(src) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('RGB')
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        img.save(dest, format='JPEG', quality=quality, optimize=True)
+
+
+def _ffmpeg(*args):
+    subprocess.run([FFMPEG, '-hide_banner', '-loglevel', 'error', '-y', *args],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def _video_duration(src):
+    probe = subprocess.run(
+        [FFPROBE, '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', src],
+        check=True, capture_output=True, text=True,
+    )
+    return float(probe.stdout.strip() or 0)
+
+
+def video_keyframes(src, out_dir, count=MEDIA_KEYFRAMES, max_side=MEDIA_MAX_SIDE):
+    """Up to ``count`` JPEG keyframes at scene changes, or evenly spaced if there are too few cuts."""
+    scale = f"scale='min({max_side},iw)':'min({max_side},ih)':force_original_aspect_ratio=decrease"
+    pattern = os.path.join(out_dir, 'frame_%02d.jpg')
+    # The first frame always counts as a scene so short clips still produce one
+    _ffmpeg('-i', src, '-vf', f"select='eq(n,0)+gt(scene,{SCENE_THRESHOLD})',{scale}",
+            '-vsync', 'vfr', '-frames:v', str(count), '-q:v', '3', pattern)
+    frames = sorted(f for f in os.listdir(out_dir) if f.startswith('frame_'))
+    if len(frames) < count:
+        for f in frames:
+            os.remove(os.path.join(out_dir, f))
+        duration = _video_duration(src) or 1.0
+        _ffmpeg('-i', src, '-vf', f"fps={count / duration},{scale}", '-frames:v', str(count), '-q:v', '3', pattern)
+        frames = sorted(f for f in os.listdir(out_dir) if f.startswith('frame_'))
+    return [os.path.join(out_dir, f) for f in frames]
+
+
+def video_audio(src, out_dir):
+    """Mono 16 kHz MP3 of the audio track, or ``None`` if the video has none."""
+    dest = os.path.join(out_dir, 'audio.mp3')
+    try:
+        _ffmpeg('-i', src, '-vn', '-ac', '1', '-ar', '16000', '-b:a', '32k', dest)
+    except subprocess.CalledProcessError:
+        return None
+    return dest if os.path.exists(dest) and os.path.getsize(dest) else None
+
+
+_building = {}
+_building_lock = threading.Lock()
+
+
+def _digest_lock(digest):
+    """One lock per digest, so identical uploads are built once per process."""
+    with _building_lock:
+        return _building.setdefault(digest, threading.Lock())
+
+
+def _load_manifest(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_derivative(src, root=MEDIA_DERIVATIVE_DIR):
+    """Build (or reuse) the derivative of ``src``; returns its manifest dict."""
+    digest = file_sha256(src)
+    out_dir = os.path.join(root, digest)
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    with _digest_lock(digest):
+        if os.path.exists(manifest_path):
+            return _load_manifest(manifest_path)
+
+        kind = media_type(src)
+        if kind == 'video' and not shutil.which(FFMPEG):
+            # Not cached, so the keyframes are built once ffmpeg is installed
+            size = os.path.getsize(src)
+            return {'sha256': digest, 'type': kind, 'files': [], 'original_bytes': size, 'derived_bytes': size}
+
+        # Build in a private scratch directory and rename it into place, so a crash never
+        # leaves half a derivative and concurrent builders never share a directory
+        tmp_dir = tempfile.mkdtemp(prefix=f'{digest}.', suffix='.tmp', dir=root)
+        files = []
+        try:
+            if kind == 'image':
+                shrink_image(src, os.path.join(tmp_dir, 'image.jpg'))
+                files = ['image.jpg']
+            elif kind == 'video':
+                files = [os.path.basename(p) for p in video_keyframes(src, tmp_dir)]
+                if MEDIA_EXTRACT_AUDIO:
+                    audio = video_audio(src, tmp_dir)
+                    if audio:
+                        files.append(os.path.basename(audio))
+
+            original_size = os.path.getsize(src)
+            derived_size = sum(os.path.getsize(os.path.join(tmp_dir, f)) for f in files)
+            if kind == 'image' and derived_size >= original_size:
+                # Already small: the re-encode would only cost quality
+                files = []
+            manifest = {'sha256': digest, 'type': kind, 'files': files,
+                        'original_bytes': original_size, 'derived_bytes': derived_size if files else original_size}
+            with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            try:
+                os.rename(tmp_dir, out_dir)
+            except OSError:
+                # Another process finished the same derivative first; theirs is as good as ours
+                if not os.path.exists(manifest_path):
+                    raise
+                manifest = _load_manifest(manifest_path)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return manifest
+
+
+def keyframe_note(name, manifest):
+    """Tells the model that a video's derivative images are frames of one clip, not separate photos."""
+    if manifest['type'] != 'video':
+        return None
+    frames = sum(1 for f in manifest['files'] if f.startswith('frame_'))
+    note = f"The next {frames} images are keyframes of the video {name}, in time order."
+    if 'audio.mp3' in manifest['files']:
+        note += " The audio track of the same video follows them."
+    return note
+
+
+class MediaCatalog:
+    """In-memory list of uploads with their derivatives, built in the background."""
+
+    def __init__(self, folder, root=MEDIA_DERIVATIVE_DIR, workers=MEDIA_WORKERS):
+        self.folder = folder
+        self.root = root
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media')
+        self.built = 0
+        self.failed = 0
+        os.makedirs(root, exist_ok=True)
+        for name in sorted(os.listdir(folder)):
+            if media_type(name):
+                self.add(name)
+
+    def add(self, name):
+        """Register an upload (new or overwritten) and queue its derivative."""
+        path = os.path.join(self.folder, name)
+        entry = {'name': name, 'path': path.replace('\\', '/'), 'type': media_type(name)}
+        entry['future'] = self._executor.submit(self._build, path)
+        with self._lock:
+            self._entries[name] = entry
+        return entry
+
+    def _build(self, path):
+        try:
+            manifest = build_derivative(path, self.root)
+        except Exception as e:
+            print(f"Media preprocessing failed for {path}: {e}")
+            with self._lock:
+                self.failed += 1
+            return None
+        with self._lock:
+            self.built += 1
+        return manifest
+
+    def listing(self):
+        """Uploads for the index page, in name order."""
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda e: e['name'])
+        return [{'name': e['name'], 'path': e['path'], 'type': e['type']} for e in entries]
+
+    def model_files(self, name, timeout=MEDIA_WAIT_TIMEOUT):
+        """Paths to send to the model for an upload: its derivative, or the original."""
+        return self.model_media(name, timeout)[0]
+
+    def model_media(self, name, timeout=MEDIA_WAIT_TIMEOUT):
+        """``(paths, note)`` for an upload; ``note`` introduces video keyframes, else ``None``."""
+        with self._lock:
+            entry = self._entries.get(name)
+        path = os.path.join(self.folder, name)
+        if entry is None:
+            # The name comes from the form: never read outside the upload folder
+            folder = os.path.realpath(self.folder)
+            if os.path.commonpath([folder, os.path.realpath(path)]) != folder:
+                print(f"Ignoring media outside {self.folder}: {name}")
+                return [], None
+            if not media_type(name) or not os.path.isfile(path):
+                return [path], None
+            entry = self.add(name)
+        try:
+            manifest = entry['future'].result(timeout=timeout)
+        except FutureTimeout:
+            print(f"Derivative for {name} not ready, sending the original")
+            return [path], None
+        if not manifest or not manifest['files']:
+            return [path], None
+        paths = [os.path.join(self.root, manifest['sha256'], f) for f in manifest['files']]
+        return paths, keyframe_note(name, manifest)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'built': self.built, 'failed': self.failed,
+                    'queued': self._executor._work_queue.qsize()}
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_media_catalog(folder='static/uploads'):
+    """The process-wide media catalog, scanning ``folder`` once on first use."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = MediaCatalog(folder)
+    return _catalog
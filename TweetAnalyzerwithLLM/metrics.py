@@ -0,0 +1,65 @@
+"""Stage timings and counters, exposed in the Prometheus text format.
+
+``span(stage)`` times a block into the ``stage_seconds`` histogram (and
+counts it in ``stage_errors_total`` if it raises), so a slow triage can be
+pinned on client construction, media preparation, Files API upload, the
+classifier or sentiment call, or JSON repair. Counters record model tokens,
+bytes uploaded and retries; the caches and pools report their existing
+``stats()`` through ``register_stats``, read only when ``/metrics`` is
+scraped.
+
+With ``METRICS_ENABLED=0`` every metric is a shared no-op object and
+``span`` returns a null context manager, so instrumented code costs one
+method call, and ``/metrics`` returns 404.
+"""
+import os
+import sys
+
+# common/ at the repository root is shared with the call bot
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+from common.prometheus import CONTENT_TYPE, NULL_SPAN, Registry, Span
+
+# Configuration
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'tweet_analyzer')
+# Seconds; model calls take from a few hundred ms to tens of seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+registry = Registry(METRICS_NAMESPACE, METRICS_ENABLED, DEFAULT_BUCKETS)
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
+register_stats = registry.register_stats
+render = registry.render
+
+STAGE_SECONDS = histogram('stage_seconds', "Time spent in each triage stage", ['stage'])
+STAGE_ERRORS = counter('stage_errors_total', "Stages that raised", ['stage'])
+REQUEST_SECONDS = histogram('http_request_seconds', "Request latency by endpoint", ['endpoint', 'status'])
+MODEL_TOKENS = counter('model_tokens_total', "Tokens reported by the models", ['model', 'kind'])
+UPLOAD_BYTES = counter('upload_bytes_total', "Bytes sent to the Files API")
+RETRIES = counter('retries_total', "Repeated calls after a failure", ['stage'])
+BRANCHES = counter('branches_total', "Concurrent triage branches by outcome", ['outcome'])
+
+
+def span(stage):
+    """Time the enclosed block as ``stage``."""
+    if not METRICS_ENABLED:
+        return NULL_SPAN
+    return Span(STAGE_SECONDS, (stage,), STAGE_ERRORS)
+
+
+def observe_usage(model, response):
+    """Count the prompt, cached and output tokens of a response's ``usage_metadata``."""
+    if not METRICS_ENABLED or response is None:
+        return
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    for kind, field in (('prompt', 'prompt_token_count'), ('cached', 'cached_content_token_count'),
+                        ('output', 'candidates_token_count')):
+        count = getattr(usage, field, None)
+        if count:
+            MODEL_TOKENS.inc(model, kind, amount=count)
@@ -0,0 +1,176 @@
+"""Incremental parsing and validation of the classifier's JSON output.
+
+The model is prompted with a few-shot answer written with Python literals
+(``True``), so replies may mix them into otherwise valid JSON. Instead of
+string-replacing ``True`` everywhere (which also rewrote summaries) and
+regex-extracting the outermost braces, ``StreamingJSONParser`` consumes the
+streamed chunks, rewrites bare ``True``/``False``/``None`` only outside
+strings, and reports each top-level field as soon as its value is complete.
+That lets ``Priority`` be acted on before the summary has been generated.
+"""
+import json
+
+DISASTER_CATEGORIES = {'Fire', 'Flood', 'Hurricane'}
+RESPONDERS = {'firefighters', 'police', 'ambulance'}
+_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+
+
+class MalformedOutput(ValueError):
+    """The model output is not valid JSON or does not match the schema."""
+
+
+class StreamingJSONParser:
+    """Feed model output chunk by chunk; fields are reported as they complete.
+
+    ``on_field(key, value)`` is called for every key of a top-level object.
+    Text before the first ``{``/``[`` (e.g. a Markdown fence) and after the
+    matching close is ignored.
+    """
+
+    def __init__(self, on_field=None):
+        self.on_field = on_field
+        self._out = []
+        self._depth = 0
+        self._top = None
+        self._in_string = False
+        self._escape = False
+        self._bareword = []
+        self._string_start = None
+        self._key = None
+        self._value_start = None
+        self.done = False
+
+    def feed(self, chunk):
+        for ch in chunk:
+            if self.done:
+                return
+            self._feed_char(ch)
+
+    def _flush_bareword(self):
+        if self._bareword:
+            word = ''.join(self._bareword)
+            self._out.append(_LITERALS.get(word, word))
+            self._bareword = []
+
+    def _feed_char(self, ch):
+        if self._top is None:
+            if ch in '{[':
+                self._top = ch
+            else:
+                return
+
+        if self._in_string:
+            self._out.append(ch)
+            if self._escape:
+                self._escape = False
+            elif ch == '\\':
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+            return
+
+        if ch.isalpha():
+            self._bareword.append(ch)
+            return
+        self._flush_bareword()
+
+        if ch == '"':
+            if self._depth == 1 and self._top == '{' and self._key is None:
+                self._string_start = len(self._out)
+            self._in_string = True
+            self._out.append(ch)
+        elif ch in '{[':
+            self._depth += 1
+            self._out.append(ch)
+        elif ch in '}]':
+            if self._depth == 1:
+                self._end_value()
+            self._depth -= 1
+            self._out.append(ch)
+            if self._depth == 0:
+                self.done = True
+        elif ch == ':' and self._depth == 1 and self._string_start is not None:
+            self._key = json.loads(''.join(self._out[self._string_start:]))
+            self._string_start = None
+            self._out.append(ch)
+            self._value_start = len(self._out)
+        elif ch == ',' and self._depth == 1:
+            self._end_value()
+            self._out.append(ch)
+        else:
+            self._out.append(ch)
+
+    def _end_value(self):
+        if self._key is None:
+            return
+        key, self._key = self._key, None
+        raw = ''.join(self._out[self._value_start:]).strip()
+        if self.on_field is not None and raw:
+            try:
+                value = json.loads(raw)
+            except ValueError:
+                return
+            self.on_field(key, value)
+
+    def result(self):
+        """The parsed document; raises ``MalformedOutput`` if incomplete or invalid."""
+        self._flush_bareword()
+        if not self.done:
+            raise MalformedOutput("Model output ended before the JSON was complete")
+        try:
+            return json.loads(''.join(self._out))
+        except ValueError as e:
+            raise MalformedOutput(f"Model output is not valid JSON: {e}") from e
+
+
+def parse_output(text, on_field=None):
+    """Parse a complete model reply."""
+    parser = StreamingJSONParser(on_field)
+    parser.feed(text)
+    return parser.result()
+
+
+def validate_triage(result):
+    """Check a classifier result against the output schema, normalizing types."""
+    if not isinstance(result, dict):
+        raise MalformedOutput(f"Expected a JSON object, got {type(result).__name__}")
+    missing = [k for k in ('Disaster_Category', 'Relevancy', 'Priority') if k not in result]
+    if missing:
+        raise MalformedOutput(f"Missing fields: {', '.join(missing)}")
+
+    relevancy = result['Relevancy']
+    if isinstance(relevancy, str) and relevancy.lower() in ('true', 'false'):
+        relevancy = relevancy.lower() == 'true'
+    if not isinstance(relevancy, bool):
+        raise MalformedOutput(f"Relevancy must be a boolean, got {relevancy!r}")
+
+    try:
+        priority = int(result['Priority'])
+    except (TypeError, ValueError):
+        raise MalformedOutput(f"Priority must be an integer, got {result['Priority']!r}")
+    if relevancy and not 1 <= priority <= 5:
+        raise MalformedOutput(f"Priority must be 1-5 for relevant tweets, got {priority}")
+    if not relevancy:
+        priority = -1
+
+    category = result['Disaster_Category']
+    if relevancy and category not in DISASTER_CATEGORIES:
+        raise MalformedOutput(f"Unknown Disaster_Category {category!r}")
+
+    responders = result.get('responders_required') or []
+    if isinstance(responders, str):
+        responders = [responders]
+    if not isinstance(responders, list):
+        raise MalformedOutput("responders_required must be a list")
+    responders = [r for r in (str(r).strip().lower() for r in responders) if r in RESPONDERS]
+
+    validated = dict(result)
+    validated.update({
+        'Disaster_Category': category,
+        'Relevancy': relevancy,
+        'Priority': priority,
+        'media_description': str(result.get('media_description', 'NA')),
+        'summary': str(result.get('summary', '')),
+        'responders_required': responders,
+    })
+    return validated
@@ -0,0 +1,290 @@
+"""Local relevance pre-filter in front of the Gemini classifier.
+
+Most tweets in a disaster-keyword stream come back ``Relevancy: False,
+Priority: -1``. This first stage scores tweet text with a hashed-feature
+logistic regression (word unigrams and bigrams, NumPy only) trained on logged
+``generate`` outputs, and skips the model calls for tweets it is confident
+are irrelevant. Tweets that mention distress or emergency terms, or carry
+media, always go to the model.
+
+``train`` leaves out a held-out share of the log (``PREFILTER_HOLDOUT``,
+chosen by a hash of the tweet text so repeated tweets land on the same side)
+and ``evaluate`` reports precision/recall on that share only; ``--folds k``
+cross-validates over the whole log instead. ``bench`` times ``should_skip``,
+the per-tweet call ``generate`` makes.
+
+Usage:
+    python prefilter.py train triage_log.jsonl --out instance/prefilter.npz
+    python prefilter.py evaluate triage_log.jsonl --thresholds 0.01,0.05,0.1
+    python prefilter.py evaluate triage_log.jsonl --folds 5
+    python prefilter.py bench --n 100000
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# Configuration
+PREFILTER_MODEL_PATH = os.environ.get('PREFILTER_MODEL_PATH', 'instance/prefilter.npz')
+# Skip the model when P(relevant) is below this
+PREFILTER_REJECT_THRESHOLD = float(os.environ.get('PREFILTER_REJECT_THRESHOLD', 0.05))
+PREFILTER_ENABLED = os.environ.get('PREFILTER_ENABLED', '1') == '1'
+# Share of the triage log kept out of training for evaluate
+PREFILTER_HOLDOUT = float(os.environ.get('PREFILTER_HOLDOUT', 0.2))
+FEATURE_BITS = 18
+
+_TOKEN = re.compile(r"[a-z0-9#']+")
+# Never skip a tweet that sounds like someone needs help
+_ALWAYS_SEND = re.compile(
+    r"\b(help|sos|trapped|stuck|rescue|urgent|emergency|evacuat\w*|injured|hurt|"
+    r"dying|missing|save us|can'?t get out|no way out|911|need(?:s|ed)? (?:help|water|boat|ambulance))\b"
+)
+
+NOT_RELEVANT = {
+    "Disaster_Category": "NA",
+    "Relevancy": False,
+    "Priority": -1,
+    "media_description": "NA",
+    "summary": "Not relevant for first responders (local pre-filter)",
+    "Sentiment_Type": "NA",
+    "responders_required": [],
+}
+
+
+def hashed_features(text, bits=FEATURE_BITS):
+    """Hash word unigrams and bigrams of ``text`` into ``2**bits`` buckets."""
+    tokens = _TOKEN.findall(text.lower())
+    mask = (1 << bits) - 1
+    features = [zlib.crc32(t.encode()) & mask for t in tokens]
+    features += [zlib.crc32(f"{a} {b}".encode()) & mask for a, b in zip(tokens, tokens[1:])]
+    return features
+
+
+def featurize(texts, bits=FEATURE_BITS):
+    """Return a CSR-style ``(indices, indptr)`` pair for a batch of texts."""
+    rows = [hashed_features(t, bits) for t in texts]
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(r) for r in rows])
+    indices = np.fromiter((f for r in rows for f in r), dtype=np.int64, count=int(indptr[-1]))
+    return indices, indptr
+
+
+def _row_sums(values, indptr):
+    sums = np.zeros(len(indptr) - 1)
+    nonempty = indptr[1:] > indptr[:-1]
+    if values.size:
+        sums[nonempty] = np.add.reduceat(values, indptr[:-1][nonempty])
+    return sums
+
+
+class PreFilter:
+    """Hashed-feature logistic regression over tweet text."""
+
+    def __init__(self, weights=None, bias=0.0, bits=FEATURE_BITS, threshold=PREFILTER_REJECT_THRESHOLD):
+        self.bits = bits
+        self.weights = np.zeros(1 << bits) if weights is None else weights
+        self.bias = bias
+        self.threshold = threshold
+        self.checked = 0
+        self.rejected = 0
+        # should_skip runs on request threads
+        self._lock = threading.Lock()
+
+    def score_batch(self, texts):
+        """P(relevant) for each text."""
+        indices, indptr = featurize(texts, self.bits)
+        logits = _row_sums(self.weights[indices], indptr) + self.bias
+        return 1.0 / (1.0 + np.exp(-logits))
+
+    def should_skip(self, text, media=()):
+        """True when the model call can be skipped for this tweet."""
+        if media or _ALWAYS_SEND.search(text.lower()):
+            skip = False
+        else:
+            skip = bool(self.score_batch([text])[0] < self.threshold)
+        with self._lock:
+            self.checked += 1
+            self.rejected += skip
+        return skip
+
+    def fit(self, texts, labels, epochs=50, lr=20.0, l2=1e-6):
+        """Full-batch gradient descent on the logistic loss."""
+        labels = np.asarray(labels, dtype=np.float64)
+        indices, indptr = featurize(texts, self.bits)
+        counts = np.diff(indptr)
+        # Balance classes so the rare relevant tweets are not drowned out
+        positives = max(labels.sum(), 1.0)
+        negatives = max(len(labels) - labels.sum(), 1.0)
+        sample_weight = np.where(labels == 1, len(labels) / (2 * positives), len(labels) / (2 * negatives))
+        for _ in range(epochs):
+            logits = _row_sums(self.weights[indices], indptr) + self.bias
+            residual = (1.0 / (1.0 + np.exp(-logits)) - labels) * sample_weight / len(labels)
+            grad = np.bincount(indices, weights=np.repeat(residual, counts), minlength=self.weights.size)
+            self.weights -= lr * (grad + l2 * self.weights)
+            self.bias -= lr * residual.sum()
+        return self
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez_compressed(path, weights=self.weights.astype(np.float32), bias=self.bias, bits=self.bits)
+
+    @classmethod
+    def load(cls, path, threshold=PREFILTER_REJECT_THRESHOLD):
+        data = np.load(path)
+        return cls(data['weights'].astype(np.float64), float(data['bias']), int(data['bits']), threshold)
+
+    def stats(self):
+        with self._lock:
+            return {'checked': self.checked, 'rejected': self.rejected}
+
+
+def load_log(path):
+    """Read ``(texts, labels)`` from a triage log written by ``generate``."""
+    texts, labels = [], []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            result = entry.get('result', {})
+            if 'error' in result or entry.get('media'):
+                continue
+            texts.append(entry['tweet'])
+            labels.append(1 if result.get('Relevancy') is True else 0)
+    return texts, labels
+
+
+def _split_hash(text):
+    # Punctuation and case do not move a tweet to the other split
+    return zlib.crc32(' '.join(_TOKEN.findall(text.lower())).encode())
+
+
+def held_out(text, holdout=PREFILTER_HOLDOUT):
+    """Whether ``text`` belongs to the evaluation split; stable across runs."""
+    return _split_hash(text) % 10000 < holdout * 10000
+
+
+def split_log(texts, labels, holdout=PREFILTER_HOLDOUT):
+    """``(train, test)`` pairs of ``(texts, labels)`` using ``held_out``."""
+    train, test = ([], []), ([], [])
+    for text, label in zip(texts, labels):
+        part = test if held_out(text, holdout) else train
+        part[0].append(text)
+        part[1].append(label)
+    return train, test
+
+
+def evaluate(prefilter, texts, labels, thresholds):
+    """Precision/recall of the skip decision at each threshold.
+
+    Precision is the share of skipped tweets that really were irrelevant;
+    ``missed_relevant`` counts relevant tweets that would never reach the model.
+    Pass tweets the model was not trained on, see ``split_log``.
+    """
+    return _report(prefilter.score_batch(texts), texts, labels, thresholds)
+
+
+def cross_validate(texts, labels, thresholds, folds=5, epochs=50):
+    """``evaluate`` over out-of-fold scores: each tweet is scored by a model trained without it."""
+    texts = list(texts)
+    labels = np.asarray(labels)
+    fold = np.array([_split_hash(t) % folds for t in texts], dtype=np.int64)
+    scores = np.zeros(len(texts))
+    for k in range(folds):
+        train = np.flatnonzero(fold != k)
+        test = np.flatnonzero(fold == k)
+        if not len(test):
+            continue
+        model = PreFilter().fit([texts[i] for i in train], labels[train], epochs=epochs)
+        scores[test] = model.score_batch([texts[i] for i in test])
+    return _report(scores, texts, labels, thresholds)
+
+
+def _report(scores, texts, labels, thresholds):
+    labels = np.asarray(labels)
+    forced = np.array([bool(_ALWAYS_SEND.search(t.lower())) for t in texts])
+    report = []
+    for threshold in thresholds:
+        skipped = (scores < threshold) & ~forced
+        true_skips = int((skipped & (labels == 0)).sum())
+        report.append({
+            'threshold': threshold,
+            'skip_rate': float(skipped.mean()) if len(labels) else 0.0,
+            'precision': true_skips / skipped.sum() if skipped.sum() else 1.0,
+            'recall': true_skips / (labels == 0).sum() if (labels == 0).sum() else 0.0,
+            'missed_relevant': int((skipped & (labels == 1)).sum()),
+        })
+    return report
+
+
+_prefilter = None
+_prefilter_lock = threading.Lock()
+
+
+def get_prefilter():
+    """The process-wide pre-filter, or ``None`` when disabled or untrained."""
+    global _prefilter
+    if _prefilter is None and PREFILTER_ENABLED and os.path.exists(PREFILTER_MODEL_PATH):
+        with _prefilter_lock:
+            if _prefilter is None:
+                _prefilter = PreFilter.load(PREFILTER_MODEL_PATH)
+    return _prefilter
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train, evaluate or benchmark the tweet pre-filter.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    train = sub.add_parser('train')
+    train.add_argument('log')
+    train.add_argument('--out', default=PREFILTER_MODEL_PATH)
+    train.add_argument('--epochs', type=int, default=50)
+    train.add_argument('--holdout', type=float, default=PREFILTER_HOLDOUT)
+    ev = sub.add_parser('evaluate')
+    ev.add_argument('log')
+    ev.add_argument('--model', default=PREFILTER_MODEL_PATH)
+    ev.add_argument('--thresholds', default='0.01,0.02,0.05,0.1,0.2')
+    ev.add_argument('--holdout', type=float, default=PREFILTER_HOLDOUT,
+                    help="must match the share used by train")
+    ev.add_argument('--folds', type=int, default=0,
+                    help="cross-validate with this many folds instead of using the saved model")
+    bench = sub.add_parser('bench')
+    bench.add_argument('--model', default=PREFILTER_MODEL_PATH)
+    bench.add_argument('--n', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'train':
+        (texts, labels), (test_texts, _) = split_log(*load_log(args.log), holdout=args.holdout)
+        model = PreFilter().fit(texts, labels, epochs=args.epochs)
+        model.save(args.out)
+        print(f"Trained on {len(texts)} tweets ({sum(labels)} relevant), "
+              f"{len(test_texts)} held out for evaluate, saved to {args.out}")
+    elif args.command == 'evaluate':
+        texts, labels = load_log(args.log)
+        thresholds = [float(t) for t in args.thresholds.split(',')]
+        if args.folds > 1:
+            report = cross_validate(texts, labels, thresholds, folds=args.folds)
+        else:
+            _, (texts, labels) = split_log(texts, labels, holdout=args.holdout)
+            print(f"Evaluating on {len(texts)} held-out tweets")
+            report = evaluate(PreFilter.load(args.model), texts, labels, thresholds)
+        for row in report:
+            print(json.dumps(row))
+    else:
+        model = PreFilter.load(args.model) if os.path.exists(args.model) else PreFilter()
+        texts = [f"power is out again on street {i}, the storm last night was loud" for i in range(args.n)]
+        # One call per tweet, as generate makes them
+        start = time.perf_counter()
+        for text in texts:
+            model.should_skip(text)
+        elapsed = time.perf_counter() - start
+        print(json.dumps({'tweets': args.n, 'seconds': round(elapsed, 3), 'tweets_per_second': round(args.n / elapsed),
+                          'us_per_tweet': round(elapsed / args.n * 1e6, 1)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""Static prompt prefix for the disaster classifier.
+
+The system instruction (the Priority 1-5 rubric) and the few-shot "Save us"
+turn are identical for every tweet. They are built once into an immutable
+``PromptPrefix`` and, when the backend supports it, registered as a Gemini
+cached context so those input tokens are not re-sent and re-billed per tweet.
+If context caching is unavailable, or the prefix is below the model's minimum
+cacheable size, the same prefix is sent inline. Creating and extending the
+cached context happens on a background thread, never on a request; a cached
+context that is replaced is deleted rather than left to bill until its TTL.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from google.genai import types
+
+from clients import gemini_client
+from upload_cache import get_upload_cache, UPLOAD_CACHE_TTL
+
+# Configuration
+CLASSIFIER_MODEL = "gemini-2.0-flash"
+PREFIX_EXAMPLE_MEDIA = os.environ.get('PREFIX_EXAMPLE_MEDIA', 'static/uploads/4.jpg')
+PREFIX_CACHE_TTL = int(os.environ.get('PREFIX_CACHE_TTL', 3600))
+# Extend the cached context this many seconds before it would expire
+PREFIX_REFRESH_MARGIN = int(os.environ.get('PREFIX_REFRESH_MARGIN', 300))
+# After a failed cache create, send the prefix inline for this long before retrying
+PREFIX_RETRY_AFTER = int(os.environ.get('PREFIX_RETRY_AFTER', 600))
+# Explicit context caching rejects smaller contents (4096 tokens for gemini-2.0-flash)
+PREFIX_CACHE_MIN_TOKENS = int(os.environ.get('PREFIX_CACHE_MIN_TOKENS', 4096))
+# Gemini bills an image at a flat 258 tokens
+IMAGE_TOKENS = 258
+
+SYSTEM_INSTRUCTION = """You are a Twitter feed monitoring agent tasked with tracking tweets related to natural disasters such as wildfires, floods, or hurricanes. Each tweet you receive will include text and may also contain videos or images. If the tweet has a video or a photo, then you must populate the \"media_description\" field of the output with a brief description as to what is happening in the video in a way that is concerning to a first responder/authority. If the video/photo includes a firefighter/ ambulance/ police officer, mention it in your description. If the video has any audio that is relevant, make sure to include it in your description
+\"media_description\" can be \"NA\" if no media(photo or video is provided)
+You must also create a field called \"summary\" that briefly summarizes the tweet text and the \"media_description\". This summary is to be a one-line sentence that is relavant to the the first responders (fire fighters, police, ambulance etc)
+You must also create a field called \"responders_required\" which is a is list that has one or more of [\"firefighters\", \"police\", \"ambulance\"] in the order of importance of their role to the tweet. Only populate the field with responders that are required in the field
+Your job is to classify each tweet using three labels:
+
+1. **Disaster_Category**:  
+   This label indicates the type of disaster mentioned in the tweet. It can only be one of the following options: `['Fire', 'Flood', 'Hurricane']`.
+
+2. **Relevancy**:  
+   This label specifies whether the tweet describes an actual threat relevant for first responders or if it is just general information.  
+   - Use `True` if the tweet is relevant for first responders.  
+   - Use `False` if the tweet is not relevant.
+
+3. **Priority**:  
+   This label is a score that helps rank the urgency of the tweet.  
+   - If **Relevancy** is `False`, set **Priority** to `-1`.  
+   - If **Relevancy** is `True`, assign a score from `1` to `5` as follows:
+     For tweets deemed relevant (i.e., **Relevancy** is `True`), assign a **Priority** score from 1 to 5 based on the urgency of the situation described. Use the following criteria for scoring:
+
+- **Priority 1**:  
+  Use this score **only** if the tweet is a direct distress call explicitly asking for immediate help. This indicates a critical situation where someone is in immediate danger and requires first responders to perform rescue operations without delay. 
+IMPORTANT:  If the tweet includes the mention of the presence of a firefighter/ ambulance/ police officer already then this DO NOT award a score of 1
+  **Example:**  
+  - Tweet: \"URGENT: I'm trapped in my burning house! Please send immediate rescue!\"  
+  - Classification: `{\"Disaster_Category\": \"Fire\", \"Relevancy\": True, \"Priority\": 1}`
+
+- **Priority 2**:  
+  Use this score when the tweet describes a severe situation that is escalating quickly, but it is not a direct distress call. First responders should be alerted promptly even though it doesn't explicitly request immediate rescue.
+IMPORTANT:  If the tweet includes the mention of the presence of a firefighter/ ambulance/ police officer already then this DO NOT award a score of 2
+  **Example:**  
+  - Tweet: \"There's a massive wildfire near our neighborhood and it's spreading fast. We need help soon!\"  
+  - Classification: `{\"Disaster_Category\": \"Fire\", \"Relevancy\": True, \"Priority\": 2}`
+
+- **Priority 3**:  
+  Use this score when the tweet indicates a concerning situation that could require timely intervention. The circumstances warrant attention, but there is no explicit call for immediate rescue and the threat is less severe than Priority 1 or 2 scenarios.  
+  **Example:**  
+  - Tweet: \"Flood waters are rising in my area. It looks dangerous, please monitor the situation.\"  
+  - Classification: `{\"Disaster_Category\": \"Flood\", \"Relevancy\": True, \"Priority\": 3}`
+
+- **Priority 4**:  
+  Use this score when the tweet provides important situational information that is not time-critical. The content is relevant for awareness or follow-up, but it does not signal an urgent need for immediate action.  
+  **Example:**  
+  - Tweet: \"Reports indicate that a hurricane is approaching the coast. Stay safe and keep updated.\"  
+  - Classification: `{\"Disaster_Category\": \"Hurricane\", \"Relevancy\": True, \"Priority\": 4}`
+
+- **Priority 5**:  
+  Use this score for tweets that are relevant for monitoring purposes and provide general updates or information about the situation. Although the tweet is relevant, it reflects a low-risk scenario where immediate action is not required.  
+  **Example:**  
+  - Tweet: \"The wildfire seems to be under control now; just sharing an update from the local news.\"  
+  - Classification: `{\"Disaster_Category\": \"Fire\", \"Relevancy\": True, \"Priority\": 5}
+
+If **Relevancy** is `False`, then the **Priority** must be set to `-1`.
+Note: If the tweet text mentions the post image/video is from another time and is not happening right now, then the tweet is not relevant.
+If the tweet is not relevant, then the \"media_description\" field can be set to \"NA\".
+
+Your final output must be a dictionary in the exact following format (with only the dictionary as the output):
+
+```
+{\"Disaster_Category\": <Category from ['Fire','Flood','Hurricane']>, \"Relevancy\": <True or False>, \"Priority\": <-1 if not relevant else a value from 1-5>, \"media_description\":<A piece of text meant for authorities that summarizes the video or image. if there is no media then  leave thjs as NA>, \"summary\": < a one-line sentence that is relavant to the the first responders (fire fighters, police, ambulance etc)>,  \"responders_required\" : <list that has one or more of [\"firefighters\", \"police\", \"ambulance\"] in the order of importance of their role to the tweet>}
+```
+"""
+
+EXAMPLE_TWEET = """Save us"""
+EXAMPLE_REPLY = """{\"Disaster_Category\": \"Fire\", \"Relevancy\": True, \"Priority\": 1, \"media_description\": \"The image shows a large wildfire burning intensely on a hillside. There are multiple points of active flames and heavy smoke, posing a significant threat.\", \"summary\": \"People need rescuing from a large and rapidly spreading fire on a hillside.\", \"responders_required\": [\"firefighters\", \"ambulance\", \"police\"]}"""
+
+
+@dataclass(frozen=True)
+class PromptPrefix:
+    """Everything that precedes the tweet in a classifier request."""
+    model: str
+    system_instruction: str
+    few_shot: tuple
+    estimated_tokens: int
+    # When the example media upload stops being usable
+    expires_at: float
+
+    def inline_contents(self, user_parts):
+        return list(self.few_shot) + [types.Content(role="user", parts=user_parts)]
+
+
+def build_prefix(client):
+    """Upload the example media and assemble the immutable prefix."""
+    example = get_upload_cache().get_or_upload(client, PREFIX_EXAMPLE_MEDIA)
+    few_shot = (
+        types.Content(
+            role="user",
+            parts=[
+                types.Part.from_uri(
+                    file_uri=example.uri,
+                    mime_type=example.mime_type,
+                ),
+                types.Part.from_text(text=EXAMPLE_TWEET),
+            ],
+        ),
+        types.Content(
+            role="model",
+            parts=[
+                types.Part.from_text(text=EXAMPLE_REPLY),
+            ],
+        ),
+    )
+    text_chars = len(SYSTEM_INSTRUCTION) + len(EXAMPLE_TWEET) + len(EXAMPLE_REPLY)
+    return PromptPrefix(
+        model=CLASSIFIER_MODEL,
+        system_instruction=SYSTEM_INSTRUCTION,
+        few_shot=few_shot,
+        # Roughly four characters per token for English text
+        estimated_tokens=text_chars // 4 + IMAGE_TOKENS,
+        # A reused upload may be close to the Files API deletion already
+        expires_at=example.uploaded_at + UPLOAD_CACHE_TTL,
+    )
+
+
+class PrefixCache:
+    """Keeps the prefix registered as a cached context and builds requests on it."""
+
+    def __init__(self, client_factory=gemini_client):
+        self._client_factory = client_factory
+        self._lock = threading.Lock()
+        # Held by the one thread rebuilding the prefix or its cached context
+        self._refresh_lock = threading.Lock()
+        self._prefix = None
+        self._cached_name = None
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        # Cached contexts replaced by a newer one, deleted by the next refresh
+        self._superseded = []
+        self.requests = 0
+        self.cached_requests = 0
+        self.tokens_saved = 0
+        self.last_tokens_saved = 0
+        self.refreshes = 0
+
+    def _stale(self, now):
+        """Whether the prefix or its cached context needs work; call with ``_lock`` held."""
+        if self._prefix is None or now >= self._prefix.expires_at:
+            return True
+        if self._cached_name:
+            return now >= self._expires_at - PREFIX_REFRESH_MARGIN
+        return now >= self._retry_at
+
+    def _current(self):
+        """Return ``(prefix, cached_content_name or None)``, refreshing as needed."""
+        now = time.time()
+        with self._lock:
+            if not self._stale(now):
+                return self._prefix, self._cached_name
+            usable = self._prefix is not None and now < self._prefix.expires_at
+        if not usable:
+            # Nothing valid to send yet: this request waits for the example upload
+            with self._refresh_lock:
+                self._rebuild()
+        # The cached context is created or extended off the request path
+        if self._refresh_lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh_in_background, name='prefix-refresh', daemon=True).start()
+        with self._lock:
+            return self._prefix, self._cached_name
+
+    def _rebuild(self):
+        """Build a new prefix if there is none or its example upload has expired."""
+        with self._lock:
+            if self._prefix is not None and time.time() < self._prefix.expires_at:
+                # Another request rebuilt it while this one waited
+                return
+        prefix = build_prefix(self._client_factory())
+        with self._lock:
+            if self._cached_name:
+                # It refers to the expired example upload
+                self._superseded.append(self._cached_name)
+            self._prefix, self._cached_name = prefix, None
+            self._expires_at = self._retry_at = 0.0
+
+    def _refresh_in_background(self):
+        # _current acquired _refresh_lock for this thread
+        try:
+            self._refresh()
+        except Exception as e:
+            print(f"Could not refresh cached prompt prefix: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self):
+        """Extend or create the cached context and delete replaced ones, then swap in under ``_lock``."""
+        now = time.time()
+        with self._lock:
+            prefix, cached_name = self._prefix, self._cached_name
+            expires_at, retry_at = self._expires_at, self._retry_at
+            superseded, self._superseded = self._superseded, []
+        if prefix is None or now >= prefix.expires_at:
+            # The next request rebuilds it
+            return
+        client = self._client_factory()
+        refreshed = False
+
+        if cached_name and now >= expires_at - PREFIX_REFRESH_MARGIN:
+            try:
+                client.caches.update(
+                    name=cached_name,
+                    config=types.UpdateCachedContentConfig(ttl=f"{PREFIX_CACHE_TTL}s"),
+                )
+                expires_at = now + PREFIX_CACHE_TTL
+                refreshed = True
+            except Exception as e:
+                print(f"Could not refresh cached prompt prefix: {e}")
+                superseded.append(cached_name)
+                cached_name = None
+
+        if cached_name is None and now >= retry_at:
+            if prefix.estimated_tokens < PREFIX_CACHE_MIN_TOKENS:
+                print(f"Prompt prefix is about {prefix.estimated_tokens} tokens, below the "
+                      f"{PREFIX_CACHE_MIN_TOKENS} needed for context caching; sending it inline")
+                # Only a rebuilt prefix can change its size
+                retry_at = prefix.expires_at
+            else:
+                try:
+                    cached = client.caches.create(
+                        model=prefix.model,
+                        config=types.CreateCachedContentConfig(
+                            display_name="tweet-triage-prefix",
+                            system_instruction=prefix.system_instruction,
+                            contents=list(prefix.few_shot),
+                            ttl=f"{PREFIX_CACHE_TTL}s",
+                        ),
+                    )
+                    cached_name = cached.name
+                    expires_at = now + PREFIX_CACHE_TTL
+                except Exception as e:
+                    # e.g. no caching support for the model or the API version
+                    print(f"Context caching unavailable, sending prompt prefix inline: {e}")
+                    retry_at = now + PREFIX_RETRY_AFTER
+
+        with self._lock:
+            self._prefix, self._cached_name = prefix, cached_name
+            self._expires_at, self._retry_at = expires_at, retry_at
+            self.refreshes += refreshed
+
+        for name in superseded:
+            # Cached contents are billed for storage until deleted or expired
+            try:
+                client.caches.delete(name=name)
+            except Exception as e:
+                print(f"Could not delete replaced cached prompt prefix {name}: {e}")
+
+    def build_request(self, user_parts, **config):
+        """Return ``(model, contents, GenerateContentConfig)`` for one classifier call."""
+        prefix, cached_name = self._current()
+        if cached_name:
+            contents = [types.Content(role="user", parts=user_parts)]
+            generate_content_config = types.GenerateContentConfig(cached_content=cached_name, **config)
+        else:
+            contents = prefix.inline_contents(user_parts)
+            generate_content_config = types.GenerateContentConfig(
+                system_instruction=[types.Part.from_text(text=prefix.system_instruction)],
+                **config,
+            )
+        return prefix.model, contents, generate_content_config
+
+    def record_usage(self, response, generate_content_config):
+        """Account for the prefix tokens a response did not have to re-send."""
+        saved = 0
+        if generate_content_config.cached_content:
+            usage = getattr(response, 'usage_metadata', None)
+            saved = getattr(usage, 'cached_content_token_count', None) or self._prefix.estimated_tokens
+        with self._lock:
+            self.requests += 1
+            if saved:
+                self.cached_requests += 1
+            self.tokens_saved += saved
+            self.last_tokens_saved = saved
+        return saved
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'cached_requests': self.cached_requests,
+            'prefix_tokens_saved': self.tokens_saved,
+            'prefix_tokens_saved_per_request': self.tokens_saved / self.requests if self.requests else 0.0,
+            'refreshes': self.refreshes,
+            'cached_content': self._cached_name,
+        }
+
+
+_prefix_cache = None
+_prefix_cache_lock = threading.Lock()
+
+
+def get_prefix_cache():
+    """The process-wide prefix cache."""
+    global _prefix_cache
+    if _prefix_cache is None:
+        with _prefix_cache_lock:
+            if _prefix_cache is None:
+                _prefix_cache = PrefixCache()
+    return _prefix_cache
@@ -0,0 +1,224 @@
+"""Result cache for duplicate and near-duplicate tweets.
+
+Disaster tweets are heavily duplicated: retweets, copy-pasted distress
+messages, lightly edited reposts. Before calling the models, ``generate``
+checks this cache in two steps:
+
+1. exact match on the normalized text plus the SHA-256 of the attached media;
+2. MinHash/LSH over word shingles for near-duplicates with the same media,
+   accepted when the estimated Jaccard similarity reaches the threshold.
+
+Entries expire after a TTL and the cache is LRU-bounded. A hit for a
+Priority 1 result is still returned as a new incident: a second distress call
+with the same wording may come from a different person.
+"""
+import copy
+import hashlib
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+
+import numpy as np
+
+from upload_cache import file_sha256
+
+# Configuration
+RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 6 * 3600))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 50000))
+RESULT_CACHE_SIMILARITY = float(os.environ.get('RESULT_CACHE_SIMILARITY', 0.8))
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 32
+SHINGLE_SIZE = 3
+# generate() makes a classifier call and a sentiment call per tweet
+MODEL_CALLS_PER_TWEET = 2
+
+_RETWEET = re.compile(r'^rt\s+@\w+:?\s*')
+_URL = re.compile(r'https?://\S+')
+_MENTION = re.compile(r'@\w+')
+_NON_WORD = re.compile(r'[^\w#]+')
+
+
+def normalize_text(text):
+    """Lowercase and drop retweet prefixes, links, mentions and punctuation."""
+    text = _RETWEET.sub('', text.strip().lower())
+    text = _URL.sub(' ', text)
+    text = _MENTION.sub(' ', text)
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+@lru_cache(maxsize=4096)
+def _media_digest(path, mtime_ns, size):
+    return file_sha256(path)
+
+
+def media_key(paths):
+    """Content hash of the attached media, memoized per (path, mtime, size)."""
+    digests = []
+    for path in paths:
+        st = os.stat(path)
+        digests.append(_media_digest(path, st.st_mtime_ns, st.st_size))
+    return '|'.join(digests)
+
+
+class MinHasher:
+    """Vectorized MinHash signatures over word shingles."""
+
+    def __init__(self, permutations=MINHASH_PERMUTATIONS, seed=1):
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing; uint64 arithmetic wraps, which is what we want
+        self.a = rng.integers(1, 2 ** 63, size=permutations, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, size=permutations, dtype=np.uint64)
+
+    def shingles(self, normalized):
+        words = normalized.split()
+        if len(words) < SHINGLE_SIZE:
+            return {normalized}
+        return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+    def signature(self, normalized):
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode('utf-8')) for s in self.shingles(normalized)),
+            dtype=np.uint64,
+        )
+        with np.errstate(over='ignore'):
+            permuted = (hashes[:, None] * self.a[None, :] + self.b[None, :]) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+class _Entry:
+    __slots__ = ('result', 'signature', 'media', 'text', 'stored_at')
+
+    def __init__(self, result, signature, media, text, stored_at):
+        self.result = result
+        self.signature = signature
+        self.media = media
+        self.text = text
+        self.stored_at = stored_at
+
+
+class ResultCache:
+    """Exact + near-duplicate triage result cache with TTL and LRU bound."""
+
+    def __init__(self, ttl=RESULT_CACHE_TTL, max_entries=RESULT_CACHE_MAX_ENTRIES,
+                 similarity=RESULT_CACHE_SIMILARITY, bands=LSH_BANDS, permutations=MINHASH_PERMUTATIONS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.bands = bands
+        self.rows = permutations // bands
+        self._hasher = MinHasher(permutations)
+        self._entries = OrderedDict()
+        self._buckets = defaultdict(set)
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+
+    def _keys(self, text, media_paths):
+        normalized = normalize_text(text)
+        media = media_key(media_paths)
+        exact = hashlib.sha256(f"{normalized}\x00{media}".encode('utf-8')).hexdigest()
+        return normalized, media, exact
+
+    def _band_keys(self, signature, media):
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            yield (band, media, chunk.tobytes())
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for band_key in self._band_keys(entry.signature, entry.media):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def _fresh(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry.stored_at > self.ttl:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def lookup(self, text, media_paths=()):
+        """Return a copy of a cached result for this tweet, or ``None``."""
+        normalized, media, exact = self._keys(text, media_paths)
+        signature = self._hasher.signature(normalized)
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            entry = self._fresh(exact, now)
+            if entry is not None:
+                self.exact_hits += 1
+                return self._hit(entry, 'exact', 1.0)
+
+            candidates = set()
+            for band_key in self._band_keys(signature, media):
+                candidates |= self._buckets.get(band_key, set())
+            best, best_similarity = None, 0.0
+            for key in candidates:
+                candidate = self._fresh(key, now)
+                if candidate is None:
+                    continue
+                similarity = float(np.mean(candidate.signature == signature))
+                if similarity > best_similarity:
+                    best, best_similarity = candidate, similarity
+            if best is not None and best_similarity >= self.similarity:
+                self.near_hits += 1
+                return self._hit(best, 'near', best_similarity)
+        return None
+
+    def _hit(self, entry, kind, similarity):
+        result = copy.deepcopy(entry.result)
+        result['cache'] = {'hit': kind, 'similarity': round(similarity, 3), 'source_tweet': entry.text}
+        if result.get('Priority') == 1:
+            # Never fold a distress call into an earlier one
+            result['new_incident'] = True
+        return result
+
+    def store(self, text, media_paths, result):
+        if 'error' in result:
+            return
+        normalized, media, exact = self._keys(text, media_paths)
+        signature = self._hasher.signature(normalized)
+        with self._lock:
+            if exact in self._entries:
+                self._remove(exact)
+            self._entries[exact] = _Entry(copy.deepcopy(result), signature, media, text, time.time())
+            for band_key in self._band_keys(signature, media):
+                self._buckets[band_key].add(exact)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        hits = self.exact_hits + self.near_hits
+        return {
+            'lookups': self.lookups,
+            'exact_hits': self.exact_hits,
+            'near_hits': self.near_hits,
+            'hit_rate': hits / self.lookups if self.lookups else 0.0,
+            'model_calls_avoided': hits * MODEL_CALLS_PER_TWEET,
+            'entries': len(self._entries),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """The process-wide result cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
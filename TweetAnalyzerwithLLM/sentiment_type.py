@@ -1,18 +1,10 @@
-import os
-from google import genai
 from google.genai import types
+from clients import sentiment_client
+from metrics import observe_usage, span
 
 def get_sentiment_class(sentiment_text):
-    # Set the GOOGLE_APPLICATION_CREDENTIALS environment variable
-    # Replace 'path/to/your/credentials.json' with the actual path to your credentials file.
-    # IMPORTANT: Ensure the file path is correct.
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "gemini-genai-454500-216b12cc8cc0.json"
-
-    client = genai.Client(
-        vertexai=True,
-        project="659678787868",
-        location="us-central1",
-    )
+    # Shared Vertex client; credentials are loaded once from SENTIMENT_CREDENTIALS
+    client = sentiment_client()
 
     text1 = types.Part.from_text(text=f"""Classify the following tweet into one of the following categories: ['Incident Report', 'Distress Call', 'Evacuation Warning', 'Fire Near Key Infrastructure', 'Roadblock or Escape Issue', 'Request for Emergency Help']. Text: {sentiment_text}""")
 
@@ -45,12 +37,16 @@ def get_sentiment_class(sentiment_text):
         )],
     )
 
-    result = ""
-    for chunk in client.models.generate_content_stream(
-        model=model,
-        contents=contents,
-        config=generate_content_config,
-    ):
-        result += chunk.text
-    return result
+    chunks = []
+    chunk = None
+    with span('sentiment'):
+        for chunk in client.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=generate_content_config,
+        ):
+            if chunk.text:
+                chunks.append(chunk.text)
+    observe_usage('sentiment', chunk)
+    return "".join(chunks)
 
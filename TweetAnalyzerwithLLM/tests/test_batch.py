@@ -0,0 +1,117 @@
+import random
+import threading
+import time
+
+import pytest
+
+import batch
+from batch import TokenBucket, iter_jobs, normalize_record, parse_location, triage_stream
+
+
+def records(n, media_every=0):
+    return [{'text': f'tweet {i}', 'media': ['a.jpg'] if media_every and i % media_every == 0 else [],
+             'location': None} for i in range(n)]
+
+
+def fake_triage():
+    calls = []
+    lock = threading.Lock()
+
+    def triage_one(text, media, location=None):
+        with lock:
+            calls.append([text])
+        time.sleep(random.uniform(0, 0.01))
+        return {'tweet': text, 'location': location}
+
+    def triage_group(texts, on_fallback=None):
+        with lock:
+            calls.append(list(texts))
+        time.sleep(random.uniform(0, 0.01))
+        return [{'tweet': text, 'location': None} for text in texts]
+
+    return calls, triage_one, triage_group
+
+
+def test_results_come_back_in_input_order():
+    calls, triage_one, triage_group = fake_triage()
+    out = list(triage_stream(records(200, media_every=7), triage_one, triage_group,
+                             workers=8, group_size=5, rate_limit=0))
+    assert [line['index'] for line in out] == list(range(200))
+    assert all(line['result']['tweet'] == line['tweet'] == f"tweet {line['index']}" for line in out)
+    assert sum(len(call) for call in calls) == 200
+
+
+def test_offset_skips_already_written_tweets():
+    calls, triage_one, triage_group = fake_triage()
+    out = list(triage_stream(records(20), triage_one, triage_group, workers=2, offset=13, rate_limit=0))
+    assert [line['index'] for line in out] == list(range(13, 20))
+    assert sorted(text for call in calls for text in call) == sorted(f'tweet {i}' for i in range(13, 20))
+
+
+def test_resume_offset_is_the_number_of_lines_written(tmp_path):
+    output = tmp_path / 'results.ndjson'
+    assert batch.count_lines(str(output)) == 0
+    output.write_text('{}\n{}\n{}\n')
+    assert batch.count_lines(str(output)) == 3
+
+
+@pytest.mark.parametrize('argv', [['in.jsonl', '--resume', 'out.ndjson', '--offset', '2'],
+                                  ['in.jsonl', '--offset', '-1']])
+def test_cli_rejects_bad_offsets(argv):
+    with pytest.raises(SystemExit):
+        batch.main(argv)
+
+
+def test_failed_job_is_reported_for_every_tweet_in_it():
+    def triage_group(texts, on_fallback=None):
+        raise RuntimeError('quota')
+
+    out = list(triage_stream(records(4), None, triage_group, workers=1, group_size=4, rate_limit=0))
+    assert [line['result']['error'] for line in out] == ['quota'] * 4
+    # Same columns as a successful row, so downstream readers need no special case
+    assert all(set(batch.RESULT_FIELDS) <= set(line['result']) for line in out)
+    assert out[0]['result']['Priority'] is None and out[0]['result']['responders_required'] is None
+
+
+def test_fallback_calls_are_charged_and_counted():
+    def triage_group(texts, on_fallback=None):
+        on_fallback(len(texts))
+        return [{'tweet': text} for text in texts]
+
+    stats = {}
+    list(triage_stream(records(8), None, triage_group, workers=1, group_size=4, rate_limit=0, stats=stats))
+    assert stats == {'model_calls': 2 * (1 + 4) + 8, 'fallback_calls': 8}
+
+
+def test_media_and_located_tweets_run_alone():
+    tweets = [normalize_record(r) for r in (
+        {'text': 'a'}, {'text': 'b'}, {'text': 'c', 'media': 'x.jpg; y.mp4'},
+        {'text': 'd'}, {'text': 'e', 'lat': '37.5', 'lon': '-122'}, {'text': 'f'},
+    )]
+    jobs = [[i for i, _ in job] for job in iter_jobs(enumerate(tweets), group_size=10)]
+    assert jobs == [[0, 1], [2], [3], [4], [5]]
+    assert tweets[2]['media'] == ['x.jpg', 'y.mp4']
+
+
+def test_location_is_passed_to_single_tweet_triage():
+    _, triage_one, triage_group = fake_triage()
+    tweets = [normalize_record({'text': 'fire', 'lat': 37.5, 'lon': -122})]
+    out = list(triage_stream(tweets, triage_one, triage_group, workers=1, rate_limit=0))
+    assert out[0]['result']['location'] == (37.5, -122.0)
+
+
+@pytest.mark.parametrize('lat, lon, expected', [
+    ('12.5', '-3', (12.5, -3.0)), (None, 4, None), ('north', '3', None), (91, 0, None), (0, 181, None),
+])
+def test_parse_location(lat, lon, expected):
+    assert parse_location(lat, lon) == expected
+
+
+def test_token_bucket_charges_jobs_larger_than_the_burst_in_full():
+    bucket = TokenBucket(rate=100, burst=10)
+    start = time.monotonic()
+    bucket.acquire(30)
+    # The first job fits the full bucket; the debt it leaves delays the next one
+    assert bucket.tokens == pytest.approx(-20, abs=1)
+    bucket.acquire(1)
+    assert time.monotonic() - start >= 0.2
@@ -0,0 +1,55 @@
+import csv
+
+import pytest
+
+from knowledge_base import KnowledgeBase, build
+
+ROWS = [
+    {'DisNo.': '1', 'Disaster Type': 'Flood', 'Location': 'Houston (Texas)', 'Latitude': '29.76', 'Longitude': '-95.37',
+     'News Headlines': "['The Gypsy in Me tops the charts', 'Bayou rises after record rain']"},
+    {'DisNo.': '2', 'Disaster Type': 'Wildfire', 'Location': "Saint-Côme (Quebec)",
+     'News Headlines': "['Evacuations ordered as fire spreads']"},
+    {'DisNo.': '3', 'Disaster Type': 'Storm', 'Location': 'Svalbard', 'Latitude': '80.0', 'Longitude': '5.5',
+     'News Headlines': "['Blizzard cuts power']"},
+    {'DisNo.': '4', 'Disaster Type': 'Earthquake', 'Location': 'Fiji', 'Latitude': '-17.0', 'Longitude': '179.8',
+     'News Headlines': "[]"},
+]
+
+
+@pytest.fixture(scope='module')
+def kb(tmp_path_factory):
+    root = tmp_path_factory.mktemp('kb')
+    path = root / 'disasters.csv'
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=sorted({k for r in ROWS for k in r}))
+        writer.writeheader()
+        writer.writerows(ROWS)
+    build(str(path), str(root / 'kb'))
+    return KnowledgeBase(str(root / 'kb'))
+
+
+def test_type_and_location_matches_are_analogues(kb):
+    assert [a['id'] for a in kb.analogues("Flooding in Houston, water everywhere")][0] == '1'
+    assert [a['id'] for a in kb.analogues("wildfire near Saint-Côme")][0] == '2'
+
+
+@pytest.mark.parametrize('text', ["Can someone help me find my cat", "The Gypsy in Me", "great game tonight lol"])
+def test_unrelated_tweets_get_no_analogues(kb, text):
+    assert kb.analogues(text) == []
+
+
+def test_min_score_floor(kb):
+    assert kb.analogues("flood", min_score=1000) == []
+
+
+def test_radius_is_wide_enough_in_longitude_at_high_latitudes(kb):
+    # 5 degrees of longitude at 80N is about 97 km
+    rows, dist = kb.nearby(80.0, 0.5, radius_km=100)
+    assert list(rows) == [2]
+    assert dist[0] < 100
+    assert [a['id'] for a in kb.analogues("roads closed", lat=80.0, lon=0.5, radius_km=100)] == ['3']
+
+
+def test_radius_wraps_around_the_antimeridian(kb):
+    rows, _ = kb.nearby(-17.0, -179.9, radius_km=100)
+    assert list(rows) == [3]
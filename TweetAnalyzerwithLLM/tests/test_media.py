@@ -0,0 +1,82 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import media
+from media import MediaCatalog, build_derivative
+
+
+@pytest.fixture
+def photo(tmp_path):
+    uploads = tmp_path / 'uploads'
+    uploads.mkdir()
+    path = uploads / 'photo.png'
+    Image.effect_noise((media.MEDIA_MAX_SIDE + 200, 900), 64).convert('RGB').save(path)
+    return path
+
+
+@pytest.fixture
+def root(tmp_path):
+    path = tmp_path / 'media'
+    path.mkdir()
+    return path
+
+
+def build_concurrently(src, root, n=16):
+    with ThreadPoolExecutor(max_workers=n) as executor:
+        return list(executor.map(lambda _: build_derivative(str(src), str(root)), range(n)))
+
+
+def test_image_derivative_is_shrunk_and_cached(photo, root):
+    manifest = build_derivative(str(photo), str(root))
+    assert manifest['files'] == ['image.jpg']
+    assert manifest['derived_bytes'] < manifest['original_bytes']
+    with Image.open(root / manifest['sha256'] / 'image.jpg') as img:
+        assert max(img.size) == media.MEDIA_MAX_SIDE
+    assert build_derivative(str(photo), str(root)) == manifest
+
+
+def test_concurrent_builds_in_one_process_share_one_derivative(photo, root):
+    manifests = build_concurrently(photo, root)
+    assert all(m == manifests[0] for m in manifests)
+    assert os.listdir(root) == [manifests[0]['sha256']]
+
+
+def test_concurrent_builds_across_processes_keep_the_first_rename(photo, root, monkeypatch):
+    # A fresh lock per call behaves like builders in separate processes
+    monkeypatch.setattr(media, '_digest_lock', lambda digest: threading.Lock())
+    manifests = build_concurrently(photo, root)
+    assert all(m == manifests[0] for m in manifests)
+    assert os.listdir(root) == [manifests[0]['sha256']]
+    assert sorted(os.listdir(root / manifests[0]['sha256'])) == ['image.jpg', 'manifest.json']
+
+
+def test_video_without_ffmpeg_is_sent_as_is_and_not_cached(tmp_path, root, monkeypatch):
+    monkeypatch.setattr(media, 'FFMPEG', 'no-such-ffmpeg')
+    video = tmp_path / 'clip.mp4'
+    video.write_bytes(b'\x00' * 1024)
+    manifest = build_derivative(str(video), str(root))
+    assert manifest['files'] == []
+    assert manifest['derived_bytes'] == manifest['original_bytes'] == 1024
+    assert os.listdir(root) == []
+
+
+def test_model_files_never_reads_outside_the_upload_folder(photo, root):
+    (photo.parent.parent / 'secret.png').write_bytes(photo.read_bytes())
+    catalog = MediaCatalog(str(photo.parent), str(root), workers=1)
+    assert catalog.model_files('../secret.png') == []
+    assert catalog.model_files('photo.png') == [os.path.join(str(root), media.file_sha256(str(photo)), 'image.jpg')]
+    assert catalog.model_files('notes.txt') == [os.path.join(str(photo.parent), 'notes.txt')]
+    assert [e['name'] for e in catalog.listing()] == ['photo.png']
+
+
+def test_video_keyframes_are_labelled_and_photos_are_not():
+    video = {'type': 'video', 'files': ['frame_01.jpg', 'frame_02.jpg', 'audio.mp3']}
+    note = media.keyframe_note('clip.mp4', video)
+    assert 'next 2 images are keyframes of the video clip.mp4' in note
+    assert 'audio track' in note
+    assert 'audio' not in media.keyframe_note('clip.mp4', dict(video, files=video['files'][:2]))
+    assert media.keyframe_note('photo.png', {'type': 'image', 'files': ['image.jpg']}) is None
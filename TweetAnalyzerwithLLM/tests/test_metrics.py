@@ -0,0 +1,61 @@
+import pytest
+
+import metrics  # noqa: F401 (puts common/ on sys.path)
+from common.latency import LatencyModel
+from common.prometheus import NULL_METRIC, Registry, Span
+
+
+def test_render_uses_the_prometheus_text_format():
+    registry = Registry('svc', buckets=(0.1, 1))
+    calls = registry.counter('calls_total', "Calls", ['path'])
+    latency = registry.histogram('latency_seconds', "Latency")
+    registry.register_stats('pool', lambda: {'size': 3, 'name': 'x', 'open': True})
+    calls.inc('say "hi"')
+    latency.observe(0.5)
+    latency.observe(5)
+    text = registry.render()
+    assert 'svc_calls_total{path="say \\"hi\\""} 1' in text
+    assert 'svc_latency_seconds_bucket{le="0.1"} 0' in text
+    assert 'svc_latency_seconds_bucket{le="1"} 1' in text
+    assert 'svc_latency_seconds_bucket{le="+Inf"} 2' in text
+    assert 'svc_latency_seconds_count 2' in text
+    assert 'svc_pool_size 3' in text
+    assert 'svc_pool_name' not in text and 'svc_pool_open' not in text
+
+
+def test_failing_stats_source_is_reported_and_skipped():
+    errors = []
+    registry = Registry('svc', on_error=errors.append)
+    registry.register_stats('broken', lambda: 1 / 0)
+    assert registry.render() == '\n'
+    assert errors and 'broken' in errors[0]
+
+
+def test_span_counts_errors():
+    registry = Registry('svc', buckets=(1,))
+    seconds = registry.histogram('stage_seconds', "Stages", ['stage'])
+    errors = registry.counter('stage_errors_total', "Errors", ['stage'])
+    with pytest.raises(ValueError):
+        with Span(seconds, ('parse',), errors):
+            raise ValueError
+    assert 'svc_stage_errors_total{stage="parse"} 1' in registry.render()
+
+
+def test_disabled_registry_hands_out_no_op_metrics():
+    registry = Registry('svc', enabled=False)
+    assert registry.counter('calls_total', "Calls") is NULL_METRIC
+    registry.register_stats('pool', lambda: {'size': 3})
+    assert registry.render() == '\n'
+
+
+@pytest.mark.parametrize('spec', ['fixed:20', 'uniform:10:30', 'lognormal:20:0.5', 'exp:20'])
+def test_latency_specs_are_in_milliseconds(spec):
+    model = LatencyModel(spec)
+    samples = [model.sample() for _ in range(200)]
+    assert all(s >= 0 for s in samples)
+    assert 0.005 < sum(samples) / len(samples) < 0.05
+
+
+def test_unknown_latency_distribution_raises():
+    with pytest.raises(ValueError):
+        LatencyModel('gamma:20')
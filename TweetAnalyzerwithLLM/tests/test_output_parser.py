@@ -0,0 +1,75 @@
+import pytest
+
+from output_parser import MalformedOutput, StreamingJSONParser, parse_output, validate_triage
+
+REPLY = ('```json\n'
+         '{"Disaster_Category": "Flood", "Relevancy": True, "Priority": 2, '
+         '"media_description": "NA", "summary": "True to form, the river rose: {\\"level\\": 3}", '
+         '"responders_required": ["police", "ambulance"]}\n'
+         '```')
+
+
+def feed_in_chunks(text, size, on_field=None):
+    parser = StreamingJSONParser(on_field)
+    for i in range(0, len(text), size):
+        parser.feed(text[i:i + size])
+    return parser.result()
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, 64, len(REPLY)])
+def test_chunk_boundaries_do_not_change_the_result(size):
+    assert feed_in_chunks(REPLY, size) == parse_output(REPLY)
+
+
+def test_fences_are_ignored_and_literals_rewritten_outside_strings():
+    result = parse_output(REPLY)
+    assert result['Relevancy'] is True
+    assert result['Priority'] == 2
+    assert result['summary'] == 'True to form, the river rose: {"level": 3}'
+
+
+def test_text_after_the_closing_brace_is_ignored():
+    assert parse_output('Here you go: {"a": 1} and {"b": 2}') == {'a': 1}
+
+
+def test_fields_are_reported_as_soon_as_they_complete():
+    seen = []
+    parser = StreamingJSONParser(lambda key, value: seen.append((key, value)))
+    head, tail = REPLY.split('"media_description"')
+    parser.feed(head)
+    assert seen == [('Disaster_Category', 'Flood'), ('Relevancy', True), ('Priority', 2)]
+    parser.feed('"media_description"' + tail)
+    assert [key for key, _ in seen][-1] == 'responders_required'
+    assert not [key for key, _ in seen if key == 'summary'][1:]
+
+
+@pytest.mark.parametrize('text', ['{"Priority": 2', 'no json here', '{"Priority": 2,}'])
+def test_incomplete_or_invalid_output_raises(text):
+    with pytest.raises(MalformedOutput):
+        parse_output(text)
+
+
+def test_validate_triage_normalizes_types():
+    result = validate_triage({'Disaster_Category': 'Fire', 'Relevancy': 'true', 'Priority': '1',
+                              'responders_required': 'Firefighters '})
+    assert result['Relevancy'] is True
+    assert result['Priority'] == 1
+    assert result['responders_required'] == ['firefighters']
+    assert result['media_description'] == 'NA'
+
+
+def test_validate_triage_irrelevant_tweet_gets_priority_minus_one():
+    result = validate_triage({'Disaster_Category': 'None', 'Relevancy': False, 'Priority': 3})
+    assert result['Priority'] == -1
+
+
+@pytest.mark.parametrize('result', [
+    [],
+    {'Relevancy': True, 'Priority': 1},
+    {'Disaster_Category': 'Fire', 'Relevancy': 'maybe', 'Priority': 1},
+    {'Disaster_Category': 'Fire', 'Relevancy': True, 'Priority': 9},
+    {'Disaster_Category': 'Earthquake', 'Relevancy': True, 'Priority': 1},
+])
+def test_validate_triage_rejects_schema_violations(result):
+    with pytest.raises(MalformedOutput):
+        validate_triage(result)
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+import prefilter
+from prefilter import PreFilter, cross_validate, held_out, split_log
+
+RELEVANT = ["the river burst its banks and the bridge on {} road is gone",
+            "wildfire smoke over {} hill, flames reached the houses"]
+IRRELEVANT = ["new phone case arrived today, matches my {} shoes",
+              "the game last night at {} stadium was a fire performance"]
+
+
+def corpus(n=200):
+    texts, labels = [], []
+    for i in range(n):
+        for template, label in [(t, 1) for t in RELEVANT] + [(t, 0) for t in IRRELEVANT]:
+            texts.append(template.format(f"place{i}"))
+            labels.append(label)
+    return texts, labels
+
+
+def test_split_is_stable_and_ignores_case_and_punctuation():
+    texts, labels = corpus()
+    (train, _), (test, test_labels) = split_log(texts, labels, holdout=0.2)
+    assert not set(train) & set(test)
+    assert 0.1 < len(test) / len(texts) < 0.3
+    assert all(held_out(t.upper() + '!!', 0.2) for t in test)
+    assert len(test_labels) == len(test)
+
+
+def test_cross_validation_scores_every_tweet_out_of_fold():
+    texts, labels = corpus(50)
+    report = cross_validate(texts, labels, [0.05, 0.5], folds=4, epochs=20)
+    assert [row['threshold'] for row in report] == [0.05, 0.5]
+    assert report[1]['precision'] > 0.9
+
+
+def test_bench_times_should_skip(tmp_path, capsys, monkeypatch):
+    calls = []
+    monkeypatch.setattr(PreFilter, 'should_skip', lambda self, text, media=(): calls.append(text) or False)
+    prefilter.main(['bench', '--model', str(tmp_path / 'none.npz'), '--n', '50'])
+    assert len(calls) == 50
+    assert json.loads(capsys.readouterr().out)['tweets'] == 50
+
+
+@pytest.mark.parametrize('holdout', [0.0, 1.0])
+def test_holdout_extremes(holdout):
+    texts, labels = corpus(10)
+    (train, _), (test, _) = split_log(texts, labels, holdout=holdout)
+    assert (len(test) == len(texts)) == (holdout == 1.0)
+    assert len(train) + len(test) == len(texts)
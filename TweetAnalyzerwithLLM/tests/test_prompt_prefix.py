@@ -0,0 +1,67 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import prompt_prefix
+from prompt_prefix import PrefixCache, PromptPrefix
+
+
+class FakeCaches:
+    def __init__(self):
+        self.created = []
+        self.deleted = []
+        self.done = threading.Event()
+
+    def create(self, model, config):
+        name = f"cachedContents/{len(self.created)}"
+        self.created.append(name)
+        self.done.set()
+        return SimpleNamespace(name=name)
+
+    def update(self, name, config):
+        raise RuntimeError('expired')
+
+    def delete(self, name):
+        self.deleted.append(name)
+
+
+@pytest.fixture
+def caches(monkeypatch):
+    fake = FakeCaches()
+    monkeypatch.setattr(prompt_prefix, 'build_prefix', lambda client: PromptPrefix(
+        model='m', system_instruction='rubric', few_shot=(), estimated_tokens=5000,
+        expires_at=time.time() + 3600))
+    return fake
+
+
+def wait_for_refresh(cache):
+    with cache._refresh_lock:
+        pass
+
+
+def test_small_prefix_is_never_sent_to_caches_create(caches, monkeypatch):
+    monkeypatch.setattr(prompt_prefix, 'PREFIX_CACHE_MIN_TOKENS', 10000)
+    cache = PrefixCache(lambda: SimpleNamespace(caches=caches))
+    for _ in range(3):
+        cache.build_request([])
+        wait_for_refresh(cache)
+    assert caches.created == []
+    assert cache.build_request([])[2].cached_content is None
+
+
+def test_context_is_created_in_the_background_and_replaced_one_deleted(caches):
+    cache = PrefixCache(lambda: SimpleNamespace(caches=caches))
+    # The first request goes out inline instead of waiting for caches.create
+    assert cache.build_request([])[2].cached_content is None
+    assert caches.done.wait(5)
+    wait_for_refresh(cache)
+    assert cache.build_request([])[2].cached_content == 'cachedContents/0'
+
+    # Extending fails, so a new context is created and the old one deleted
+    cache._expires_at = time.time()
+    cache.build_request([])
+    wait_for_refresh(cache)
+    assert caches.created == ['cachedContents/0', 'cachedContents/1']
+    assert caches.deleted == ['cachedContents/0']
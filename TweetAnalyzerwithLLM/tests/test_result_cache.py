@@ -0,0 +1,76 @@
+import pytest
+
+import result_cache
+from result_cache import ResultCache
+
+TWEET = "Massive fire near the old mill on Elm Street, smoke everywhere, please send help now"
+RESULT = {'Disaster_Category': 'Fire', 'Relevancy': True, 'Priority': 2, 'summary': 'Fire on Elm Street'}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(result_cache.time, 'time', lambda: now[0])
+    return now
+
+
+def test_exact_hit_ignores_retweet_prefix_urls_and_case():
+    cache = ResultCache()
+    cache.store(TWEET, [], RESULT)
+    hit = cache.lookup("RT @someone: " + TWEET.upper() + " https://t.co/abc")
+    assert hit['Priority'] == 2
+    assert hit['cache']['hit'] == 'exact'
+    assert cache.stats()['exact_hits'] == 1
+
+
+def test_near_duplicate_hit():
+    cache = ResultCache(similarity=0.6)
+    cache.store(TWEET, [], RESULT)
+    hit = cache.lookup(TWEET + " urgently")
+    assert hit is not None
+    assert hit['cache']['hit'] == 'near'
+    assert 0.6 <= hit['cache']['similarity'] < 1
+
+
+def test_miss_for_unrelated_text_and_for_different_media(tmp_path):
+    cache = ResultCache()
+    cache.store(TWEET, [], RESULT)
+    assert cache.lookup("Lovely sunny afternoon at the beach with friends") is None
+
+    photo = tmp_path / 'photo.jpg'
+    photo.write_bytes(b'not really a jpeg')
+    assert cache.lookup(TWEET, [str(photo)]) is None
+    assert cache.stats()['lookups'] == 2
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResultCache(ttl=60)
+    cache.store(TWEET, [], RESULT)
+    clock[0] += 59
+    assert cache.lookup(TWEET) is not None
+    clock[0] += 2
+    assert cache.lookup(TWEET) is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_hits_are_copies():
+    cache = ResultCache()
+    cache.store(TWEET, [], RESULT)
+    cache.lookup(TWEET)['summary'] = 'changed'
+    assert cache.lookup(TWEET)['summary'] == RESULT['summary']
+
+
+def test_priority_one_hit_is_a_new_incident():
+    cache = ResultCache()
+    cache.store(TWEET, [], dict(RESULT, Priority=1))
+    assert cache.lookup(TWEET)['new_incident'] is True
+
+
+def test_errors_are_not_cached_and_lru_bound_holds():
+    cache = ResultCache(max_entries=2)
+    cache.store(TWEET, [], {'error': 'quota', 'Priority': -1})
+    assert cache.lookup(TWEET) is None
+    for i in range(3):
+        cache.store(f"tweet number {i} about a flood in district {i}", [], RESULT)
+    assert cache.stats()['entries'] == 2
+    assert cache.lookup("tweet number 0 about a flood in district 0") is None
@@ -0,0 +1,75 @@
+"""Run the independent model calls for a tweet concurrently.
+
+Disaster classification and sentiment classification do not depend on each
+other, so ``generate`` submits both to a shared thread pool and waits for
+them together. Per-tweet latency is then roughly max(classifier, sentiment)
+instead of their sum.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from metrics import BRANCHES
+
+# Configuration
+TRIAGE_WORKERS = int(os.environ.get('TRIAGE_WORKERS', 32))
+CLASSIFY_TIMEOUT = float(os.environ.get('CLASSIFY_TIMEOUT', 60))
+SENTIMENT_TIMEOUT = float(os.environ.get('SENTIMENT_TIMEOUT', 30))
+
+_executor = ThreadPoolExecutor(max_workers=TRIAGE_WORKERS, thread_name_prefix='triage')
+
+
+class BranchResult:
+    """Outcome of one branch: either ``value`` or ``error`` is set."""
+
+    def __init__(self, value=None, error=None, elapsed=0.0):
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _timed(fn, args):
+    start = time.perf_counter()
+    value = fn(*args)
+    return value, time.perf_counter() - start
+
+
+def run_branches(branches):
+    """Run ``{name: (fn, args, timeout)}`` concurrently.
+
+    Every branch gets its own deadline measured from submission. A branch that
+    raises or misses its deadline is reported through ``BranchResult.error``
+    so callers can still use whatever the other branches returned. Timed-out
+    calls are abandoned rather than cancelled; their thread finishes in the
+    background.
+    """
+    start = time.perf_counter()
+    futures = {
+        name: (_executor.submit(_timed, fn, args), timeout)
+        for name, (fn, args, timeout) in branches.items()
+    }
+
+    results = {}
+    for name, (future, timeout) in futures.items():
+        remaining = max(0.0, start + timeout - time.perf_counter())
+        try:
+            value, elapsed = future.result(timeout=remaining)
+            results[name] = BranchResult(value=value, elapsed=elapsed)
+            BRANCHES.inc('ok')
+        except TimeoutError:
+            future.cancel()
+            results[name] = BranchResult(error=f"{name} timed out after {timeout}s", elapsed=timeout)
+            BRANCHES.inc('timeout')
+        except Exception as e:
+            results[name] = BranchResult(error=str(e) or type(e).__name__, elapsed=time.perf_counter() - start)
+            BRANCHES.inc('error')
+    return results
+
+
+def stats():
+    # Tasks waiting for a free worker; the executor has no public accessor
+    return {'workers': TRIAGE_WORKERS, 'queued': _executor._work_queue.qsize()}
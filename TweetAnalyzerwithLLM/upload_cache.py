@@ -0,0 +1,145 @@
+"""Content-addressed cache of Files API uploads.
+
+The same disaster photo or video is re-posted thousands of times, and operators
+re-triage tweets against the same file in ``static/uploads``. Uploading it
+again each time costs bandwidth and latency, so uploads are keyed by the
+SHA-256 of the file bytes and the returned file URI is reused until it
+expires. Entries live in SQLite so they survive restarts.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from metrics import UPLOAD_BYTES, span
+
+# Configuration
+UPLOAD_CACHE_PATH = os.environ.get('UPLOAD_CACHE_PATH', 'instance/upload_cache.sqlite3')
+# The Files API deletes uploads after 48 hours, stop reusing them a bit earlier
+UPLOAD_CACHE_TTL = float(os.environ.get('UPLOAD_CACHE_TTL', 47 * 3600))
+UPLOAD_CACHE_MAX_ENTRIES = int(os.environ.get('UPLOAD_CACHE_MAX_ENTRIES', 10000))
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# uploaded_at (epoch seconds) tells callers when the Files API will delete the file
+CachedFile = namedtuple('CachedFile', ['uri', 'mime_type', 'name', 'uploaded_at'])
+
+
+def file_sha256(path, chunk_size=HASH_CHUNK_SIZE):
+    """Hash a file in fixed-size chunks so large videos never sit in memory."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """SQLite-backed LRU of ``sha256 -> uploaded file`` with a TTL."""
+
+    def __init__(self, path=UPLOAD_CACHE_PATH, ttl=UPLOAD_CACHE_TTL, max_entries=UPLOAD_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            " sha256 TEXT PRIMARY KEY, uri TEXT NOT NULL, mime_type TEXT NOT NULL, name TEXT,"
+            " uploaded_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS uploads_last_used ON uploads (last_used)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        # One lock per digest so concurrent requests for the same new file upload it once
+        self._key_locks = {}
+
+    def _key_lock(self, digest):
+        with self._lock:
+            return self._key_locks.setdefault(digest, threading.Lock())
+
+    def lookup(self, digest):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT uri, mime_type, name, uploaded_at FROM uploads WHERE sha256 = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if now - row[3] > self.ttl:
+                self._db.execute("DELETE FROM uploads WHERE sha256 = ?", (digest,))
+                self._db.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE uploads SET last_used = ? WHERE sha256 = ?", (now, digest))
+            self._db.commit()
+            self.hits += 1
+            return CachedFile(row[0], row[1], row[2], row[3])
+
+    def store(self, digest, uploaded):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, uploaded.uri, uploaded.mime_type, uploaded.name, uploaded.uploaded_at, now),
+            )
+            count = self._db.execute("SELECT COUNT(*) FROM uploads").fetchone()[0]
+            if count > self.max_entries:
+                overflow = count - self.max_entries
+                self._db.execute(
+                    "DELETE FROM uploads WHERE sha256 IN"
+                    " (SELECT sha256 FROM uploads ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            self._db.commit()
+
+    def get_or_upload(self, client, path):
+        """Return the uploaded file for ``path``, uploading only on a miss."""
+        digest = file_sha256(path)
+        with self._key_lock(digest):
+            cached = self.lookup(digest)
+            if cached is not None:
+                return cached
+
+            # The SDK sends the file as a resumable upload in 8 MB chunks
+            started = time.time()
+            with span('files_upload'):
+                uploaded = client.files.upload(file=path)
+            UPLOAD_BYTES.inc(amount=os.path.getsize(path))
+            cached = CachedFile(uploaded.uri, uploaded.mime_type, uploaded.name, started)
+            self.store(digest, cached)
+            return cached
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM uploads").fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'entries': entries,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_upload_cache():
+    """The process-wide upload cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = UploadCache()
+    return _cache
@@ -0,0 +1,261 @@
+"""Concurrent, cached news-headline lookup for the disaster rows.
+
+Replaces ``extract_climate_news`` applied row by row in ``RAG_PREP.ipynb``
+(one blocking ``requests.get`` per row, no timeout, and the literal string
+``'Location'`` as the place, so every row on the same date repeated the same
+search):
+
+- the query uses the row's own location (its states/provinces, or the
+  country), and identical (query, date) searches are made once;
+- all requests share one aiohttp connection pool with a per-host limit,
+  a timeout, and a few jittered retries on 429/5xx;
+- parsed headlines are cached on disk with a TTL, so reruns only fetch
+  what is new or expired;
+- BeautifulSoup parsing runs in a thread pool, off the event loop.
+
+``bench`` serves canned search pages from a local HTTP stand-in and reports
+rows/s, cold and from the cache:
+
+    python news_fetch.py fetch disaster_data_with_weather.csv --out disaster_data_with_weather_news.csv
+    python news_fetch.py bench disaster_data_with_weather.csv --latency-ms 300
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote_plus
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+# Configuration
+NEWS_BASE_URL = os.environ.get('NEWS_BASE_URL', 'https://news.google.com')
+NEWS_CACHE_DIR = os.environ.get('NEWS_CACHE_DIR', 'news_cache')
+NEWS_CACHE_TTL = float(os.environ.get('NEWS_CACHE_TTL', 7 * 24 * 3600))
+NEWS_POOL_SIZE = int(os.environ.get('NEWS_POOL_SIZE', 32))
+NEWS_PER_HOST = int(os.environ.get('NEWS_PER_HOST', 4))
+NEWS_TIMEOUT = float(os.environ.get('NEWS_TIMEOUT', 20))
+NEWS_PARSE_WORKERS = int(os.environ.get('NEWS_PARSE_WORKERS', 4))
+NEWS_MAX_ATTEMPTS = 3
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_PROVINCES = re.compile(r"([A-Z][\w .'-]+?) provinces?\b")
+
+
+def short_location(location, country=None):
+    """A searchable place name: the states/provinces in an EM-DAT location, else the country."""
+    if isinstance(location, str) and location.strip():
+        provinces = list(dict.fromkeys(p.strip() for p in _PROVINCES.findall(location)))
+        if provinces:
+            return ' '.join(provinces[:2])
+        return location.split(',')[0].split('(')[0].strip()
+    return country if isinstance(country, str) else ''
+
+
+def search_url(query, base_url=NEWS_BASE_URL):
+    return f"{base_url}/search?q={quote_plus(query)}&hl=en-US&gl=US&ceid=US%3Aen"
+
+
+def parse_headlines(html):
+    """Anchor texts of more than three words, as the notebook scraper kept."""
+    soup = BeautifulSoup(html, "html.parser")
+    headlines = []
+    for a in soup.find_all("a", href=True):
+        text = a.get_text().strip()
+        if text and len(text.split()) > 3:  # Exclude single words
+            headlines.append(text)
+    return headlines
+
+
+class NewsCache:
+    """One JSON file per search URL holding the parsed headlines and when they were fetched."""
+
+    def __init__(self, cache_dir=NEWS_CACHE_DIR, ttl=NEWS_CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, url):
+        try:
+            with open(self._path(url), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry['fetched_at'] > self.ttl:
+            return None
+        return entry['headlines']
+
+    def put(self, url, headlines):
+        path = self._path(url)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'url': url, 'fetched_at': time.time(), 'headlines': headlines}, f)
+        os.replace(tmp, path)
+
+
+class NewsFetcher:
+    """Fetches each distinct search once, through a shared pool and the disk cache."""
+
+    def __init__(self, base_url=NEWS_BASE_URL, cache=None, pool_size=NEWS_POOL_SIZE, per_host=NEWS_PER_HOST,
+                 timeout=NEWS_TIMEOUT, parse_workers=NEWS_PARSE_WORKERS):
+        self.base_url = base_url
+        self.cache = cache or NewsCache()
+        self.pool_size = pool_size
+        self.per_host = per_host
+        self.timeout = timeout
+        self.parser = ThreadPoolExecutor(max_workers=parse_workers)
+        self._inflight = {}
+        self.fetched = 0
+        self.cache_hits = 0
+        self.errors = 0
+
+    async def _fetch(self, session, url):
+        cached = self.cache.get(url)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        loop = asyncio.get_running_loop()
+        for attempt in range(NEWS_MAX_ATTEMPTS):
+            try:
+                async with session.get(url) as response:
+                    if response.status in RETRYABLE_STATUS and attempt + 1 < NEWS_MAX_ATTEMPTS:
+                        await asyncio.sleep(random.uniform(0, 2 ** attempt))
+                        continue
+                    response.raise_for_status()
+                    html = await response.read()
+                headlines = await loop.run_in_executor(self.parser, parse_headlines, html)
+                self.cache.put(url, headlines)
+                self.fetched += 1
+                return headlines
+            except Exception as e:
+                if attempt + 1 == NEWS_MAX_ATTEMPTS:
+                    self.errors += 1
+                    print(f"Error fetching news: {e}")
+                    return []
+                await asyncio.sleep(random.uniform(0, 2 ** attempt))
+
+    def headlines(self, session, query):
+        """Shared task per search URL, so duplicate (query, date) rows wait on one request."""
+        url = search_url(query, self.base_url)
+        if url not in self._inflight:
+            self._inflight[url] = asyncio.ensure_future(self._fetch(session, url))
+        return self._inflight[url]
+
+    async def fetch_all(self, queries):
+        """Headlines for each query, in order; ``None`` queries get an empty list."""
+        import aiohttp
+        connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.per_host)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            tasks = [self.headlines(session, q) if q else None for q in queries]
+            distinct = {id(t): t for t in tasks if t is not None}
+            await asyncio.gather(*distinct.values())
+        self._inflight.clear()
+        return [t.result() if t is not None else [] for t in tasks]
+
+    def stats(self):
+        return {'fetched': self.fetched, 'cache_hits': self.cache_hits, 'errors': self.errors}
+
+    def close(self):
+        self.parser.shutdown()
+
+
+def build_queries(df):
+    """``climate change <place> <date>`` for each row, ``None`` where the date is missing."""
+    dates = pd.to_datetime(df['Date'], errors='coerce')
+    places = [short_location(loc, country) for loc, country in zip(df['Location'], df.get('Country', [None] * len(df)))]
+    return [f"climate change {place} {date:%Y-%m-%d}" if pd.notna(date) else None
+            for place, date in zip(places, dates)]
+
+
+def add_news_column(df, fetcher=None):
+    """Return ``df`` with a ``News Headlines`` list column."""
+    fetcher = fetcher or NewsFetcher()
+    queries = build_queries(df)
+    out = df.copy()
+    out['News Headlines'] = asyncio.run(fetcher.fetch_all(queries))
+    return out
+
+
+async def start_stand_in(latency, port=0):
+    """Local stand-in for the news search page: canned HTML after ``latency`` seconds."""
+    from aiohttp import web
+
+    async def search(request):
+        await asyncio.sleep(random.uniform(0.5, 1.5) * latency)
+        q = request.query.get('q', '')
+        links = ''.join(f'<a href="/articles/{i}">Story {i} about {q} and the weather</a>' for i in range(40))
+        return web.Response(text=f"<html><body><nav><a href='/'>Home</a></nav>{links}</body></html>",
+                            content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/search', search)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+async def _bench(csv_path, latency, per_host):
+    df = pd.read_csv(csv_path)
+    queries = build_queries(df)
+    server, base_url = await start_stand_in(latency)
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for run in ('cold', 'cached'):
+                fetcher = NewsFetcher(base_url, NewsCache(cache_dir), per_host=per_host)
+                start = time.perf_counter()
+                await fetcher.fetch_all(queries)
+                elapsed = time.perf_counter() - start
+                fetcher.close()
+                print(json.dumps({
+                    'run': run,
+                    'rows': len(df),
+                    'distinct_queries': len({q for q in queries if q}),
+                    'seconds': round(elapsed, 3),
+                    'rows_per_second': round(len(df) / elapsed, 1),
+                    'per_host': per_host,
+                    'latency_ms': latency * 1000,
+                    **fetcher.stats(),
+                }))
+    finally:
+        await server.cleanup()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add news headlines to the disaster dataset.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    fetch = sub.add_parser('fetch')
+    fetch.add_argument('csv')
+    fetch.add_argument('--out', default='disaster_data_with_weather_news.csv')
+    b = sub.add_parser('bench')
+    b.add_argument('csv')
+    b.add_argument('--latency-ms', type=float, default=300)
+    b.add_argument('--per-host', type=int, default=NEWS_PER_HOST)
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        asyncio.run(_bench(args.csv, args.latency_ms / 1000, args.per_host))
+        return
+    fetcher = NewsFetcher()
+    start = time.perf_counter()
+    df = add_news_column(pd.read_csv(args.csv), fetcher)
+    fetcher.close()
+    df.to_csv(args.out, index=False)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'rows': len(df), 'seconds': round(elapsed, 3),
+                      'rows_per_second': round(len(df) / elapsed, 1), **fetcher.stats()}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""Nearest-station weather for each disaster row, vectorized and cached.
+
+Replaces the ``df.iterrows()`` weather cell in ``RAG_PREP.ipynb``, which
+searched the station list and fetched observations once per row:
+
+- the meteostat station catalog is loaded once (and cached as Parquet) into a
+  KD-tree over unit-sphere coordinates, so all rows resolve to their nearest
+  station in a single query; among the ``k`` closest, the first one whose
+  daily record covers the disaster date wins;
+- rows are grouped by station and each station's observations are fetched
+  once for the whole date range it needs, then cached as Parquet;
+- dates are built with one vectorized ``pd.to_datetime`` call.
+
+With ``offline=True`` (``--offline``) nothing is downloaded: stations and
+observations come from the cache only, and rows it does not cover get NaN.
+
+Needs ``meteostat<2`` (see ``requirements.txt``); 2.x removed ``Stations``
+and ``Daily``.
+
+Usage:
+    python weather_enrich.py public-disasters.csv --out disaster_data_with_weather.csv
+    python weather_enrich.py public-disasters.csv --out disaster_data_with_weather.csv --offline
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# Configuration
+WEATHER_CACHE_DIR = os.environ.get('WEATHER_CACHE_DIR', 'weather_cache')
+WEATHER_FETCH_WORKERS = int(os.environ.get('WEATHER_FETCH_WORKERS', 8))
+# Candidate stations per row; the nearest with data for the date is used
+NEAREST_K = 5
+EARTH_RADIUS_KM = 6371.0
+
+WEATHER_COLUMNS = {
+    'tavg': 'Temperature (C)',
+    'wspd': 'Wind Speed (km/h)',
+    'prcp': 'Precipitation (mm)',
+}
+
+
+def fetch_station_catalog():
+    """Every meteostat station with its coordinates and daily coverage."""
+    from meteostat import Stations
+    stations = Stations().fetch()
+    return stations[['latitude', 'longitude', 'daily_start', 'daily_end']]
+
+
+def fetch_daily(station_id, start, end):
+    """Daily observations for one station, indexed by date."""
+    from meteostat import Daily
+    return Daily(station_id, start=start.to_pydatetime(), end=end.to_pydatetime()).fetch()
+
+
+def build_dates(df):
+    """Disaster start dates from the Start Year/Month/Day columns, missing month/day as 1."""
+    parts = pd.DataFrame({
+        'year': pd.to_numeric(df['Start Year'], errors='coerce'),
+        'month': pd.to_numeric(df['Start Month'], errors='coerce').fillna(1),
+        'day': pd.to_numeric(df['Start Day'], errors='coerce').fillna(1),
+    })
+    return pd.to_datetime(parts, errors='coerce')
+
+
+def _unit_vectors(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+class StationIndex:
+    """KD-tree over station positions; chord distance orders like great-circle distance."""
+
+    def __init__(self, stations):
+        self.ids = stations.index.to_numpy()
+        self.daily_start = pd.to_datetime(stations['daily_start']).to_numpy()
+        self.daily_end = pd.to_datetime(stations['daily_end']).to_numpy()
+        self.tree = cKDTree(_unit_vectors(stations['latitude'].to_numpy(), stations['longitude'].to_numpy()))
+
+    def nearest(self, lat, lon, dates=None, k=NEAREST_K):
+        """Station id and distance in km for each row; rows without coordinates get ``None``."""
+        lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+        station = np.full(len(lat), None, dtype=object)
+        distance = np.full(len(lat), np.nan)
+        valid = ~(np.isnan(lat) | np.isnan(lon))
+        if not valid.any():
+            return station, distance
+
+        k = min(k, len(self.ids))
+        chord, idx = self.tree.query(_unit_vectors(lat[valid], lon[valid]), k=k)
+        chord, idx = chord.reshape(-1, k), idx.reshape(-1, k)
+        choice = np.zeros(len(idx), dtype=int)
+        if dates is not None:
+            day = np.asarray(dates, dtype='datetime64[ns]')[valid][:, None]
+            covered = (self.daily_start[idx] <= day) & (day <= self.daily_end[idx])
+            # First covering candidate, or the nearest when none covers the date
+            choice = np.where(covered.any(axis=1), covered.argmax(axis=1), 0)
+        rows = np.arange(len(idx))
+        station[valid] = self.ids[idx[rows, choice]]
+        distance[valid] = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord[rows, choice] / 2, 0, 1))
+        return station, distance
+
+
+class WeatherCache:
+    """Parquet cache of the station catalog and per-station daily observations."""
+
+    def __init__(self, cache_dir=WEATHER_CACHE_DIR, offline=False, station_fetcher=fetch_station_catalog,
+                 daily_fetcher=fetch_daily, workers=WEATHER_FETCH_WORKERS):
+        self.cache_dir = cache_dir
+        self.offline = offline
+        self.station_fetcher = station_fetcher
+        self.daily_fetcher = daily_fetcher
+        self.workers = workers
+        self.obs_dir = os.path.join(cache_dir, 'observations')
+        self.coverage_path = os.path.join(self.obs_dir, 'coverage.json')
+        os.makedirs(self.obs_dir, exist_ok=True)
+        self.coverage = {}
+        if os.path.exists(self.coverage_path):
+            with open(self.coverage_path, encoding='utf-8') as f:
+                self.coverage = json.load(f)
+        self.fetched = 0
+        self.cache_hits = 0
+        self.missing = 0
+
+    def stations(self):
+        path = os.path.join(self.cache_dir, 'stations.parquet')
+        if os.path.exists(path):
+            return pd.read_parquet(path)
+        if self.offline:
+            raise FileNotFoundError(f"No cached station catalog at {path}; run once online first")
+        stations = self.station_fetcher()
+        stations.to_parquet(path)
+        return stations
+
+    def _obs_path(self, station):
+        return os.path.join(self.obs_dir, f"{station}.parquet")
+
+    def _covered(self, station, start, end):
+        span = self.coverage.get(station)
+        return span is not None and span[0] <= start.strftime('%Y-%m-%d') and end.strftime('%Y-%m-%d') <= span[1]
+
+    def _load(self, station, start, end):
+        """``(observations, newly cached span)``; observations are ``None`` offline on a miss."""
+        if self._covered(station, start, end):
+            return pd.read_parquet(self._obs_path(station)), None
+        if self.offline:
+            return None, None
+        span = self.coverage.get(station)
+        if span is not None:
+            # Widen to what is already cached so one file keeps the whole range
+            start, end = min(start, pd.Timestamp(span[0])), max(end, pd.Timestamp(span[1]))
+        try:
+            obs = self.daily_fetcher(station, start, end)
+        except Exception as e:
+            print(f"Error fetching weather for station {station}: {e}")
+            return None, None
+        obs = obs.reindex(columns=list(WEATHER_COLUMNS))
+        obs.index = pd.to_datetime(obs.index)
+        obs.index.name = 'time'
+        obs.to_parquet(self._obs_path(station))
+        return obs, (start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+
+    def observations(self, requests):
+        """Observations for ``requests`` rows of (station, start, end), as one long frame."""
+        frames = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            loaded = pool.map(lambda r: (r[0], self._load(*r)), requests.itertuples(index=False))
+            for station, (obs, span) in loaded:
+                if span is not None:
+                    self.coverage[station] = list(span)
+                    self.fetched += 1
+                elif obs is not None:
+                    self.cache_hits += 1
+                else:
+                    self.missing += 1
+                if obs is not None:
+                    frames.append(obs.reset_index().assign(station=station))
+        # The coverage file is written from this thread only
+        with open(self.coverage_path, 'w', encoding='utf-8') as f:
+            json.dump(self.coverage, f)
+        if not frames:
+            return pd.DataFrame(columns=['station', 'time', *WEATHER_COLUMNS])
+        return pd.concat(frames, ignore_index=True)
+
+    def stats(self):
+        return {'stations_fetched': self.fetched, 'stations_from_cache': self.cache_hits,
+                'stations_missing': self.missing}
+
+
+def enrich(df, cache=None, k=NEAREST_K):
+    """Add Date, Station, distance and the weather columns to a copy of ``df``."""
+    cache = cache or WeatherCache()
+    out = df.copy()
+    out['Date'] = build_dates(out)
+    out = out.dropna(subset=['Date'])
+
+    index = StationIndex(cache.stations())
+    station, distance = index.nearest(out['Latitude'], out['Longitude'], out['Date'], k=k)
+    out['Station'] = station
+    out['Station Distance (km)'] = distance
+
+    located = out.dropna(subset=['Station'])
+    requests = located.groupby('Station')['Date'].agg(['min', 'max']).reset_index()
+    obs = cache.observations(requests)
+    obs = obs.rename(columns={'station': 'Station', 'time': 'Date', **WEATHER_COLUMNS})
+    out = out.drop(columns=[c for c in WEATHER_COLUMNS.values() if c in out.columns])
+    out = out.merge(obs[['Station', 'Date', *WEATHER_COLUMNS.values()]], on=['Station', 'Date'], how='left')
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add nearest-station weather to the disaster dataset.")
+    parser.add_argument('input')
+    parser.add_argument('--out', default='disaster_data_with_weather.csv')
+    parser.add_argument('--cache-dir', default=WEATHER_CACHE_DIR)
+    parser.add_argument('--offline', action='store_true', help="use only the cached stations and observations")
+    parser.add_argument('--workers', type=int, default=WEATHER_FETCH_WORKERS)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    cache = WeatherCache(args.cache_dir, offline=args.offline, workers=args.workers)
+    df = enrich(pd.read_csv(args.input), cache)
+    df.to_csv(args.out, index=False)
+    print(json.dumps({
+        'rows': len(df),
+        'rows_with_weather': int(df['Temperature (C)'].notna().sum()),
+        'seconds': round(time.perf_counter() - start, 3),
+        **cache.stats(),
+    }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,432 @@
+"""Resumable, rate-limited Gemini summaries for the converted satellite images.
+
+Replaces the notebook's serial ``process_images_and_create_csv`` loop, which
+built a new client and uploaded every image on each call and had to start
+over after a crash:
+
+- one shared async client, with a bounded number of requests in flight;
+- a token bucket caps requests per minute, and 429/5xx responses (of
+  uploads too) are retried with full-jitter exponential backoff;
+- images are sent inline (the JPEGs are small) and only go through the
+  Files API above ``INLINE_MAX_BYTES``;
+- every summary is appended to the CSV and flushed as soon as it arrives,
+  and a SQLite manifest records attempts and failures, so a restart skips
+  everything already in the CSV. Both writes run in a worker thread so the
+  other requests keep going while one waits on the disk. A CSV without the
+  ``Image`` column (the notebook's format) cannot be resumed and is refused.
+
+Usage:
+    python summarize_jobs.py run satellite_images --out satellite_image_summaries.csv --concurrency 8 --rpm 60
+    python summarize_jobs.py bench --images 200 --concurrency 16 --latency-ms 800 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from google import genai
+from google.genai import errors, types
+
+# Configuration
+SUMMARY_MODEL = os.environ.get('SUMMARY_MODEL', 'gemini-2.0-flash-thinking-exp-01-21')
+SUMMARY_CONCURRENCY = int(os.environ.get('SUMMARY_CONCURRENCY', 8))
+SUMMARY_RPM = float(os.environ.get('SUMMARY_RPM', 60))
+SUMMARY_MAX_ATTEMPTS = int(os.environ.get('SUMMARY_MAX_ATTEMPTS', 5))
+# The prompt asks for 2-3 paragraphs; 65k output tokens only let runaway replies run longer
+SUMMARY_MAX_OUTPUT_TOKENS = int(os.environ.get('SUMMARY_MAX_OUTPUT_TOKENS', 4096))
+INLINE_MAX_BYTES = int(os.environ.get('INLINE_MAX_BYTES', 15 * 1024 * 1024))
+PROMPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'daymet_prompt.txt')
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+
+def load_prompt(path=PROMPT_PATH):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+class AsyncTokenBucket:
+    """Allows ``rate`` acquisitions per second with bursts up to ``capacity``."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class ResumeError(Exception):
+    """The output CSV exists but is not one this script can append to."""
+
+
+class SummaryFailed(Exception):
+    """A summary that could not be produced, with the API attempts spent on it."""
+
+    def __init__(self, error, attempts):
+        super().__init__(str(error))
+        self.attempts = attempts
+
+
+def find_images(root):
+    """``(image_path, date)`` for every JPEG in the date folders under ``root``."""
+    jobs = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Tiles written by tif_convert.py are not summarized separately
+        dirnames[:] = sorted(d for d in dirnames if not d.endswith('_tiles'))
+        if dirpath == root:
+            continue
+        date = os.path.basename(dirpath)  # Folder name represents the date
+        for name in sorted(filenames):
+            if name.lower().endswith(('.jpg', '.jpeg')):
+                jobs.append((os.path.join(dirpath, name), date))
+    return jobs
+
+
+class Manifest:
+    """SQLite record of every image's status, attempts and last error."""
+
+    def __init__(self, path):
+        # Written from worker threads, one at a time
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " image TEXT PRIMARY KEY, date TEXT, status TEXT, attempts INTEGER DEFAULT 0,"
+            " error TEXT, seconds REAL, updated_at REAL)"
+        )
+        self.conn.commit()
+
+    def mark(self, image, date, status, attempts, error=None, seconds=None):
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO jobs (image, date, status, attempts, error, seconds, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(image) DO UPDATE SET status=excluded.status, attempts=jobs.attempts + excluded.attempts,"
+                " error=excluded.error, seconds=excluded.seconds, updated_at=excluded.updated_at",
+                (image, date, status, attempts, error, seconds, time.time()),
+            )
+            self.conn.commit()
+
+    def counts(self):
+        with self._lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    def close(self):
+        self.conn.close()
+
+
+class ResultWriter:
+    """Appends ``Date, Summary, Image`` rows, flushing after each one."""
+
+    HEADER = ['Date', 'Summary', 'Image']
+
+    def __init__(self, path):
+        self.done = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, newline='', encoding='utf-8') as f:
+                reader = csv.DictReader(f)
+                if reader.fieldnames != self.HEADER:
+                    # Rows without an Image cannot be matched to files, a resume would summarize them again
+                    raise ResumeError(
+                        f"{path} has columns {reader.fieldnames}, expected {self.HEADER}; "
+                        f"move it aside or pass another --out to start a new file"
+                    )
+                self.done = {row['Image'] for row in reader if row.get('Image')}
+            self.f = open(path, 'a', newline='', encoding='utf-8')
+            self.writer = csv.writer(self.f)
+        else:
+            self.f = open(path, 'w', newline='', encoding='utf-8')
+            self.writer = csv.writer(self.f)
+            self.writer.writerow(self.HEADER)
+
+    def write(self, date, summary, image):
+        """Append and fsync one row; blocking, run it in a worker thread."""
+        with self._lock:
+            self.writer.writerow([date, summary, image])
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.done.add(image)
+
+    def close(self):
+        self.f.close()
+
+
+class SummaryRunner:
+    """Summarizes images with bounded concurrency, a rate limit and retries."""
+
+    def __init__(self, client, prompt, model=SUMMARY_MODEL, concurrency=SUMMARY_CONCURRENCY, rpm=SUMMARY_RPM,
+                 max_attempts=SUMMARY_MAX_ATTEMPTS, max_output_tokens=SUMMARY_MAX_OUTPUT_TOKENS):
+        self.client = client
+        self.prompt = prompt
+        self.model = model
+        self.concurrency = concurrency
+        self.bucket = AsyncTokenBucket(rpm / 60.0)
+        self.max_attempts = max_attempts
+        self.config = types.GenerateContentConfig(
+            temperature=0.7,
+            top_p=0.95,
+            top_k=64,
+            max_output_tokens=max_output_tokens,
+            response_mime_type="text/plain",
+        )
+        self.retries = 0
+        self.latencies = []
+
+    async def _image_part(self, image_path, retrying):
+        if os.path.getsize(image_path) <= INLINE_MAX_BYTES:
+            # Off the event loop, so one slow disk read does not stall the other workers
+            data = await asyncio.to_thread(_read_bytes, image_path)
+            return types.Part.from_bytes(data=data, mime_type='image/jpeg')
+        uploaded = await retrying(lambda: self.client.aio.files.upload(file=image_path))
+        return types.Part.from_uri(file_uri=uploaded.uri, mime_type=uploaded.mime_type)
+
+    async def summarize(self, image_path, date):
+        """One summary and the API attempts it took; uploads and calls are retried on 429/5xx."""
+        attempts = 0
+
+        async def retrying(call, rate_limited=False):
+            nonlocal attempts
+            for attempt in range(self.max_attempts):
+                if rate_limited:
+                    await self.bucket.acquire()
+                attempts += 1
+                try:
+                    return await call()
+                except errors.APIError as e:
+                    if e.code not in RETRYABLE_CODES or attempt + 1 == self.max_attempts:
+                        raise
+                    self.retries += 1
+                    await asyncio.sleep(backoff_delay(attempt))
+
+        async def generate(contents):
+            start = time.perf_counter()
+            response = await self.client.aio.models.generate_content(
+                model=self.model, contents=contents, config=self.config
+            )
+            self.latencies.append(time.perf_counter() - start)
+            return response
+
+        try:
+            contents = [
+                types.Content(
+                    role="user",
+                    parts=[
+                        await self._image_part(image_path, retrying),
+                        types.Part.from_text(text=self.prompt + f"\n\nDate of the image Capture: {date}"),
+                    ],
+                )
+            ]
+            response = await retrying(lambda: generate(contents), rate_limited=True)
+        except Exception as e:
+            raise SummaryFailed(e, attempts) from e
+        return response.text or '', attempts
+
+    async def run(self, jobs, results, manifest):
+        queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        counts = {'done': 0, 'failed': 0}
+
+        async def worker():
+            while not queue.empty():
+                image, date = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    summary, attempts = await self.summarize(image, date)
+                except SummaryFailed as e:
+                    counts['failed'] += 1
+                    await asyncio.to_thread(manifest.mark, image, date, 'failed', e.attempts, str(e),
+                                            time.perf_counter() - start)
+                    print(f"Error processing {image}: {e}")
+                    continue
+                # CSV first: it is what a restart trusts, the manifest is bookkeeping
+                await asyncio.to_thread(results.write, date, summary, image)
+                await asyncio.to_thread(manifest.mark, image, date, 'done', attempts, None,
+                                        time.perf_counter() - start)
+                counts['done'] += 1
+                print(f"Processed: {image}, Date: {date}")
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(jobs)) or 1)))
+        return counts
+
+
+async def process_images(client, satellite_images_path, output_csv_file, prompt=None, manifest_path=None, **options):
+    """Summarize every image not yet in ``output_csv_file``; safe to rerun after a crash."""
+    results = ResultWriter(output_csv_file)
+    manifest = Manifest(manifest_path or os.path.splitext(output_csv_file)[0] + '.manifest.sqlite3')
+    runner = SummaryRunner(client, prompt or load_prompt(), **options)
+    try:
+        all_jobs = find_images(satellite_images_path)
+        jobs = [(image, date) for image, date in all_jobs if image not in results.done]
+        start = time.perf_counter()
+        counts = await runner.run(jobs, results, manifest)
+        elapsed = time.perf_counter() - start
+    finally:
+        results.close()
+        manifest.close()
+
+    latencies = sorted(runner.latencies)
+    return {
+        'images': len(all_jobs),
+        'skipped': len(all_jobs) - len(jobs),
+        **counts,
+        'retries': runner.retries,
+        'seconds': round(elapsed, 3),
+        'images_per_minute': round(counts['done'] / elapsed * 60, 1) if elapsed else None,
+        'p50_latency_s': round(latencies[len(latencies) // 2], 3) if latencies else None,
+    }
+
+
+def make_client(base_url=None):
+    """The client shared by every request of a run; ``base_url`` points it at the fake server."""
+    if base_url:
+        return genai.Client(api_key='fake-key', http_options=types.HttpOptions(base_url=base_url))
+    return genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+
+
+async def start_fake_server(latency, error_rate, port=0):
+    """A local stand-in for the Gemini API: generateContent and Files uploads.
+
+    Each generateContent call sleeps around ``latency`` seconds and fails with
+    429 RESOURCE_EXHAUSTED with probability ``error_rate``.
+    """
+    from aiohttp import web
+
+    uploads = {'next': 0}
+
+    async def generate(request):
+        await request.read()
+        await asyncio.sleep(random.lognormvariate(0, 0.25) * latency)
+        if random.random() < error_rate:
+            return web.json_response(
+                {"error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}},
+                status=429,
+            )
+        text = "The image looks consistent with the season. Temperatures follow the expected gradient."
+        return web.json_response({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": 1500, "candidatesTokenCount": 60, "totalTokenCount": 1560},
+        })
+
+    async def upload(request):
+        await request.read()
+        command = request.headers.get('x-goog-upload-command', '')
+        if command == 'start':
+            uploads['next'] += 1
+            url = f"{request.scheme}://{request.host}/upload/v1beta/files?upload_id={uploads['next']}"
+            return web.json_response({}, headers={"x-goog-upload-url": url})
+        name = f"files/fake-{request.query.get('upload_id', 0)}"
+        return web.json_response(
+            {"file": {"name": name, "uri": f"{request.scheme}://{request.host}/v1beta/{name}",
+                      "mimeType": "image/jpeg", "state": "ACTIVE"}},
+            headers={"x-goog-upload-status": "final"},
+        )
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post('/upload/v1beta/files', upload)
+    app.router.add_post('/v1beta/models/{tail:.*}', generate)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def make_images(folder, count):
+    from PIL import Image
+    for i in range(count):
+        day = os.path.join(folder, f"{1981 + i // 12}-{i % 12 + 1:02d}")
+        os.makedirs(day, exist_ok=True)
+        Image.new('RGB', (512, 512), (i % 256, 80, 160)).save(os.path.join(day, 'image_NASA.jpg'))
+
+
+async def _bench(images, concurrency, rpm, latency, error_rate):
+    server, base_url = await start_fake_server(latency, error_rate)
+    client = make_client(base_url)
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            make_images(os.path.join(folder, 'satellite_images'), images)
+            out = os.path.join(folder, 'summaries.csv')
+            for run in ('cold', 'restart'):
+                report = await process_images(client, os.path.join(folder, 'satellite_images'), out,
+                                              prompt='Describe the image.', concurrency=concurrency, rpm=rpm)
+                report.update({'run': run, 'concurrency': concurrency, 'rpm': rpm,
+                               'latency_ms': latency * 1000, 'error_rate': error_rate})
+                print(json.dumps(report))
+    finally:
+        await client.aio.aclose()
+        await server.cleanup()
+
+
+async def _run(args):
+    client = make_client(args.base_url)
+    try:
+        report = await process_images(client, args.root, args.out, concurrency=args.concurrency, rpm=args.rpm,
+                                      model=args.model, max_output_tokens=args.max_output_tokens)
+    finally:
+        await client.aio.aclose()
+    print(json.dumps(report))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize satellite images with Gemini, resumably.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run')
+    run.add_argument('root', nargs='?', default='satellite_images')
+    run.add_argument('--out', default='satellite_image_summaries.csv')
+    run.add_argument('--concurrency', type=int, default=SUMMARY_CONCURRENCY)
+    run.add_argument('--rpm', type=float, default=SUMMARY_RPM)
+    run.add_argument('--model', default=SUMMARY_MODEL)
+    run.add_argument('--max-output-tokens', type=int, default=SUMMARY_MAX_OUTPUT_TOKENS)
+    run.add_argument('--base-url', help="send requests to this server instead of the Gemini API")
+    bench = sub.add_parser('bench')
+    bench.add_argument('--images', type=int, default=200)
+    bench.add_argument('--concurrency', type=int, default=16)
+    bench.add_argument('--rpm', type=float, default=6000)
+    bench.add_argument('--latency-ms', type=float, default=800)
+    bench.add_argument('--error-rate', type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        print(f"Benchmarking {args.images} images against a local fake model server")
+        asyncio.run(_bench(args.images, args.concurrency, args.rpm, args.latency_ms / 1000, args.error_rate))
+    else:
+        try:
+            asyncio.run(_run(args))
+        except ResumeError as e:
+            parser.exit(1, f"{e}\n")
+
+
+if __name__ == '__main__':
+    main()
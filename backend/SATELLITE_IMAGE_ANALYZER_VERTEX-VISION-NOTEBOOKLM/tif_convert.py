@@ -0,0 +1,456 @@
+"""Convert the satellite GeoTIFFs to JPEGs for Gemini, in parallel.
+
+Replaces ``convert_tif_to_jpg``/``process_folder`` from the notebook:
+
+- files are converted in a process pool, one file per worker;
+- with rasterio installed, rasters are read in row strips aligned to the
+  TIFF blocks and tiles window by window, so the source bands are never fully
+  in memory, and ``--max-side`` reads a decimated copy straight from the
+  overviews instead of decoding the full scene;
+- the full-scene JPEG is assembled strip by strip in one 8-bit image (no
+  JPEG encoder at hand writes scanlines incrementally: GDAL's driver buffers
+  the whole image too), so it is capped at ``FULL_JPEG_MAX_SIDE`` pixels and
+  larger scenes get a decimated JPEG; their tiles keep full resolution;
+- a manifest of source size, mtime and SHA-256 skips files whose outputs are
+  up to date, including re-downloaded copies that only got a new mtime;
+- ``--tile-size`` also cuts the image into tiles downscaled to
+  ``--model-side`` pixels for the vision model.
+
+Without rasterio, Pillow decodes each file whole, as the notebook did.
+
+Usage:
+    python tif_convert.py convert satellite_images --workers 8 --tile-size 2048
+    python tif_convert.py bench --files 16 --size 2048
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+
+try:
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.windows import Window
+except ImportError:
+    rasterio = None
+
+# Configuration
+CONVERT_WORKERS = int(os.environ.get('CONVERT_WORKERS', os.cpu_count() or 1))
+# Rows per windowed read are chosen so one strip of source data stays under this
+STRIP_BYTES = int(os.environ.get('STRIP_BYTES', 64 * 1024 * 1024))
+# Gemini tiles images into 768x768 blocks
+MODEL_SIDE = 768
+# Longest side of the full-scene JPEG, which is held in memory once while it is encoded
+FULL_JPEG_MAX_SIDE = int(os.environ.get('FULL_JPEG_MAX_SIDE', 8192))
+JPEG_QUALITY = 90
+MANIFEST_NAME = '.tif_convert.json'
+TIF_EXTENSIONS = ('.tif', '.tiff')
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _valid(data, nodata):
+    valid = np.isfinite(data) if data.dtype.kind == 'f' else np.ones(data.shape, dtype=bool)
+    if nodata is not None:
+        valid &= data != nodata
+    return valid
+
+
+def _value_range(data, nodata):
+    values = data[_valid(data, nodata)]
+    if values.size == 0:
+        return None
+    return float(values.min()), float(values.max())
+
+
+def _merge_range(a, b):
+    if a is None or b is None:
+        return a or b
+    return min(a[0], b[0]), max(a[1], b[1])
+
+
+def to_rgb(data, value_range, nodata=None):
+    """Scale a ``(bands, rows, cols)`` array to an 8-bit ``(rows, cols, 3)`` RGB array.
+
+    8-bit data is used as is. Anything else (Daymet bands are float32) is
+    stretched linearly over ``value_range``; nodata and NaN become black.
+    """
+    bands = data[:3] if data.shape[0] >= 3 else data[:1]
+    if bands.dtype != np.uint8:
+        lo, hi = value_range or (0.0, 0.0)
+        scale = 255.0 / (hi - lo) if hi > lo else 0.0
+        valid = _valid(bands, nodata)
+        # In place, so a strip costs one float32 copy rather than one per operation
+        scaled = bands.astype(np.float32)
+        scaled -= lo
+        scaled *= scale
+        np.clip(scaled, 0, 255, out=scaled)
+        scaled[~valid] = 0
+        bands = scaled.astype(np.uint8)
+    if bands.shape[0] == 1:
+        bands = np.repeat(bands, 3, axis=0)
+    return np.ascontiguousarray(bands.transpose(1, 2, 0))
+
+
+class _RasterioReader:
+    """Windowed reads through GDAL; only one strip is decoded at a time."""
+
+    def __init__(self, path):
+        self.src = rasterio.open(path)
+        self.width, self.height = self.src.width, self.src.height
+        self.indexes = [1, 2, 3] if self.src.count >= 3 else [1]
+        self.dtype = np.dtype(self.src.dtypes[0])
+        self.nodata = self.src.nodata
+
+    def strips(self):
+        block_rows = self.src.block_shapes[0][0]
+        row_bytes = self.width * len(self.indexes) * self.dtype.itemsize
+        rows = max(block_rows, STRIP_BYTES // row_bytes // block_rows * block_rows)
+        for row in range(0, self.height, rows):
+            window = Window(0, row, self.width, min(rows, self.height - row))
+            yield row, self.src.read(self.indexes, window=window)
+
+    def read_window(self, row, col, rows, cols):
+        return self.src.read(self.indexes, window=Window(col, row, cols, rows))
+
+    def read_decimated(self, rows, cols):
+        return self.src.read(self.indexes, out_shape=(len(self.indexes), rows, cols),
+                             resampling=Resampling.average)
+
+    def decimated_strips(self, rows, cols):
+        """``read_decimated`` in row strips, each resampled from its own source window."""
+        row_bytes = cols * len(self.indexes) * self.dtype.itemsize
+        step = max(1, STRIP_BYTES // row_bytes)
+        scale = self.height / rows
+        for row in range(0, rows, step):
+            n = min(step, rows - row)
+            window = Window(0, row * scale, self.width, n * scale)
+            yield row, self.src.read(self.indexes, window=window, out_shape=(len(self.indexes), n, cols),
+                                     resampling=Resampling.average)
+
+    def close(self):
+        self.src.close()
+
+
+class _PILReader:
+    """Fallback when rasterio is not installed: the whole file is decoded."""
+
+    def __init__(self, path):
+        with Image.open(path) as img:
+            data = np.asarray(img)
+        self.data = data[None] if data.ndim == 2 else data.transpose(2, 0, 1)
+        self.height, self.width = self.data.shape[1:]
+        self.dtype = self.data.dtype
+        self.nodata = None
+
+    def strips(self):
+        yield 0, self.data
+
+    def read_window(self, row, col, rows, cols):
+        return self.data[:, row:row + rows, col:col + cols]
+
+    def read_decimated(self, rows, cols):
+        resized = [np.asarray(Image.fromarray(band).resize((cols, rows), Image.BOX)) for band in self.data[:3]]
+        return np.stack(resized)
+
+    def decimated_strips(self, rows, cols):
+        yield 0, self.read_decimated(rows, cols)
+
+    def close(self):
+        self.data = None
+
+
+def open_raster(path):
+    return _RasterioReader(path) if rasterio is not None else _PILReader(path)
+
+
+def _save_jpeg(image, path, quality):
+    # Write to a temporary name so an interrupted run never leaves a truncated JPEG
+    tmp = path + '.tmp'
+    image.save(tmp, format='JPEG', quality=quality)
+    os.replace(tmp, path)
+
+
+def _decimated_size(reader, max_side):
+    scale = max_side / max(reader.width, reader.height)
+    return max(1, round(reader.height * scale)), max(1, round(reader.width * scale))
+
+
+def scene_image(reader, value_range, max_side=FULL_JPEG_MAX_SIDE):
+    """The scene as one RGB image, pasted strip by strip; larger than ``max_side`` it is read decimated."""
+    if max(reader.width, reader.height) > max_side:
+        rows, cols = _decimated_size(reader, max_side)
+        strips = reader.decimated_strips(rows, cols)
+    else:
+        rows, cols = reader.height, reader.width
+        strips = reader.strips()
+    image = Image.new('RGB', (cols, rows))
+    for row, strip in strips:
+        image.paste(Image.fromarray(to_rgb(strip, value_range, reader.nodata)), (0, row))
+    return image
+
+
+def tile_dir(jpg_path):
+    return os.path.splitext(jpg_path)[0] + '_tiles'
+
+
+def convert_file(tif_path, jpg_path, max_side=None, tile_size=None, model_side=MODEL_SIDE, quality=JPEG_QUALITY):
+    """Convert one GeoTIFF; returns the source hash and the files written."""
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(jpg_path) or '.', exist_ok=True)
+    outputs = [jpg_path]
+    tiles = tile_dir(jpg_path)
+    if tile_size:
+        os.makedirs(tiles, exist_ok=True)
+
+    reader = open_raster(tif_path)
+    try:
+        if max_side and max(reader.width, reader.height) > max_side:
+            # Small enough to tile in memory
+            data = reader.read_decimated(*_decimated_size(reader, max_side))
+            rgb = to_rgb(data, _value_range(data, reader.nodata), reader.nodata)
+            _save_jpeg(Image.fromarray(rgb), jpg_path, quality)
+            height, width = rgb.shape[:2]
+
+            def read_tile(r, c):
+                return rgb[r:r + tile_size, c:c + tile_size]
+        else:
+            value_range = None
+            if reader.dtype != np.uint8:
+                # First pass over the strips for the stretch, then the JPEG and the tiles
+                for _, strip in reader.strips():
+                    value_range = _merge_range(value_range, _value_range(strip, reader.nodata))
+            _save_jpeg(scene_image(reader, value_range), jpg_path, quality)
+            height, width = reader.height, reader.width
+
+            def read_tile(r, c):
+                window = reader.read_window(r, c, min(tile_size, height - r), min(tile_size, width - c))
+                return to_rgb(window, value_range, reader.nodata)
+
+        if tile_size:
+            for r in range(0, height, tile_size):
+                for c in range(0, width, tile_size):
+                    tile = Image.fromarray(read_tile(r, c))
+                    tile.thumbnail((model_side, model_side), Image.LANCZOS)
+                    path = os.path.join(tiles, f"r{r // tile_size:03d}_c{c // tile_size:03d}.jpg")
+                    _save_jpeg(tile, path, quality)
+                    outputs.append(path)
+    finally:
+        reader.close()
+
+    return {
+        'source': tif_path,
+        'sha256': file_sha256(tif_path),
+        'outputs': outputs,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def find_tifs(root):
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if name.lower().endswith(TIF_EXTENSIONS):
+                yield os.path.join(dirpath, name)
+
+
+def output_path(tif_path, root, out_dir=None):
+    """``foo.tif`` becomes ``foo.jpg`` next to it, or under ``out_dir`` with the same layout."""
+    stem = os.path.splitext(tif_path)[0]
+    if out_dir:
+        stem = os.path.join(out_dir, os.path.relpath(stem, root))
+    return stem + '.jpg'
+
+
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(path, manifest):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _up_to_date(entry, tif_path, options):
+    """True when the outputs recorded for this source are still valid."""
+    if not entry or entry.get('options') != options:
+        return False
+    if not all(os.path.exists(p) for p in entry['outputs']):
+        return False
+    st = os.stat(tif_path)
+    if (entry['size'], entry['mtime_ns']) == (st.st_size, st.st_mtime_ns):
+        return True
+    # Same bytes with a new mtime, e.g. downloaded again from the bucket
+    if entry['size'] == st.st_size and file_sha256(tif_path) == entry['sha256']:
+        entry['mtime_ns'] = st.st_mtime_ns
+        return True
+    return False
+
+
+def convert_tree(root, out_dir=None, workers=CONVERT_WORKERS, max_side=None, tile_size=None,
+                 model_side=MODEL_SIDE, quality=JPEG_QUALITY, force=False):
+    """Convert every GeoTIFF under ``root``, skipping the ones already done."""
+    manifest_path = os.path.join(out_dir or root, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    options = {'max_side': max_side, 'tile_size': tile_size, 'model_side': model_side, 'quality': quality,
+               'full_jpeg_max_side': FULL_JPEG_MAX_SIDE}
+
+    jobs, skipped = [], 0
+    for tif in find_tifs(root):
+        key = os.path.relpath(tif, root)
+        if not force and _up_to_date(manifest.get(key), tif, options):
+            skipped += 1
+            continue
+        jobs.append((key, tif, output_path(tif, root, out_dir)))
+
+    converted, failed = 0, 0
+
+    def record(key, tif, result):
+        st = os.stat(tif)
+        manifest[key] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': result['sha256'],
+                         'options': options, 'outputs': result['outputs']}
+
+    try:
+        if workers <= 1:
+            for key, tif, jpg in jobs:
+                try:
+                    record(key, tif, convert_file(tif, jpg, max_side, tile_size, model_side, quality))
+                    converted += 1
+                    print(f"Converted {tif} to {jpg}")
+                except Exception as e:
+                    failed += 1
+                    print(f"Error converting {tif}: {e}")
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(convert_file, tif, jpg, max_side, tile_size, model_side, quality): (key, tif, jpg)
+                    for key, tif, jpg in jobs
+                }
+                for future in as_completed(futures):
+                    key, tif, jpg = futures[future]
+                    try:
+                        record(key, tif, future.result())
+                        converted += 1
+                        print(f"Converted {tif} to {jpg}")
+                    except Exception as e:
+                        failed += 1
+                        print(f"Error converting {tif}: {e}")
+    finally:
+        if converted or skipped:
+            save_manifest(manifest_path, manifest)
+
+    return {'converted': converted, 'skipped': skipped, 'failed': failed}
+
+
+def peak_rss_mb():
+    """Peak RSS of this process and of its largest finished child, in MB."""
+    # ru_maxrss is in kilobytes on Linux
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def make_synthetic(folder, files, size):
+    """Write ``files`` single-band float32 GeoTIFF-like scenes of ``size`` x ``size``."""
+    rng = np.random.default_rng(0)
+    axis = np.linspace(0, 1, size, dtype=np.float32)
+    base = 60 * axis[None, :] - 30 * axis[:, None] - 10
+    for i in range(files):
+        day = os.path.join(folder, f"2024-01-{i % 28 + 1:02d}")
+        os.makedirs(day, exist_ok=True)
+        scene = base + 2 * rng.standard_normal(base.shape, dtype=np.float32)
+        Image.fromarray(scene, mode='F').save(os.path.join(day, f"tmax_{i:03d}.tif"))
+
+
+def bench(files, size, workers_list, tile_size):
+    with tempfile.TemporaryDirectory() as folder:
+        # Generated in a child: Linux keeps ru_maxrss across exec, so a big
+        # parent would inflate the peak RSS reported by every run below
+        maker = multiprocessing.Process(target=make_synthetic, args=(folder, files, size))
+        maker.start()
+        maker.join()
+        for workers in workers_list:
+            for force in (True, False):
+                # Each run in a fresh process so peak RSS is per run
+                cmd = [sys.executable, __file__, 'convert', folder, '--workers', str(workers), '--json', '--quiet']
+                if tile_size:
+                    cmd += ['--tile-size', str(tile_size)]
+                if force:
+                    cmd.append('--force')
+                report = json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout.splitlines()[-1])
+                report.update({'files': files, 'size': size, 'workers': workers, 'run': 'cold' if force else 'up-to-date'})
+                print(json.dumps(report))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert satellite GeoTIFFs to JPEG in parallel.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    convert = sub.add_parser('convert')
+    convert.add_argument('root', nargs='?', default='satellite_images')
+    convert.add_argument('--out-dir', help="write JPEGs here, mirroring the folder layout, instead of next to the TIFFs")
+    convert.add_argument('--workers', type=int, default=CONVERT_WORKERS)
+    convert.add_argument('--max-side', type=int, help="downscale the JPEG so its longest side is at most this")
+    convert.add_argument('--tile-size', type=int, help="also cut tiles of this many pixels, downscaled to --model-side")
+    convert.add_argument('--model-side', type=int, default=MODEL_SIDE)
+    convert.add_argument('--quality', type=int, default=JPEG_QUALITY)
+    convert.add_argument('--force', action='store_true', help="convert even when outputs are up to date")
+    convert.add_argument('--json', action='store_true', help="print a JSON summary line at the end")
+    convert.add_argument('--quiet', action='store_true')
+    b = sub.add_parser('bench')
+    b.add_argument('--files', type=int, default=16)
+    b.add_argument('--size', type=int, default=2048)
+    b.add_argument('--workers', default=f"1,{CONVERT_WORKERS}")
+    b.add_argument('--tile-size', type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        bench(args.files, args.size, [int(w) for w in args.workers.split(',')], args.tile_size)
+        return
+
+    if args.quiet:
+        sys.stdout = open(os.devnull, 'w')
+    start = time.perf_counter()
+    try:
+        summary = convert_tree(args.root, args.out_dir, args.workers, args.max_side, args.tile_size,
+                               args.model_side, args.quality, args.force)
+    finally:
+        if args.quiet:
+            sys.stdout.close()
+            sys.stdout = sys.__stdout__
+    elapsed = time.perf_counter() - start
+    summary.update({
+        'seconds': round(elapsed, 3),
+        'files_per_second': round(summary['converted'] / elapsed, 2) if elapsed else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'rasterio': rasterio is not None,
+    })
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(f"Converted {summary['converted']}, skipped {summary['skipped']} up to date, "
+              f"{summary['failed']} failed in {summary['seconds']}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""Audio path between a Twilio media stream and a Gemini Live session.
+
+Twilio sends one JSON message per 20 ms of 8 kHz mu-law audio. Forwarding
+each of those to Gemini as-is means fifty tiny base64 sends a second per call
+with no flow control. ``AudioBridge`` instead:
+
+- decodes mu-law to 16-bit PCM once, into a reusable chunk buffer;
+- coalesces frames into ``AUDIO_CHUNK_MS`` chunks before sending;
+- hands chunks to the sender task through a bounded queue, dropping the
+  oldest chunk (or blocking, see ``AUDIO_QUEUE_POLICY``) when Gemini falls
+  behind, so a slow session never grows memory without bound;
+- records per-call queueing latency and inter-arrival jitter.
+
+Recorded Twilio websocket messages (one JSON message per line) or synthetic
+calls can be replayed through the bridge against a fake Live session:
+
+    python audio.py --calls 50 --seconds 30 --send-latency-ms 40
+    python audio.py --replay twilio_frames.jsonl
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+import warnings
+
+from google.genai import types
+
+from fake_backend import FakeLiveSession
+from metrics import (AUDIO_BYTES, AUDIO_CHUNK_SECONDS, AUDIO_CHUNKS, AUDIO_FRAMES, AUDIO_QUEUED,
+                     span)
+
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        import audioop
+except ImportError:  # Python 3.13+
+    audioop = None
+
+# Configuration
+AUDIO_CHUNK_MS = int(os.getenv('AUDIO_CHUNK_MS', 100))
+AUDIO_QUEUE_SIZE = int(os.getenv('AUDIO_QUEUE_SIZE', 50))
+# 'drop_oldest' keeps the call live when Gemini lags, 'block' applies backpressure
+AUDIO_QUEUE_POLICY = os.getenv('AUDIO_QUEUE_POLICY', 'drop_oldest')
+
+TWILIO_SAMPLE_RATE = 8000
+TWILIO_FRAME_MS = 20
+PCM_MIME_TYPE = f"audio/pcm;rate={TWILIO_SAMPLE_RATE}"
+
+
+def _ulaw_to_linear(u):
+    u = ~u & 0xFF
+    sample = (((u & 0x0F) << 3) + 0x84) << ((u >> 4) & 0x07)
+    sample -= 0x84
+    return -sample if u & 0x80 else sample
+
+
+# 2-byte little-endian PCM for each of the 256 mu-law codes
+_ULAW_PCM = [(_ulaw_to_linear(u) & 0xFFFF).to_bytes(2, 'little') for u in range(256)]
+
+
+def ulaw_to_pcm16(data):
+    """Decode G.711 mu-law bytes to 16-bit little-endian PCM."""
+    if audioop is not None:
+        return audioop.ulaw2lin(data, 2)
+    return b''.join(map(_ULAW_PCM.__getitem__, data))
+
+
+class StreamMetrics:
+    """Latency and jitter counters for one call."""
+
+    def __init__(self):
+        self.frames_in = 0
+        self.chunks_out = 0
+        self.dropped = 0
+        self.bytes_out = 0
+        self.latencies = []
+        self.jitter = 0.0
+        self.max_queue_depth = 0
+        self._last_arrival = None
+
+    def frame_arrived(self, now):
+        self.frames_in += 1
+        AUDIO_FRAMES.inc()
+        if self._last_arrival is not None:
+            # RFC 3550 style running jitter against the nominal 20 ms spacing
+            deviation = abs((now - self._last_arrival) - TWILIO_FRAME_MS / 1000)
+            self.jitter += (deviation - self.jitter) / 16
+        self._last_arrival = now
+
+    def chunk_sent(self, queued_at, size):
+        latency = time.perf_counter() - queued_at
+        self.chunks_out += 1
+        self.bytes_out += size
+        self.latencies.append(latency)
+        AUDIO_CHUNKS.inc('sent')
+        AUDIO_BYTES.inc(amount=size)
+        AUDIO_CHUNK_SECONDS.observe(latency)
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+
+        def pct(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3) if latencies else 0.0
+
+        return {
+            'frames_in': self.frames_in,
+            'chunks_out': self.chunks_out,
+            'dropped_chunks': self.dropped,
+            'bytes_out': self.bytes_out,
+            'send_latency_p50_ms': pct(0.50),
+            'send_latency_p95_ms': pct(0.95),
+            'jitter_ms': round(self.jitter * 1000, 3),
+            'max_queue_depth': self.max_queue_depth,
+        }
+
+
+class AudioBridge:
+    """Decodes, coalesces and forwards Twilio audio to a Live session."""
+
+    def __init__(self, session, chunk_ms=AUDIO_CHUNK_MS, queue_size=AUDIO_QUEUE_SIZE, policy=AUDIO_QUEUE_POLICY):
+        self.session = session
+        self.policy = policy
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.metrics = StreamMetrics()
+        self.stream_sid = None
+        self.call_sid = None
+        self.stopped = False
+        self._closed = False
+        frames_per_chunk = max(1, chunk_ms // TWILIO_FRAME_MS)
+        # 160 mu-law bytes per frame become 320 bytes of PCM
+        self._buffer = bytearray(frames_per_chunk * TWILIO_SAMPLE_RATE * TWILIO_FRAME_MS // 1000 * 2)
+        self._fill = 0
+        self._chunk_started = None
+
+    async def handle_message(self, message):
+        """Process one Twilio websocket message; returns its event name."""
+        data = json.loads(message)
+        event = data.get('event')
+        if event == 'media':
+            await self.add_frame(data['media']['payload'])
+        elif event == 'start':
+            self.stream_sid = data.get('streamSid') or data['start'].get('streamSid')
+            self.call_sid = data['start'].get('callSid')
+        elif event == 'stop':
+            await self.close()
+        return event
+
+    async def close(self):
+        """Flush the partial chunk and tell the sender the stream has ended."""
+        if not self._closed:
+            self._closed = True
+            await self.flush()
+            await self.queue.put(None)
+
+    async def add_frame(self, payload):
+        now = time.perf_counter()
+        self.metrics.frame_arrived(now)
+        pcm = ulaw_to_pcm16(base64.b64decode(payload))
+        if self._chunk_started is None:
+            self._chunk_started = now
+        while pcm:
+            room = len(self._buffer) - self._fill
+            self._buffer[self._fill:self._fill + min(room, len(pcm))] = pcm[:room]
+            self._fill += min(room, len(pcm))
+            pcm = pcm[room:]
+            if self._fill == len(self._buffer):
+                await self.flush()
+
+    async def flush(self):
+        if self._fill:
+            chunk = bytes(self._buffer[:self._fill])
+            self._fill = 0
+            started, self._chunk_started = self._chunk_started, None
+            await self._enqueue((chunk, started))
+
+    async def _enqueue(self, item):
+        if self.policy == 'drop_oldest':
+            while self.queue.full():
+                self.queue.get_nowait()
+                self.metrics.dropped += 1
+                AUDIO_CHUNKS.inc('dropped')
+                AUDIO_QUEUED.dec()
+        await self.queue.put(item)
+        AUDIO_QUEUED.inc()
+        self.metrics.max_queue_depth = max(self.metrics.max_queue_depth, self.queue.qsize())
+
+    async def run_sender(self):
+        """Forward queued chunks to the Live session until the stream stops."""
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                self.stopped = True
+                await self.session.send_realtime_input(audio_stream_end=True)
+                return
+            AUDIO_QUEUED.dec()
+            chunk, queued_at = item
+            with span('live_send'):
+                await self.session.send_realtime_input(audio=types.Blob(data=chunk, mime_type=PCM_MIME_TYPE))
+            self.metrics.chunk_sent(queued_at, len(chunk))
+
+
+def synthetic_call(seconds, stream_sid='MZreplay'):
+    """Twilio messages for ``seconds`` of a 440 Hz tone."""
+    import math
+    pcm = b''.join(
+        int(8000 * math.sin(2 * math.pi * 440 * n / TWILIO_SAMPLE_RATE)).to_bytes(2, 'little', signed=True)
+        for n in range(TWILIO_SAMPLE_RATE * TWILIO_FRAME_MS // 1000)
+    )
+    payload = base64.b64encode(audioop.lin2ulaw(pcm, 2) if audioop else bytes([0xFF]) * (len(pcm) // 2)).decode()
+    messages = [json.dumps({'event': 'start', 'streamSid': stream_sid, 'start': {'streamSid': stream_sid, 'callSid': 'CAreplay'}})]
+    media = json.dumps({'event': 'media', 'streamSid': stream_sid, 'media': {'payload': payload}})
+    messages += [media] * (seconds * 1000 // TWILIO_FRAME_MS)
+    messages.append(json.dumps({'event': 'stop', 'streamSid': stream_sid}))
+    return messages
+
+
+async def _replay(calls, messages, send_latency_ms, realtime):
+    async def call():
+        bridge = AudioBridge(FakeLiveSession(f"fixed:{send_latency_ms}", reply_every_ms=0))
+
+        async def receive():
+            for message in messages:
+                await bridge.handle_message(message)
+                # Twilio paces frames at 20 ms; without --realtime replay as fast as possible
+                await asyncio.sleep(TWILIO_FRAME_MS / 1000 if realtime else 0)
+            await bridge.close()
+
+        await asyncio.gather(receive(), bridge.run_sender())
+        return bridge.metrics
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    results = await asyncio.gather(*(call() for _ in range(calls)))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    frames = sum(m.frames_in for m in results)
+    merged = StreamMetrics()
+    for m in results:
+        merged.frames_in += m.frames_in
+        merged.chunks_out += m.chunks_out
+        merged.dropped += m.dropped
+        merged.bytes_out += m.bytes_out
+        merged.latencies += m.latencies
+        merged.jitter = max(merged.jitter, m.jitter)
+        merged.max_queue_depth = max(merged.max_queue_depth, m.max_queue_depth)
+    print(json.dumps({
+        'calls': calls,
+        'seconds': round(wall, 3),
+        'cpu_seconds': round(cpu, 3),
+        'frames_per_cpu_second': round(frames / cpu) if cpu else None,
+        'audioop': audioop is not None,
+        **merged.summary(),
+    }))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay Twilio media streams through AudioBridge.")
+    parser.add_argument('--replay', help="JSONL file of recorded Twilio websocket messages")
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--seconds', type=int, default=30, help="length of each synthetic call")
+    parser.add_argument('--send-latency-ms', type=float, default=40)
+    parser.add_argument('--realtime', action='store_true', help="pace frames at 20 ms like Twilio")
+    args = parser.parse_args()
+    if args.replay:
+        with open(args.replay, encoding='utf-8') as f:
+            messages = [line.strip() for line in f if line.strip()]
+    else:
+        messages = synthetic_call(args.seconds)
+    asyncio.run(_replay(args.calls, messages, args.send_latency_ms, args.realtime))
@@ -0,0 +1,109 @@
+"""Offline stand-in for the Gemini Live API and the ticket classifier.
+
+With ``GENAI_FAKE_BACKEND=1`` each call in ``main.py`` gets a
+``FakeLiveSession`` instead of ``client.aio.live.connect(...)``, and
+``tools.classify_and_create_ticket`` answers with ``FAKE_TICKET``, so the
+server runs and can be load tested without credentials or network.
+
+- ``FAKE_LATENCY`` – delay of each ``send_realtime_input`` call, as a spec in
+  milliseconds: ``fixed:40``, ``uniform:20:80``, ``lognormal:40:0.5``
+  (median, sigma) or ``exp:40`` (mean), parsed by
+  ``common.latency`` like the tweet analyzer's fake;
+- ``FAKE_REPLY_LATENCY`` – delay before each text reply is delivered;
+- ``FAKE_REPLY_EVERY_MS`` – seconds of caller audio per reply, in ms;
+- ``FAKE_CHUNK_SIZE`` – characters per streamed reply message;
+- ``FAKE_ERROR_RATE`` – fraction of sessions that fail to connect;
+- ``FAKE_SEED`` – seed for the latency and error draws.
+"""
+import asyncio
+import os
+import random
+import sys
+
+from google.genai import types
+
+# common/ at the repository root is shared with the tweet analyzer
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+from common.latency import LatencyModel
+
+# Configuration
+FAKE_LATENCY = os.getenv('FAKE_LATENCY', 'fixed:0')
+FAKE_REPLY_LATENCY = os.getenv('FAKE_REPLY_LATENCY', 'fixed:0')
+FAKE_REPLY_EVERY_MS = int(os.getenv('FAKE_REPLY_EVERY_MS', 2000))
+FAKE_CHUNK_SIZE = int(os.getenv('FAKE_CHUNK_SIZE', 16))
+FAKE_ERROR_RATE = float(os.getenv('FAKE_ERROR_RATE', 0))
+FAKE_SEED = os.getenv('FAKE_SEED')
+
+FAKE_REPLY = "I hear you. Help is on the way, please stay on the line and tell me where you are."
+FAKE_TICKET = {
+    "name": "Caller",
+    "priority": 2,
+    "summary": "Fake ticket for offline testing.",
+    "services_needed": ["firebrigade"],
+    "life_threatening": False,
+    "ticket_type": "fire",
+    "smoke_visibility": True,
+    "fire_visibility": False,
+    "breathing_issue": False,
+    "location": "NA",
+    "help_for_whom": "yourself",
+}
+
+_rng = random.Random(FAKE_SEED)
+
+
+class FakeLiveSession:
+    """Accepts realtime audio with a simulated send delay and streams a text reply per ``reply_every_ms`` of it."""
+
+    def __init__(self, send_latency=FAKE_LATENCY, reply_latency=FAKE_REPLY_LATENCY,
+                 reply_every_ms=FAKE_REPLY_EVERY_MS, chunk_size=FAKE_CHUNK_SIZE, error_rate=FAKE_ERROR_RATE):
+        self.send_latency = send_latency if isinstance(send_latency, LatencyModel) else LatencyModel(send_latency, _rng)
+        self.reply_latency = reply_latency if isinstance(reply_latency, LatencyModel) else LatencyModel(reply_latency, _rng)
+        self.reply_every_ms = reply_every_ms
+        self.chunk_size = chunk_size
+        self.error_rate = error_rate
+        self.sends = 0
+        self.audio_ms = 0.0
+        self._replied_ms = 0.0
+        self._replies = asyncio.Queue()
+
+    async def __aenter__(self):
+        if self.error_rate and _rng.random() < self.error_rate:
+            raise ConnectionError("Injected fake Live API error")
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def send_realtime_input(self, audio=None, audio_stream_end=None, **kwargs):
+        await self.send_latency.sleep_async()
+        self.sends += 1
+        if audio is not None:
+            rate = int(audio.mime_type.split('rate=')[1]) if 'rate=' in (audio.mime_type or '') else 16000
+            self.audio_ms += len(audio.data) * 1000 / (2 * rate)
+            while self.reply_every_ms and self.audio_ms - self._replied_ms >= self.reply_every_ms:
+                self._replied_ms += self.reply_every_ms
+                self._replies.put_nowait(FAKE_REPLY)
+
+    async def receive(self):
+        """One model turn, streamed in ``chunk_size`` pieces; ends after ``turn_complete`` like the SDK.
+
+        Call it again for the next turn. As with the real session, ending the
+        audio stream does not end the session, so a caller waiting for another
+        turn blocks until it gives up.
+        """
+        text = await self._replies.get()
+        await self.reply_latency.sleep_async()
+        for i in range(0, len(text), self.chunk_size):
+            yield types.LiveServerMessage(server_content=types.LiveServerContent(
+                model_turn=types.Content(role='model', parts=[types.Part(text=text[i:i + self.chunk_size])]),
+                turn_complete=i + self.chunk_size >= len(text),
+            ))
+
+
+def connect():
+    """A fake Live session configured from the environment, used like ``client.aio.live.connect``."""
+    return FakeLiveSession()
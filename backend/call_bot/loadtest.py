@@ -0,0 +1,188 @@
+"""Concurrent Twilio media-stream sessions against ``/media-stream``.
+
+``run`` starts ``main.py`` in its own process with ``GENAI_FAKE_BACKEND=1``,
+local tickets and the chosen fake Live latency (or targets ``--url``), then
+opens each level's number of websocket sessions, staggered over ``--ramp``
+seconds. Every session streams ``--seconds`` of synthetic call audio paced at
+20 ms like Twilio, sends ``stop`` and waits for the server to finish the call.
+One JSON line per level reports:
+
+- ``p50_ms`` / ``p95_ms`` / ``p99_ms`` – ``stop`` to the end of the call,
+  i.e. the audio and replies still queued on the server at hang-up, plus
+  the ``LIVE_REPLY_GRACE`` of quiet the server waits for a last reply;
+- ``connect_p95_ms`` and ``frame_lag_p99_ms`` – websocket handshake time and
+  how late frames went out against the 20 ms schedule;
+- ``throughput_rps`` – media messages accepted per second, all sessions.
+
+``--out`` saves the run in the same format as
+``TweetAnalyzerwithLLM/loadtest.py``, whose ``compare`` diffs two runs:
+
+    python loadtest.py run --concurrency 1,25,100 --seconds 10 --fake-latency lognormal:40:0.5 --out base.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+import websockets
+
+from audio import TWILIO_FRAME_MS, synthetic_call
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 2) if values else None
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, workdir):
+    """Run ``main.py`` in a child process; returns (process, websocket URL)."""
+    port = free_port()
+    env = dict(os.environ,
+               GENAI_FAKE_BACKEND='1',
+               PORT=str(port),
+               TICKET_SINK='local',
+               LOCAL_TICKET_PATH=os.path.join(workdir, 'tickets.jsonl'),
+               TRANSCRIPT_DIR=os.path.join(workdir, 'transcripts'),
+               FAKE_LATENCY=args.fake_latency,
+               FAKE_REPLY_LATENCY=args.fake_reply_latency,
+               FAKE_ERROR_RATE=str(args.fake_error_rate))
+    process = subprocess.Popen([sys.executable, 'main.py'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1):
+                return process, f"ws://127.0.0.1:{port}/media-stream"
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server did not start within 30 s")
+
+
+def with_call_sid(messages, call_sid):
+    """``messages`` with their ``start`` event rewritten for a distinct call."""
+    start = json.loads(messages[0])
+    start['start']['callSid'] = call_sid
+    return [json.dumps(start)] + messages[1:]
+
+
+async def session(url, messages, delay):
+    """One call; returns its timings, or ``None`` for a failed session."""
+    await asyncio.sleep(delay)
+    start = time.perf_counter()
+    try:
+        async with websockets.connect(url) as ws:
+            connected = time.perf_counter()
+            lags = []
+            frame = TWILIO_FRAME_MS / 1000
+            for i, message in enumerate(messages[:-1]):
+                target = connected + i * frame
+                now = time.perf_counter()
+                if now < target:
+                    await asyncio.sleep(target - now)
+                lags.append(max(0.0, time.perf_counter() - target))
+                await ws.send(message)
+            stop = time.perf_counter()
+            await ws.send(messages[-1])
+            # The handler returns, ending the connection, once the call's audio has drained
+            try:
+                async for _ in ws:
+                    pass
+            except websockets.ConnectionClosed:
+                pass
+            closed = time.perf_counter()
+    except (OSError, websockets.WebSocketException):
+        # Failed to connect, or the server dropped the call before it ended
+        return None
+    return {'connect': connected - start, 'lags': lags, 'drain': closed - stop, 'frames': len(messages) - 2}
+
+
+async def run_level(url, sessions, messages, ramp):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(session(url, with_call_sid(messages, f"CA{i:06d}"), random.uniform(0, ramp))
+                                           for i in range(sessions)))
+    wall = time.perf_counter() - start
+    ok = [r for r in results if r is not None]
+    lags = [lag for r in ok for lag in r['lags']]
+    drains = [r['drain'] for r in ok]
+    return {
+        'endpoint': '/media-stream',
+        'concurrency': sessions,
+        'requests': sessions,
+        'errors': sessions - len(ok),
+        'error_rate': round((sessions - len(ok)) / sessions, 4),
+        'seconds': round(wall, 3),
+        'throughput_rps': round(sum(r['frames'] for r in ok) / wall, 2),
+        'p50_ms': percentile(drains, 0.50),
+        'p95_ms': percentile(drains, 0.95),
+        'p99_ms': percentile(drains, 0.99),
+        'connect_p95_ms': percentile([r['connect'] for r in ok], 0.95),
+        'frame_lag_p99_ms': percentile(lags, 0.99),
+    }
+
+
+async def run(args):
+    levels = [int(c) for c in args.concurrency.split(',')]
+    messages = synthetic_call(args.seconds)
+    settings = {k: v for k, v in vars(args).items() if k not in ('command', 'out')}
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        process, url = (None, args.url) if args.url else start_server(args, workdir)
+        try:
+            for sessions in levels:
+                result = await run_level(url, sessions, messages, args.ramp)
+                print(json.dumps(result), flush=True)
+                results.append(result)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({
+                'commit': git_commit(),
+                'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'settings': settings,
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test /media-stream with concurrent Twilio sessions.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    r = sub.add_parser('run')
+    r.add_argument('--url', help="test a running server instead of starting one, e.g. ws://host:5050/media-stream")
+    r.add_argument('--concurrency', default='1,10,50,100', help="comma-separated session counts")
+    r.add_argument('--seconds', type=int, default=10, help="audio per session")
+    r.add_argument('--ramp', type=float, default=1.0, help="spread session starts over this many seconds")
+    r.add_argument('--fake-latency', default='lognormal:40:0.5', help="fake Live API send latency")
+    r.add_argument('--fake-reply-latency', default='lognormal:300:0.5')
+    r.add_argument('--fake-error-rate', type=float, default=0.0)
+    r.add_argument('--out', help="save the run as JSON")
+    args = parser.parse_args()
+    asyncio.run(run(args))
@@ -1,13 +1,21 @@
 import os
 import json
 import asyncio
-from fastapi import FastAPI, WebSocket, Request
-from fastapi.responses import HTMLResponse
+import time
+import uuid
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException
+from fastapi.responses import HTMLResponse, Response
 from twilio.twiml.voice_response import VoiceResponse, Connect
 import logging
 from dotenv import load_dotenv
 from google import genai
 from google.genai.types import LiveConnectConfig, Modality, HttpOptions
+from persistence import PersistenceWriter, set_writer
+from audio import AudioBridge
+from tools import ticket_sink
+import fake_backend
+import metrics
+from metrics import ACTIVE_CALLS, CALL_SECONDS, LIVE_REPLIES, TWILIO_MESSAGES, span
 
 # Load environment variables
 load_dotenv()
@@ -15,21 +23,56 @@ load_dotenv()
 # Configuration
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 PORT = int(os.getenv('PORT', 5050))
+# Set GENAI_FAKE_BACKEND=1 to answer every call from fake_backend, offline
+GENAI_FAKE_BACKEND = os.getenv('GENAI_FAKE_BACKEND') == '1'
+# After the caller hangs up, keep reading replies until Gemini has been quiet this long (seconds)
+LIVE_REPLY_GRACE = float(os.getenv('LIVE_REPLY_GRACE', 1.0))
+MODEL_ID = "gemini-2.0-flash-exp"
 
 # Set up logger
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-if not GEMINI_API_KEY:
+if not GEMINI_API_KEY and not GENAI_FAKE_BACKEND:
     raise ValueError('Missing the Gemini API key. Please set it in the .env file.')
 
 # FastAPI app setup
 app = FastAPI()
 
+# Transcripts and tickets are written by a background task, never in the call loop
+writer = PersistenceWriter()
+metrics.register_stats('persistence', writer.stats)
+
+@app.on_event("startup")
+async def start_persistence():
+    writer.ticket_sink = ticket_sink()
+    await writer.start()
+    set_writer(writer)
+
+@app.on_event("shutdown")
+async def stop_persistence():
+    await writer.stop()
+
+def live_session():
+    """The Gemini Live session for one call, or the offline fake."""
+    if GENAI_FAKE_BACKEND:
+        return fake_backend.connect()
+    client = genai.Client(http_options=HttpOptions(api_version="v1beta1"))
+    return client.aio.live.connect(
+        model=MODEL_ID,
+        config=LiveConnectConfig(response_modalities=[Modality.TEXT]),
+    )
+
 @app.get("/", response_class=HTMLResponse)
 async def index_page():
     return "<html><body><h1>Twilio Media Stream Server is running!</h1></body></html>"
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404)
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.api_route("/incoming-call", methods=["GET", "POST"])
 async def handle_incoming_call(request: Request):
     """Handle incoming call and return TwiML response to connect to Media Stream."""
@@ -48,61 +91,76 @@ async def handle_media_stream(websocket: WebSocket):
     print("Client connected")
     await websocket.accept()
 
-    # Initialize GenAI client
-    client = genai.Client(http_options=HttpOptions(api_version="v1beta1"))
-    model_id = "gemini-2.0-flash-exp"
+    async with live_session() as session:
+        # Coalesces Twilio frames into PCM chunks and sends them from its own task
+        bridge = AudioBridge(session)
+        transcript = None
 
-    async with client.aio.live.connect(
-        model=model_id,
-        config=LiveConnectConfig(response_modalities=[Modality.TEXT]),
-    ) as session:
-        transcripts = []
+        def call_transcript():
+            """This call's transcript, named after its Twilio call once ``start`` has arrived."""
+            nonlocal transcript
+            if transcript is None:
+                transcript = writer.transcript(bridge.call_sid or bridge.stream_sid or uuid.uuid4().hex)
+            return transcript
 
         async def receive_from_twilio():
-            """Receive audio data from Twilio and send it to Gemini."""
+            """Receive audio data from Twilio and queue it for Gemini."""
             try:
                 async for message in websocket.iter_text():
-                    data = json.loads(message)
-                    if data['event'] == 'media':
-                        audio_data = data['media']['payload']
-                        # Send audio data to Gemini for processing
-                        await session.send(input=audio_data, end_of_turn=False)
-                    elif data['event'] == 'start':
-                        print(f"Incoming stream has started")
-
-                    elif data['event'] == 'stop':
+                    with span('twilio_receive'):
+                        event = await bridge.handle_message(message)
+                    TWILIO_MESSAGES.inc(event or 'unknown')
+                    if event == 'start':
+                        call_transcript()
+                        print(f"Incoming stream has started {bridge.stream_sid}")
+                    elif event == 'stop':
                         print("Stream has stopped.")
-                        await session.send(input="", end_of_turn=True)
-                        save_transcript(transcripts)
+                        return
 
             except WebSocketDisconnect:
                 print("Client disconnected.")
+            finally:
+                # Let the sender drain what is queued, then end the audio stream, even after an error
+                await bridge.close()
+
+        last_message = time.monotonic()
 
         async def send_to_gemini():
-            """Receive response from Gemini and send text response back to Twilio."""
+            """Receive text responses from Gemini and add them to the transcript."""
+            nonlocal last_message
             try:
-                async for message in session.receive():
-                    if message.text:
-                        transcripts.append({'role': 'AI', 'text': message.text})
-                        print(f"Gemini AI: {message.text}")
-                        # Send the response text back to Twilio
-                        await websocket.send_json({
-                            "event": "media",
-                            "streamSid": "example_stream_sid",  # Replace with actual stream sid
-                            "media": {
-                                "payload": message.text  # Gemini's text response
-                            }
-                        })
+                # receive() ends after each turn, so ask again for the next one
+                while True:
+                    async for message in session.receive():
+                        last_message = time.monotonic()
+                        if message.text:
+                            LIVE_REPLIES.inc()
+                            await call_transcript().append('AI', message.text)
+                            print(f"Gemini AI: {message.text}")
             except Exception as e:
                 print(f"Error in send_to_gemini: {e}")
 
-        await asyncio.gather(receive_from_twilio(), send_to_gemini())
-
-def save_transcript(transcripts):
-    """Save the transcript to a file or database"""
-    with open(f"transcript_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.txt", 'w') as f:
-        for entry in transcripts:
-            f.write(f"{entry['role']}: {entry['text']}\n")
+        started = time.perf_counter()
+        ACTIVE_CALLS.inc()
+        audio = [asyncio.ensure_future(c) for c in (receive_from_twilio(), bridge.run_sender())]
+        replies = asyncio.ensure_future(send_to_gemini())
+        try:
+            await asyncio.gather(*audio)
+            # The audio stream has ended but the session stays open: take the last replies, then hang up
+            quiet_since = time.monotonic()
+            while not replies.done():
+                quiet_since = max(quiet_since, last_message)
+                remaining = quiet_since + LIVE_REPLY_GRACE - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.wait([replies], timeout=remaining)
+        finally:
+            # gather does not cancel the others when one fails; none may outlive the call
+            for task in (*audio, replies):
+                task.cancel()
+            ACTIVE_CALLS.dec()
+            CALL_SECONDS.observe(time.perf_counter() - started)
+            logger.info("Audio stream %s: %s", bridge.stream_sid, json.dumps(bridge.metrics.summary()))
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,60 @@
+"""Stage timings and counters for the call bot, in the Prometheus text format.
+
+``span(stage)`` times a block into the ``stage_seconds`` histogram (and
+counts it in ``stage_errors_total`` if it raises): the Twilio receive loop,
+sends to the Live session, ticket classification and pushes, and persistence
+batches. Counters track audio frames, chunks, drops and bytes, live replies
+and tickets; ``audio_queued_chunks`` is the audio waiting for Gemini across
+all calls. The persistence writer reports its queue through
+``register_stats``, read only when ``/metrics`` is scraped.
+
+With ``METRICS_ENABLED=0`` every metric is a shared no-op object and
+``span`` returns a null context manager, so instrumented code costs one
+method call, and ``/metrics`` returns 404.
+"""
+import logging
+import os
+import sys
+
+# common/ at the repository root is shared with the tweet analyzer
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+from common.prometheus import CONTENT_TYPE, NULL_SPAN, Registry, Span
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_NAMESPACE = os.getenv('METRICS_NAMESPACE', 'call_bot')
+
+# Seconds; from per-chunk sends of a few ms up to whole calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+registry = Registry(METRICS_NAMESPACE, METRICS_ENABLED, DEFAULT_BUCKETS, on_error=logger.error)
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
+register_stats = registry.register_stats
+render = registry.render
+
+STAGE_SECONDS = histogram('stage_seconds', "Time spent in each call stage", ['stage'])
+STAGE_ERRORS = counter('stage_errors_total', "Stages that raised", ['stage'])
+ACTIVE_CALLS = gauge('active_calls', "Media streams currently connected")
+CALL_SECONDS = histogram('call_seconds', "Media stream duration")
+TWILIO_MESSAGES = counter('twilio_messages_total', "Twilio websocket messages by event", ['event'])
+AUDIO_FRAMES = counter('audio_frames_total', "20 ms Twilio audio frames received")
+AUDIO_CHUNKS = counter('audio_chunks_total', "Coalesced audio chunks by outcome", ['outcome'])
+AUDIO_BYTES = counter('audio_bytes_total', "PCM bytes sent to the Live session")
+AUDIO_QUEUED = gauge('audio_queued_chunks', "Audio chunks waiting for the Live session, all calls")
+AUDIO_CHUNK_SECONDS = histogram('audio_chunk_latency_seconds', "First frame of a chunk to its send completing")
+LIVE_REPLIES = counter('live_replies_total', "Text messages received from the Live session")
+TICKETS = counter('tickets_total', "Tickets by how they were saved", ['path'])
+
+
+def span(stage):
+    """Time the enclosed block as ``stage``."""
+    if not METRICS_ENABLED:
+        return NULL_SPAN
+    return Span(STAGE_SECONDS, (stage,), STAGE_ERRORS)
@@ -0,0 +1,285 @@
+"""Non-blocking persistence for call transcripts and tickets.
+
+Call handlers never touch the disk or Firestore directly. They put records on
+a bounded asyncio queue and a background writer drains it in batches:
+transcript lines are appended to their per-call file, tickets are handed to a
+second task that commits them with one Firestore batch write per drain. All
+blocking I/O runs in a worker thread so the event loop keeps serving the other
+calls. A failed ticket write is retried with backoff in the ticket task, so a
+slow or failing ticket sink never holds up transcript lines; if it keeps
+failing, the tickets are appended to ``FAILED_TICKET_PATH`` so they can be
+replayed instead of being lost. Without a ticket sink, tickets are counted as
+skipped.
+
+``LocalTicketSink`` writes tickets to a JSONL file instead of Firestore, which
+is what the load test below uses:
+
+    python persistence.py --calls 300 --lines 40
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+PERSIST_QUEUE_SIZE = int(os.getenv('PERSIST_QUEUE_SIZE', 10000))
+PERSIST_BATCH_SIZE = int(os.getenv('PERSIST_BATCH_SIZE', 500))
+TRANSCRIPT_DIR = os.getenv('TRANSCRIPT_DIR', 'transcripts')
+# Ticket writes are retried with exponential backoff, then kept in a local JSONL file
+PERSIST_RETRIES = int(os.getenv('PERSIST_RETRIES', 4))
+PERSIST_RETRY_DELAY = float(os.getenv('PERSIST_RETRY_DELAY', 0.5))
+FAILED_TICKET_PATH = os.getenv('FAILED_TICKET_PATH', 'failed_tickets.jsonl')
+# Firestore allows at most 500 writes per batch
+FIRESTORE_BATCH_LIMIT = 500
+
+
+class FirestoreTicketSink:
+    """Writes tickets to the Firestore ``tickets`` collection in batch commits."""
+
+    def __init__(self, db, collection='tickets'):
+        self.db = db
+        self.collection = collection
+
+    def write(self, tickets):
+        for start in range(0, len(tickets), FIRESTORE_BATCH_LIMIT):
+            batch = self.db.batch()
+            for ticket in tickets[start:start + FIRESTORE_BATCH_LIMIT]:
+                batch.set(self.db.collection(self.collection).document(ticket['ticket_id']), ticket)
+            batch.commit()
+
+
+class LocalTicketSink:
+    """Appends tickets to a JSONL file; a local stand-in for Firestore."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, tickets):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for ticket in tickets:
+                f.write(json.dumps(ticket, default=str) + '\n')
+
+
+class PersistenceWriter:
+    """Bounded queue plus background task that batches transcript and ticket writes."""
+
+    def __init__(self, ticket_sink=None, transcript_dir=TRANSCRIPT_DIR,
+                 queue_size=PERSIST_QUEUE_SIZE, batch_size=PERSIST_BATCH_SIZE,
+                 retries=PERSIST_RETRIES, retry_delay=PERSIST_RETRY_DELAY, failed_path=FAILED_TICKET_PATH):
+        self.ticket_sink = ticket_sink
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.failed_sink = LocalTicketSink(failed_path)
+        self.transcript_dir = transcript_dir
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.queue = None
+        self.tickets = None
+        self.loop = None
+        self._task = None
+        self._ticket_task = None
+        self.written_lines = 0
+        self.written_tickets = 0
+        self.skipped_tickets = 0
+        self.batches = 0
+        self.retried = 0
+        self.failed_tickets = 0
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.tickets = asyncio.Queue(maxsize=self.queue_size)
+        os.makedirs(self.transcript_dir, exist_ok=True)
+        self._task = asyncio.create_task(self._run())
+        self._ticket_task = asyncio.create_task(self._run_tickets())
+
+    async def stop(self):
+        """Flush everything queued, then stop the writer."""
+        if self._task is None:
+            return
+        await self.queue.join()
+        await self.tickets.join()
+        for task in (self._task, self._ticket_task):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._task = self._ticket_task = None
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+            'queued_tickets': self.tickets.qsize() if self.tickets is not None else 0,
+            'written_lines': self.written_lines,
+            'written_tickets': self.written_tickets,
+            'skipped_tickets': self.skipped_tickets,
+            'batches': self.batches,
+            'retried': self.retried,
+            'failed_tickets': self.failed_tickets,
+        }
+
+    async def put(self, kind, payload):
+        # Waits when the queue is full, pushing back on the producers
+        await self.queue.put((kind, payload))
+
+    def put_threadsafe(self, kind, payload):
+        """Enqueue from a thread that is not running the event loop."""
+        asyncio.run_coroutine_threadsafe(self.put(kind, payload), self.loop)
+
+    async def _run(self):
+        while True:
+            items = [await self.queue.get()]
+            while len(items) < self.batch_size and not self.queue.empty():
+                items.append(self.queue.get_nowait())
+            try:
+                lines = defaultdict(list)
+                for kind, payload in items:
+                    if kind == 'line':
+                        path, text = payload
+                        lines[path].append(text)
+                    elif kind == 'ticket':
+                        if self.ticket_sink is None:
+                            self.skipped_tickets += 1
+                        else:
+                            await self.tickets.put(payload)
+                with span('persist_batch'):
+                    await asyncio.to_thread(self._write_lines, lines)
+            except Exception as e:
+                logger.error(f"Error persisting {len(items)} records: {e}")
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+    def _write_lines(self, lines):
+        for path, chunk in lines.items():
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(''.join(chunk))
+        self.written_lines += sum(len(c) for c in lines.values())
+        self.batches += 1
+
+    async def _run_tickets(self):
+        while True:
+            tickets = [await self.tickets.get()]
+            while len(tickets) < self.batch_size and not self.tickets.empty():
+                tickets.append(self.tickets.get_nowait())
+            try:
+                with span('persist_tickets'):
+                    await self._write_tickets(tickets)
+            except Exception as e:
+                logger.error(f"Error persisting {len(tickets)} tickets: {e}")
+            finally:
+                for _ in tickets:
+                    self.tickets.task_done()
+
+    async def _write_tickets(self, tickets):
+        """Write with retries; tickets that still fail go to ``failed_sink`` rather than being dropped."""
+        # Tickets are set by ticket_id, so retrying a partly committed batch is harmless
+        for attempt in range(self.retries + 1):
+            try:
+                await asyncio.to_thread(self.ticket_sink.write, tickets)
+                self.written_tickets += len(tickets)
+                return True
+            except Exception as e:
+                if attempt == self.retries:
+                    logger.error(f"Giving up on {len(tickets)} tickets after {attempt + 1} attempts: {e}")
+                    break
+                self.retried += 1
+                delay = self.retry_delay * 2 ** attempt
+                logger.warning(f"Ticket write failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        await asyncio.to_thread(self.failed_sink.write, tickets)
+        self.failed_tickets += len(tickets)
+        return False
+
+    def transcript(self, call_id=None):
+        return Transcript(self, call_id)
+
+
+class Transcript:
+    """One call's transcript, appended line by line as the call goes on."""
+
+    def __init__(self, writer, call_id=None):
+        self.writer = writer
+        stamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        name = f"transcript_{stamp}_{call_id}.txt" if call_id else f"transcript_{stamp}.txt"
+        self.path = os.path.join(writer.transcript_dir, name)
+        self.entries = []
+
+    async def append(self, role, text):
+        self.entries.append({'role': role, 'text': text})
+        await self.writer.put('line', (self.path, f"{role}: {text}\n"))
+
+
+_writer = None
+
+
+def set_writer(writer):
+    global _writer
+    _writer = writer
+
+
+def get_writer():
+    """The writer started by the app, or ``None`` outside the server."""
+    return _writer
+
+
+async def _load_test(calls, lines, path):
+    sink = LocalTicketSink(os.path.join(path, 'tickets.jsonl'))
+    writer = PersistenceWriter(sink, transcript_dir=path)
+    await writer.start()
+
+    lag = []
+
+    async def monitor():
+        # How late the event loop wakes a 10 ms sleeper while calls are writing
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag.append(time.perf_counter() - start - 0.01)
+
+    async def call(i):
+        transcript = writer.transcript(f"CA{i:05d}")
+        for n in range(lines):
+            await transcript.append('AI' if n % 2 else 'Caller', f"line {n} of call {i}")
+            await asyncio.sleep(0)
+        await writer.put('ticket', {'ticket_id': f"TICKET{i:05d}", 'status': 'pending'})
+
+    monitor_task = asyncio.create_task(monitor())
+    start = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(calls)))
+    await writer.stop()
+    elapsed = time.perf_counter() - start
+    monitor_task.cancel()
+
+    print(json.dumps({
+        'calls': calls,
+        'lines': writer.written_lines,
+        'tickets': writer.written_tickets,
+        'batches': writer.batches,
+        'seconds': round(elapsed, 3),
+        'lines_per_second': round(writer.written_lines / elapsed),
+        'max_loop_lag_ms': round(max(lag, default=0.0) * 1000, 2),
+    }))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the persistence writer against local files.")
+    parser.add_argument('--calls', type=int, default=300)
+    parser.add_argument('--lines', type=int, default=40)
+    parser.add_argument('--out', default='loadtest_output')
+    args = parser.parse_args()
+    asyncio.run(_load_test(args.calls, args.lines, args.out))
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# The service modules are imported flat, as when main.py is run from its directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Read at import time by main.py, tools.py and persistence.py
+_scratch = tempfile.mkdtemp(prefix='call_bot_tests.')
+os.environ.setdefault('GENAI_FAKE_BACKEND', '1')
+os.environ.setdefault('TICKET_SINK', 'local')
+os.environ.setdefault('LOCAL_TICKET_PATH', os.path.join(_scratch, 'tickets.jsonl'))
+os.environ.setdefault('FAILED_TICKET_PATH', os.path.join(_scratch, 'failed_tickets.jsonl'))
+os.environ.setdefault('TRANSCRIPT_DIR', os.path.join(_scratch, 'transcripts'))
@@ -0,0 +1,58 @@
+import asyncio
+import base64
+import glob
+import json
+import os
+import time
+
+from fastapi.testclient import TestClient
+from google.genai import types
+
+import main
+from fake_backend import FAKE_REPLY, FakeLiveSession
+
+
+def fake_audio(ms, rate=8000):
+    return types.Blob(data=b'\0' * (2 * rate * ms // 1000), mime_type=f'audio/pcm;rate={rate}')
+
+
+def twilio_call(frames, call_sid):
+    payload = base64.b64encode(b'\xff' * 160).decode()
+    yield json.dumps({'event': 'start', 'start': {'streamSid': f'MZ{call_sid}', 'callSid': call_sid}})
+    for _ in range(frames):
+        yield json.dumps({'event': 'media', 'media': {'payload': payload}})
+    yield json.dumps({'event': 'stop'})
+
+
+def test_fake_receive_ends_after_each_turn():
+    async def scenario():
+        session = FakeLiveSession(reply_every_ms=100, chunk_size=16)
+        await session.send_realtime_input(audio=fake_audio(200))
+        turns = []
+        for _ in range(2):
+            turns.append([m async for m in session.receive()])
+        return turns
+
+    turns = asyncio.run(scenario())
+    for turn in turns:
+        assert ''.join(m.text for m in turn) == FAKE_REPLY
+        assert [m.server_content.turn_complete for m in turn] == [False] * (len(turn) - 1) + [True]
+
+
+def test_every_turn_reaches_the_transcript_and_the_call_ends(monkeypatch):
+    # One turn per 200 ms of caller audio, back to back: 1 s of audio gives five
+    monkeypatch.setattr(main, 'live_session', lambda: FakeLiveSession(reply_every_ms=200, chunk_size=1000))
+    monkeypatch.setattr(main, 'LIVE_REPLY_GRACE', 0.3)
+    with TestClient(main.app) as client:
+        with client.websocket_connect('/media-stream') as ws:
+            for message in twilio_call(50, 'CAturns'):
+                ws.send_text(message)
+            stopped = time.monotonic()
+        # Leaving the block waits for the handler: a receiver stuck after stop would hang here
+        elapsed = time.monotonic() - stopped
+
+    assert elapsed < 2
+    [path] = glob.glob(os.path.join(os.environ['TRANSCRIPT_DIR'], '*CAturns*'))
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines == [f"AI: {FAKE_REPLY}"] * 5
@@ -0,0 +1,49 @@
+import asyncio
+import json
+
+from persistence import PersistenceWriter
+
+
+class FailingSink:
+    def __init__(self):
+        self.attempts = 0
+
+    def write(self, tickets):
+        self.attempts += 1
+        raise OSError('sink down')
+
+
+def test_ticket_retries_do_not_hold_up_transcript_lines(tmp_path):
+    sink = FailingSink()
+    writer = PersistenceWriter(sink, transcript_dir=str(tmp_path), retries=2, retry_delay=0.2,
+                               failed_path=str(tmp_path / 'failed.jsonl'))
+
+    async def run():
+        await writer.start()
+        transcript = writer.transcript('CA1')
+        await writer.put('ticket', {'ticket_id': 'T1'})
+        await transcript.append('Caller', 'help')
+        # The line lands while the ticket is still backing off
+        await asyncio.wait_for(writer.queue.join(), 0.15)
+        lines = writer.written_lines
+        await writer.stop()
+        return lines
+
+    assert asyncio.run(run()) == 1
+    assert sink.attempts == 3
+    assert writer.stats()['failed_tickets'] == 1
+    assert writer.stats()['written_tickets'] == 0
+    assert [json.loads(line) for line in (tmp_path / 'failed.jsonl').read_text().splitlines()] == [{'ticket_id': 'T1'}]
+
+
+def test_tickets_without_a_sink_are_counted_as_skipped(tmp_path):
+    writer = PersistenceWriter(None, transcript_dir=str(tmp_path))
+
+    async def run():
+        await writer.start()
+        await writer.put('ticket', {'ticket_id': 'T1'})
+        await writer.stop()
+
+    asyncio.run(run())
+    assert writer.stats()['written_tickets'] == 0
+    assert writer.stats()['skipped_tickets'] == 1
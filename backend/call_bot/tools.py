@@ -3,22 +3,52 @@ import logging
 import uuid
 import json
 import datetime
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
-from google.cloud import aiplatform
+import threading
+from persistence import FirestoreTicketSink, LocalTicketSink, get_writer
+from metrics import TICKETS, span
 
 # Initialize logging
 logger = logging.getLogger(__name__)
 
-# Initialize Firebase Admin SDK
+# Where tickets go: 'firestore', or 'local' for a JSONL file (load tests, no credentials)
+TICKET_SINK = os.getenv('TICKET_SINK', 'firestore')
+LOCAL_TICKET_PATH = os.getenv('LOCAL_TICKET_PATH', 'tickets.jsonl')
+# Set GENAI_FAKE_BACKEND=1 to classify transcripts with fake_backend, offline
+GENAI_FAKE_BACKEND = os.getenv('GENAI_FAKE_BACKEND') == '1'
+
+# Firebase Admin SDK, initialized on first use
 path_to_service_json = os.path.join(os.path.dirname(__file__), 'genai-genesis-301f1-382e6569b799.json')
-cred = credentials.Certificate(path_to_service_json)
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+_db = None
+_db_lock = threading.Lock()
+
+def firestore_db():
+    global _db
+    if _db is None:
+        # initialize_app raises if two threads both get here
+        with _db_lock:
+            if _db is None:
+                import firebase_admin
+                from firebase_admin import credentials, firestore
+                cred = credentials.Certificate(path_to_service_json)
+                firebase_admin.initialize_app(cred)
+                _db = firestore.client()
+    return _db
+
+def ticket_sink():
+    if TICKET_SINK == 'local':
+        return LocalTicketSink(LOCAL_TICKET_PATH)
+    return FirestoreTicketSink(firestore_db())
+
+# Vertex AI, initialized on first use
+_aiplatform = None
 
-# Initialize Vertex AI
-aiplatform.init(project='gemini-genai-454500', location='us-central1')  # Adjust project ID and location
+def vertex_ai():
+    global _aiplatform
+    if _aiplatform is None:
+        from google.cloud import aiplatform
+        aiplatform.init(project='gemini-genai-454500', location='us-central1')  # Adjust project ID and location
+        _aiplatform = aiplatform
+    return _aiplatform
 
 # Function to push data to Firebase
 def push_to_firebase(response):
@@ -27,11 +57,19 @@ def push_to_firebase(response):
         response["status"] = "pending"
         response["ticket_id"] = "TICKET" + uuid.uuid4().hex
 
-        # Save to Firebase Firestore
-        doc_ref = db.collection('tickets').document(response['ticket_id'])
         print(response)
-        doc_ref.set(response)
+        # Hand the ticket to the background writer, which batches Firestore commits
+        writer = get_writer()
+        with span('push_ticket'):
+            if writer is not None and writer.running:
+                writer.put_threadsafe('ticket', response)
+                TICKETS.inc('queued')
+            else:
+                ticket_sink().write([response])
+                TICKETS.inc('direct')
+        logger.info(f"Ticket {response['ticket_id']} saved")
     except Exception as e:
+        TICKETS.inc('error')
         logger.error(f"Error saving data to Firebase: {e}")
 
 
@@ -51,14 +89,19 @@ def classify_and_create_ticket(transcripts):
         # Request completion from Vertex AI Chat model
         model = "projects/your-project-id/locations/us-central1/models/your-model-id"  # Replace with your model id
 
-        response = aiplatform.gapic.PredictionServiceClient().predict(
-            endpoint=model,
-            instances=[{"content": chat_prompt}],
-            parameters={"temperature": 0.5},
-        )
+        with span('classify_ticket'):
+            if GENAI_FAKE_BACKEND:
+                from fake_backend import FAKE_TICKET
+                response_text = json.dumps(FAKE_TICKET)
+            else:
+                response = vertex_ai().gapic.PredictionServiceClient().predict(
+                    endpoint=model,
+                    instances=[{"content": chat_prompt}],
+                    parameters={"temperature": 0.5},
+                )
+                response_text = response.predictions[0]
 
         # Parse the response and clean it up
-        response_text = response.predictions[0]
         response_text = response_text.strip()
 
         # Convert the response to JSON format and push it to Firebase
@@ -0,0 +1,6 @@
+"""Code shared by the tweet analyzer (``TweetAnalyzerwithLLM``) and the call bot (``backend/call_bot``).
+
+Both services run as scripts from their own directory; their ``metrics.py``
+and ``fake_backend.py`` put the repository root on ``sys.path`` to import
+this package.
+"""
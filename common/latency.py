@@ -0,0 +1,46 @@
+"""Latency distributions for the offline fake backends and their load tests."""
+import asyncio
+import math
+import random
+import time
+
+KINDS = ('fixed', 'uniform', 'lognormal', 'exp')
+
+
+class LatencyModel:
+    """Delays drawn from a spec in milliseconds; samples are in seconds.
+
+    ``fixed:200``, ``uniform:100:400``, ``lognormal:300:0.5`` (median, sigma)
+    or ``exp:200`` (mean).
+    """
+
+    def __init__(self, spec, rng=None):
+        kind, *args = spec.split(':')
+        if kind not in KINDS:
+            raise ValueError(f"Unknown latency distribution {spec!r}")
+        self.spec = spec
+        self.kind = kind
+        self.args = [float(a) for a in args] or [0.0]
+        self.rng = rng or random.Random()
+
+    def sample(self):
+        a = self.args
+        if self.kind == 'fixed':
+            ms = a[0]
+        elif self.kind == 'uniform':
+            ms = self.rng.uniform(a[0], a[1])
+        elif self.kind == 'lognormal':
+            ms = a[0] * math.exp(self.rng.gauss(0, a[1] if len(a) > 1 else 0.5))
+        else:
+            ms = self.rng.expovariate(1 / a[0]) if a[0] > 0 else 0.0
+        return ms / 1000
+
+    def sleep(self):
+        delay = self.sample()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def sleep_async(self):
+        delay = self.sample()
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,211 @@
+"""A dependency-free metrics registry rendered in the Prometheus text format.
+
+Each service builds one ``Registry`` with its namespace in its own
+``metrics.py`` and defines its metrics there. A disabled registry hands out
+the shared ``NULL_METRIC`` and renders nothing, so instrumented code costs
+one no-op method call.
+"""
+import bisect
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=()):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket counts (the last is +Inf), then sum and count
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, *labels):
+        return Span(self, labels)
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = self._header()
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(state[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {state[-1]}")
+        return lines
+
+
+class Span:
+    """Times a block into ``histogram``, counting it in ``errors`` too if it raises."""
+    __slots__ = ('histogram', 'labels', 'errors', 'start')
+
+    def __init__(self, histogram, labels, errors=None):
+        self.histogram = histogram
+        self.labels = labels
+        self.errors = errors
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        if exc_type is not None and self.errors is not None:
+            self.errors.inc(*self.labels)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _NullMetric:
+    """Stands in for every metric when metrics are disabled."""
+
+    def inc(self, *labels, amount=1):
+        pass
+
+    def dec(self, *labels, amount=1):
+        pass
+
+    def set(self, value, *labels):
+        pass
+
+    def observe(self, value, *labels):
+        pass
+
+    def time(self, *labels):
+        return NULL_SPAN
+
+
+NULL_SPAN = _NullSpan()
+NULL_METRIC = _NullMetric()
+
+
+class Registry:
+    """The metrics of one service, named ``<namespace>_<name>``."""
+
+    def __init__(self, namespace, enabled=True, buckets=(), on_error=print):
+        self.namespace = namespace
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.on_error = on_error
+        self._metrics = []
+        self._stats_sources = []
+
+    def _register(self, metric):
+        if not self.enabled:
+            return NULL_METRIC
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(f"{self.namespace}_{name}", help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge(f"{self.namespace}_{name}", help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=None):
+        return self._register(Histogram(f"{self.namespace}_{name}", help, labelnames,
+                                        self.buckets if buckets is None else buckets))
+
+    def register_stats(self, prefix, source):
+        """Expose the numeric values of ``source()`` (a ``stats()`` dict, or ``None``) at scrape time."""
+        if self.enabled:
+            self._stats_sources.append((prefix, source))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, source in self._stats_sources:
+            try:
+                stats = source() or {}
+            except Exception as e:
+                self.on_error(f"Metrics source {prefix} failed: {e}")
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{self.namespace}_{prefix}_{key}"
+                lines += [f"# TYPE {name} untyped", f"{name} {_number(value)}"]
+        return '\n'.join(lines) + '\n'